@@ -0,0 +1,110 @@
+""" ocelog.admission - shed low priority messages when the server is overloaded """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import math
+import threading
+
+import ocelog.message
+import ocelog.metrics
+import ocelog.pipeline
+import ocelog.queued
+
+
+# message priorities from most (emerg, 0) to least (debug, 7) severe
+_severity = dict((priority, code) for code, priority in
+        enumerate(ocelog.message.Message.valid_priorities))
+_least_severe = len(ocelog.message.Message.valid_priorities) - 1
+
+
+class AdmissionController(object):
+    """ Track the server's load and decide which messages to turn away
+
+    The load is the larger of the in-flight requests as a fraction of
+    admission.max_in_flight and the fill of the fullest write queue (the
+    async queue and the writer pipeline lanes).  Below admission.shed_start
+    everything is admitted.  From there to full load, priorities are shed
+    one at a time starting with debug: the higher the load, the more of the
+    sheddable priorities are refused.  Priorities at least as severe as
+    admission.protected_priority are never shed.
+
+    Every decision is counted in ocelog_admission_total by priority.
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwds):
+        """ Enforce singleton behavior """
+        if cls._instance is None:
+            cls._instance = object.__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """ Start with no requests in flight """
+        if self._initialized is False:
+            self._lock = threading.Lock()
+            self.in_flight = 0
+            self._initialized = True
+
+    def enter(self):
+        """ Count a request as in flight """
+        self._lock.acquire()
+        self.in_flight += 1
+        self._lock.release()
+
+    def leave(self):
+        """ Count a request as finished """
+        self._lock.acquire()
+        self.in_flight -= 1
+        self._lock.release()
+
+    def load(self, config):
+        """ Return the current load, where 1 is full capacity """
+        return max(float(self.in_flight) / config.admission.max_in_flight,
+                ocelog.queued.default_load(), ocelog.pipeline.default_load())
+
+    def shed_below(self, config, load=None):
+        """ Return the severity code above which messages are being shed
+
+        A result of _least_severe (debug) means nothing is shed.
+        """
+        if load is None:
+            load = self.load(config)
+        settings = config.admission
+        if load < settings.shed_start:
+            return _least_severe
+        sheddable = _least_severe - _severity[settings.protected_priority]
+        shed = int(math.ceil((load - settings.shed_start) /
+                (1 - settings.shed_start) * sheddable))
+        return _least_severe - min(max(shed, 1), sheddable)
+
+    def admit(self, priority, config, cutoff=None):
+        """ Return True if a message of priority should be accepted
+
+        An unknown priority is treated as debug.  cutoff is a shed_below()
+        result to reuse, so a batch is judged against a single load reading.
+        """
+        if cutoff is None:
+            cutoff = self.shed_below(config)
+        admitted = _severity.get(priority, _least_severe) <= cutoff
+        if priority not in _severity:
+            priority = "unknown"
+        ocelog.metrics.count("ocelog_admission_total", (("priority", priority),
+                ("decision", admitted and "admitted" or "shed")))
+        return admitted
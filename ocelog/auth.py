@@ -18,10 +18,19 @@ limitations under the License.
 
 
 import hashlib
+import hmac
+import time
 
 import ocelog.config
 
 
+# secret: keyed hmac - keying happens once per secret, not once per request
+_hmac_states = {}
+# forget every keyed state if this many secrets have been seen (reloads can
+# retire keys, so the states of secrets no longer configured are dropped)
+_MAX_HMAC_STATES = 256
+
+
 def generate_mac_token(msg, secret):
     """ Generate a mac token given a msg string and shared secret """
     h = hashlib.md5()
@@ -30,18 +39,157 @@ def generate_mac_token(msg, secret):
     generated_token = h.hexdigest()
     return generated_token
 
-def authorize_request(request):
-    """ Accept a Bottle.request and check the MAC token """
+def generate_hmac_token(data, secret):
+    """ Generate an HMAC-SHA256 token given a data string and shared secret
+
+    The HMAC is keyed once per secret and the keyed state is copied for each
+    token, so the cost of a token does not include the key setup however
+    many secrets are in use.
+    """
+    keyed = _hmac_states.get(secret)
+    if keyed is None:
+        if len(_hmac_states) >= _MAX_HMAC_STATES:
+            _hmac_states.clear()
+        keyed = hmac.new(secret, digestmod=hashlib.sha256)
+        _hmac_states[secret] = keyed
+    h = keyed.copy()
+    h.update(data)
+    return h.hexdigest()
+
+def tokens_match(given, expected):
+    """ Compare two tokens in time independent of where they differ """
+    if isinstance(given, unicode):
+        given = given.encode("utf-8")
+    if hasattr(hmac, "compare_digest"):
+        return hmac.compare_digest(given, expected)
+    if len(given) != len(expected):
+        return False
+    result = 0
+    for x, y in zip(given, expected):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+def generate_token(data, security, secret=None):
+    """ Generate the token for data using the configured token_type
+
+    The token is generated with secret, or security.shared_secret if no
+    secret is given.
+    """
+    if secret is None:
+        secret = security.shared_secret
+    if security.token_type == "hmac-sha256":
+        return generate_hmac_token(data, secret)
+    return generate_mac_token(data, secret)
+
+def key_allowed(key_id, appname, security, now=None):
+    """ Return True if the key named key_id may be used to log for appname
+
+    A key may be used until its time in security.key_expiry, and only for
+    the appnames it is bound to if appname is bound in security.appname_keys.
+    """
+    if key_id not in security.keys:
+        return False
+    expiry = security.key_expiry.get(key_id)
+    if expiry is not None and (now or time.time()) >= expiry:
+        return False
+    bound = security.appname_keys.get(appname)
+    return bound is None or key_id in bound
+
+def find_secrets(key_id, appname, security):
+    """ Return the secrets a request's token may have been generated with
+
+    A request naming a key with the x-key-id header may only use that key.
+    Otherwise a bound appname may use any of its keys that hasn't expired,
+    which lets clients without a key id move between keys, and anything
+    else uses security.shared_secret.  A key id lookup is a dict lookup, so
+    the cost doesn't grow with the number of keys.
+    """
+    if key_id is not None:
+        if key_allowed(key_id, appname, security):
+            return (security.keys[key_id],)
+        return ()
+    bound = security.appname_keys.get(appname)
+    if bound is not None:
+        now = time.time()
+        return tuple(security.keys[key] for key in bound 
+                if key_allowed(key, appname, security, now))
+    if security.shared_secret is None:
+        return ()
+    return (security.shared_secret,)
+
+def token_verifies(token, data, secrets, security):
+    """ Return True if token was generated from data with one of secrets """
+    verified = False
+    for secret in secrets:
+        # check every secret so the time taken doesn't reveal which matched
+        if tokens_match(token, generate_token(data, security, secret)):
+            verified = True
+    return verified
+
+def authorize_request(request, config=None):
+    """ Accept a Bottle.request and check the MAC token 
+
+    The token covers the msg field, or the entire raw body if 
+    security.sign_body is set (this requires a request with a body 
+    attribute, such as ocelog.form.LogRequest).  The optional config is a 
+    Config or ConfigSnapshot; Config() is used if none is given.
+    """
     # short circuit with true if auth is not required
-    oconfig = ocelog.config.Config()
+    oconfig = config
+    if oconfig is None:
+        oconfig = ocelog.config.Config()
     if not oconfig.security.require_token:
         return True
     # compare the mac token given against a generated mac token 
     token = request.environ.get("HTTP_X_TOKEN")
-    msg = request.POST.get("msg")
-    shared_secret = oconfig.security.shared_secret
-    if (token is None) or (msg is None):
+    if oconfig.security.sign_body:
+        data = getattr(request, "body", None)
+    else:
+        data = request.POST.get("msg")
+    if (token is None) or (data is None):
+        return False
+    else:
+        secrets = find_secrets(request.environ.get("HTTP_X_KEY_ID"),
+                request.POST.get("appname"), oconfig.security)
+        return token_verifies(token, data, secrets, oconfig.security)
+
+def authorize_batch_request(request, body, config=None):
+    """ Accept a Bottle.request for a batch and check the MAC token
+
+    For a batch, the token is generated from the entire raw body rather than 
+    a single msg field.  The key is the one named by the x-key-id header, or 
+    security.shared_secret; whether the key may be used for each record's
+    appname is checked by authorize_batch_record().
+    """
+    oconfig = config
+    if oconfig is None:
+        oconfig = ocelog.config.Config()
+    if not oconfig.security.require_token:
+        return True
+    token = request.environ.get("HTTP_X_TOKEN")
+    if token is None:
         return False
+    key_id = request.environ.get("HTTP_X_KEY_ID")
+    if key_id is None:
+        secrets = find_secrets(None, None, oconfig.security)
+    elif key_allowed(key_id, None, oconfig.security):
+        secrets = (oconfig.security.keys[key_id],)
     else:
-        expected_token = generate_mac_token(msg, shared_secret)
-        return token == expected_token
+        secrets = ()
+    return token_verifies(token, body, secrets, oconfig.security)
+
+def authorize_batch_record(request, message, config=None):
+    """ Check a record of an authorized batch may be logged for its appname
+
+    A record for an appname bound in security.appname_keys must come in a
+    batch signed with one of its keys.
+    """
+    oconfig = config
+    if oconfig is None:
+        oconfig = ocelog.config.Config()
+    if not oconfig.security.require_token:
+        return True
+    bound = oconfig.security.appname_keys.get(message.appname)
+    if bound is None:
+        return True
+    return request.environ.get("HTTP_X_KEY_ID") in bound
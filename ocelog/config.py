@@ -17,9 +17,15 @@ limitations under the License.
 """
 
 
+import calendar
 import ConfigParser
+import multiprocessing
 import os.path
+import signal
 import socket
+import sys
+import threading
+import time
 
 
 class ConfigException(Exception):
@@ -29,10 +35,19 @@ class ConfigException(Exception):
 class _ServerConfig(object):
     """ Data structure for the server related configurations """
 
+    valid_applications = ("bottle", "lean")
+
     def __init__(self):
         """ Initialize the object with the default configurations """
         self._port = 8888
         self._host = "localhost"
+        self._watch_interval = 0
+        self._workers = 0
+        self._reuse_port = True
+        self._threads = 8
+        self._max_connections = 10000
+        self._max_buffered = 268435456
+        self._application = "bottle"
 
     @property
     def port(self):
@@ -63,6 +78,125 @@ class _ServerConfig(object):
         except:
             raise ConfigException, "host must be a valid and resolvable hostname"
 
+    @property
+    def watch_interval(self):
+        """ Return the watch_interval attr (seconds, 0 disables watching) """
+        return self._watch_interval
+
+    @watch_interval.setter
+    def watch_interval(self, new_value):
+        """ Validate and set an overriding watch_interval """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "watch_interval must be a number of seconds"
+        if new_value >= 0:
+            self._watch_interval = new_value
+        else:
+            raise ConfigException, "watch_interval must not be negative"
+
+    @property
+    def workers(self):
+        """ Return the workers attr (prefork processes, one per cpu if unset) """
+        if self._workers:
+            return self._workers
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+
+    @workers.setter
+    def workers(self, new_value):
+        """ Validate and set an overriding workers (0 is one per cpu) """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "workers must be an integer"
+        if new_value >= 0:
+            self._workers = new_value
+        else:
+            raise ConfigException, "workers must not be negative"
+
+    @property
+    def reuse_port(self):
+        """ Return the reuse_port attr """
+        return self._reuse_port
+
+    @reuse_port.setter
+    def reuse_port(self, new_value):
+        """ Validate and set an overriding reuse_port """
+        if new_value in ("True", "False"):
+            self._reuse_port = eval(new_value)
+        elif new_value in (True, False):
+            self._reuse_port = new_value
+        else:
+            raise ConfigException, "reuse_port must be set to true or false"
+
+    @property
+    def threads(self):
+        """ Return the threads attr (event server handler threads) """
+        return self._threads
+
+    @threads.setter
+    def threads(self, new_value):
+        """ Validate and set an overriding threads (0 runs handlers on the loop) """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "threads must be an integer"
+        if new_value >= 0:
+            self._threads = new_value
+        else:
+            raise ConfigException, "threads must not be negative"
+
+    @property
+    def max_connections(self):
+        """ Return the max_connections attr (event server open connections) """
+        return self._max_connections
+
+    @max_connections.setter
+    def max_connections(self, new_value):
+        """ Validate and set an overriding max_connections """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "max_connections must be an integer"
+        if new_value > 0:
+            self._max_connections = new_value
+        else:
+            raise ConfigException, "max_connections must be greater than 0"
+
+    @property
+    def max_buffered(self):
+        """ Return the max_buffered attr (event server request body bytes) """
+        return self._max_buffered
+
+    @max_buffered.setter
+    def max_buffered(self, new_value):
+        """ Validate and set an overriding max_buffered """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "max_buffered must be an integer"
+        if new_value > 0:
+            self._max_buffered = new_value
+        else:
+            raise ConfigException, "max_buffered must be greater than 0"
+
+    @property
+    def application(self):
+        """ Return the application attr (bottle, or lean without bottle) """
+        return self._application
+
+    @application.setter
+    def application(self, new_value):
+        """ Validate and set an overriding application """
+        if new_value in self.valid_applications:
+            self._application = new_value
+        else:
+            raise ConfigException, "application must be one of: %s" % \
+                    ", ".join(self.valid_applications)
+
 
 class _MessageConfig(object):
     """ Data structure for the Message configurations """
@@ -78,6 +212,8 @@ class _MessageConfig(object):
         """ Initialize the object with the default configurations """
         self._default_facility = "user"
         self._default_priority = "notice"
+        self._max_request_size = 65536
+        self._max_batch_size = 4194304
 
     @property
     def default_facility(self):
@@ -105,6 +241,40 @@ class _MessageConfig(object):
         else:
             raise ConfigException, "default_priority must be a valid syslog priority"
 
+    @property
+    def max_request_size(self):
+        """ Return the max_request_size attr (bytes) """
+        return self._max_request_size
+
+    @max_request_size.setter
+    def max_request_size(self, new_value):
+        """ Validate and set an overriding max_request_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "max_request_size must be an integer"
+        if new_value > 0:
+            self._max_request_size = new_value
+        else:
+            raise ConfigException, "max_request_size must be greater than 0"
+
+    @property
+    def max_batch_size(self):
+        """ Return the max_batch_size attr (bytes) """
+        return self._max_batch_size
+
+    @max_batch_size.setter
+    def max_batch_size(self, new_value):
+        """ Validate and set an overriding max_batch_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "max_batch_size must be an integer"
+        if new_value > 0:
+            self._max_batch_size = new_value
+        else:
+            raise ConfigException, "max_batch_size must be greater than 0"
+
 
 class _SyslogConfig(object):
     """ Data structure for the SyslogWriter configurations """
@@ -112,6 +282,7 @@ class _SyslogConfig(object):
     def __init__(self):
         """ Initialize the object with the default configurations """
         self._enabled = False
+        self._socket_path = "/dev/log"
 
     @property
     def enabled(self):
@@ -128,14 +299,60 @@ class _SyslogConfig(object):
         else:
             raise ConfigException, "syslog.enabled must be set to true or false"
 
+    @property
+    def socket_path(self):
+        """ Return the socket_path attr """
+        return self._socket_path
+
+    @socket_path.setter
+    def socket_path(self, new_value):
+        """ Validate and set an overriding socket_path """
+        if new_value and new_value.startswith("/"):
+            self._socket_path = new_value
+        else:
+            raise ConfigException, "syslog.socket_path must be an absolute path"
+
+
+def _parse_pairs(option, new_value):
+    """ Return a dict from a comma separated string of name=value pairs """
+    if isinstance(new_value, dict):
+        return dict(new_value)
+    pairs = {}
+    for pair in new_value.split(","):
+        if not pair.strip():
+            continue
+        name, sep, value = pair.partition("=")
+        if not sep or not name.strip() or not value.strip():
+            raise ConfigException, "%s must be a list of name=value" % option
+        pairs[name.strip()] = value.strip()
+    return pairs
+
+def _parse_utc_time(option, value):
+    """ Return the epoch time for a utc YYYY-mm-dd[THH:MM:SS] string """
+    if not isinstance(value, basestring):
+        return float(value)
+    for time_format in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            return float(calendar.timegm(time.strptime(value, time_format)))
+        except ValueError:
+            pass
+    raise ConfigException, "%s times must be given as YYYY-mm-ddTHH:MM:SS" % option
+
 
 class _SecurityConfig(object):
     """ Data structure for the security and authorization configs """
 
+    valid_token_types = ("md5", "hmac-sha256")
+
     def __init__(self):
         """ Initialize the object with the default configurations """
         self._require_token = False
         self._shared_secret = None
+        self._keys = {}
+        self._key_expiry = {}
+        self._appname_keys = {}
+        self._token_type = "md5"
+        self._sign_body = False
 
     @property
     def require_token(self):
@@ -149,8 +366,9 @@ class _SecurityConfig(object):
             self._require_token = eval(new_value)
         elif new_value in (True, False):
             self._require_token = new_value
-        if self._require_token == True and self._shared_secret == None:
-            raise ConfigException, "A shared secret must be set if require_token is true"
+        if self._require_token == True and self._shared_secret == None and \
+                not self._keys:
+            raise ConfigException, "A shared secret or keys must be set if require_token is true"
 
     @property
     def shared_secret(self):
@@ -165,6 +383,1059 @@ class _SecurityConfig(object):
         else:
             raise ConfigException, "shared_secret must be at least 8 characters in length"
 
+    @property
+    def keys(self):
+        """ Return the keys attr (a dict of key id: secret) """
+        return self._keys
+
+    @keys.setter
+    def keys(self, new_value):
+        """ Validate and set an overriding keys
+
+        Keys are given as a comma separated list of key_id=secret, and are
+        chosen by a request's x-key-id header.
+        """
+        keys = _parse_pairs("keys", new_value)
+        for secret in keys.values():
+            if len(secret) < 8:
+                raise ConfigException, "keys secrets must be at least 8 characters in length"
+        self._keys = keys
+
+    @property
+    def key_expiry(self):
+        """ Return the key_expiry attr (a dict of key id: epoch seconds) """
+        return self._key_expiry
+
+    @key_expiry.setter
+    def key_expiry(self, new_value):
+        """ Validate and set an overriding key_expiry
+
+        Expiry times are given as a comma separated list of
+        key_id=YYYY-mm-ddTHH:MM:SS (utc), after which the key stops
+        verifying.  Until then, a retiring key verifies alongside its
+        replacement.
+        """
+        expiry = {}
+        for key_id, value in _parse_pairs("key_expiry", new_value).items():
+            if key_id not in self._keys:
+                raise ConfigException, "key_expiry names an unknown key: %s" % key_id
+            expiry[key_id] = _parse_utc_time("key_expiry", value)
+        self._key_expiry = expiry
+
+    @property
+    def appname_keys(self):
+        """ Return the appname_keys attr (a dict of appname: tuple of key ids) """
+        return self._appname_keys
+
+    @appname_keys.setter
+    def appname_keys(self, new_value):
+        """ Validate and set an overriding appname_keys
+
+        Bindings are given as a comma separated list of appname=key_id, with
+        several key ids separated by spaces.  A bound appname may only be
+        logged with one of its keys.
+        """
+        bindings = {}
+        for appname, key_ids in _parse_pairs("appname_keys", new_value).items():
+            if isinstance(key_ids, basestring):
+                key_ids = key_ids.split()
+            for key_id in key_ids:
+                if key_id not in self._keys:
+                    raise ConfigException, "appname_keys names an unknown key: %s" % key_id
+            bindings[appname] = tuple(key_ids)
+        self._appname_keys = bindings
+
+    @property
+    def token_type(self):
+        """ Return the token_type attr """
+        return self._token_type
+
+    @token_type.setter
+    def token_type(self, new_value):
+        """ Validate and set an overriding token_type """
+        if new_value in self.valid_token_types:
+            self._token_type = new_value
+        else:
+            raise ConfigException, "token_type must be one of: %s" % \
+                    ", ".join(self.valid_token_types)
+
+    @property
+    def sign_body(self):
+        """ Return the sign_body attr """
+        return self._sign_body
+
+    @sign_body.setter
+    def sign_body(self, new_value):
+        """ Validate and set an overriding sign_body """
+        if new_value in ("True", "False"):
+            self._sign_body = eval(new_value)
+        elif new_value in (True, False):
+            self._sign_body = new_value
+        else:
+            raise ConfigException, "sign_body must be set to true or false"
+
+
+class _QueueConfig(object):
+    """ Data structure for the asynchronous write queue configurations """
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._enabled = False
+        self._max_depth = 10000
+        self._batch_size = 100
+        self._flush_interval = 0.05
+        self._workers = 1
+
+    @property
+    def enabled(self):
+        """ Return the enabled attr """
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, new_value):
+        """ Validate and set an overriding enabled """
+        if new_value in ("True", "False"):
+            self._enabled = eval(new_value)
+        elif new_value in (True, False):
+            self._enabled = new_value
+        else:
+            raise ConfigException, "queue.enabled must be set to true or false"
+
+    @property
+    def max_depth(self):
+        """ Return the max_depth attr """
+        return self._max_depth
+
+    @max_depth.setter
+    def max_depth(self, new_value):
+        """ Validate and set an overriding max_depth """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "queue.max_depth must be an integer"
+        if new_value > 0:
+            self._max_depth = new_value
+        else:
+            raise ConfigException, "queue.max_depth must be greater than 0"
+
+    @property
+    def batch_size(self):
+        """ Return the batch_size attr """
+        return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, new_value):
+        """ Validate and set an overriding batch_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "queue.batch_size must be an integer"
+        if new_value > 0:
+            self._batch_size = new_value
+        else:
+            raise ConfigException, "queue.batch_size must be greater than 0"
+
+    @property
+    def flush_interval(self):
+        """ Return the flush_interval attr (seconds) """
+        return self._flush_interval
+
+    @flush_interval.setter
+    def flush_interval(self, new_value):
+        """ Validate and set an overriding flush_interval """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "queue.flush_interval must be a number of seconds"
+        if new_value >= 0:
+            self._flush_interval = new_value
+        else:
+            raise ConfigException, "queue.flush_interval must not be negative"
+
+    @property
+    def workers(self):
+        """ Return the workers attr """
+        return self._workers
+
+    @workers.setter
+    def workers(self, new_value):
+        """ Validate and set an overriding workers """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "queue.workers must be an integer"
+        if new_value > 0:
+            self._workers = new_value
+        else:
+            raise ConfigException, "queue.workers must be greater than 0"
+
+
+class _SpoolConfig(object):
+    """ Data structure for the disk-backed write-ahead spool configurations """
+
+    valid_fsync_policies = ("always", "interval", "never")
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._enabled = False
+        self._directory = "/var/spool/ocelog"
+        self._segment_size = 4194304
+        self._max_segments = 16
+        self._fsync = "interval"
+        self._fsync_interval = 1.0
+        self._retry_interval = 1.0
+
+    @property
+    def enabled(self):
+        """ Return the enabled attr """
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, new_value):
+        """ Validate and set an overriding enabled """
+        if new_value in ("True", "False"):
+            self._enabled = eval(new_value)
+        elif new_value in (True, False):
+            self._enabled = new_value
+        else:
+            raise ConfigException, "spool.enabled must be set to true or false"
+
+    @property
+    def directory(self):
+        """ Return the directory attr """
+        return self._directory
+
+    @directory.setter
+    def directory(self, new_value):
+        """ Validate and set an overriding directory """
+        if new_value and new_value.startswith("/"):
+            self._directory = new_value
+        else:
+            raise ConfigException, "spool.directory must be an absolute path"
+
+    @property
+    def segment_size(self):
+        """ Return the segment_size attr (bytes) """
+        return self._segment_size
+
+    @segment_size.setter
+    def segment_size(self, new_value):
+        """ Validate and set an overriding segment_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "spool.segment_size must be an integer"
+        if new_value >= 65536:
+            self._segment_size = new_value
+        else:
+            raise ConfigException, "spool.segment_size must be at least 65536"
+
+    @property
+    def max_segments(self):
+        """ Return the max_segments attr """
+        return self._max_segments
+
+    @max_segments.setter
+    def max_segments(self, new_value):
+        """ Validate and set an overriding max_segments """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "spool.max_segments must be an integer"
+        if new_value > 0:
+            self._max_segments = new_value
+        else:
+            raise ConfigException, "spool.max_segments must be greater than 0"
+
+    @property
+    def fsync(self):
+        """ Return the fsync attr """
+        return self._fsync
+
+    @fsync.setter
+    def fsync(self, new_value):
+        """ Validate and set an overriding fsync """
+        if new_value in self.valid_fsync_policies:
+            self._fsync = new_value
+        else:
+            raise ConfigException, "spool.fsync must be one of: %s" % \
+                    ", ".join(self.valid_fsync_policies)
+
+    @property
+    def fsync_interval(self):
+        """ Return the fsync_interval attr (seconds) """
+        return self._fsync_interval
+
+    @fsync_interval.setter
+    def fsync_interval(self, new_value):
+        """ Validate and set an overriding fsync_interval """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "spool.fsync_interval must be a number of seconds"
+        if new_value > 0:
+            self._fsync_interval = new_value
+        else:
+            raise ConfigException, "spool.fsync_interval must be greater than 0"
+
+    @property
+    def retry_interval(self):
+        """ Return the retry_interval attr (seconds) """
+        return self._retry_interval
+
+    @retry_interval.setter
+    def retry_interval(self, new_value):
+        """ Validate and set an overriding retry_interval """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "spool.retry_interval must be a number of seconds"
+        if new_value > 0:
+            self._retry_interval = new_value
+        else:
+            raise ConfigException, "spool.retry_interval must be greater than 0"
+
+
+class _RemoteConfig(object):
+    """ Data structure for the remote syslog (network) writer configurations """
+
+    valid_protocols = ("udp", "tcp")
+    valid_formats = ("rfc5424", "rfc3164")
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._relays = ()
+        self._protocol = "udp"
+        self._format = "rfc5424"
+        self._pool_size = 2
+        self._timeout = 5.0
+        self._retry_interval = 30.0
+
+    @property
+    def relays(self):
+        """ Return the relays attr (a tuple of (host, port) tuples) """
+        return self._relays
+
+    @relays.setter
+    def relays(self, new_value):
+        """ Validate and set an overriding relays
+
+        Relays are given as a comma separated list of host:port, in the
+        order they should be tried.
+        """
+        if isinstance(new_value, basestring):
+            new_value = [relay.strip() for relay in new_value.split(",")]
+        relays = []
+        for relay in new_value:
+            if not relay:
+                continue
+            if isinstance(relay, basestring):
+                relay = tuple(relay.rsplit(":", 1))
+            try:
+                host, port = relay
+                port = int(port)
+            except ValueError:
+                raise ConfigException, "remote.relays must be a list of host:port"
+            if not host or not 0 < port < 65536:
+                raise ConfigException, "remote.relays must be a list of host:port"
+            relays.append((host, port))
+        self._relays = tuple(relays)
+
+    @property
+    def protocol(self):
+        """ Return the protocol attr """
+        return self._protocol
+
+    @protocol.setter
+    def protocol(self, new_value):
+        """ Validate and set an overriding protocol """
+        if new_value in self.valid_protocols:
+            self._protocol = new_value
+        else:
+            raise ConfigException, "remote.protocol must be one of: %s" % \
+                    ", ".join(self.valid_protocols)
+
+    @property
+    def format(self):
+        """ Return the format attr """
+        return self._format
+
+    @format.setter
+    def format(self, new_value):
+        """ Validate and set an overriding format """
+        if new_value in self.valid_formats:
+            self._format = new_value
+        else:
+            raise ConfigException, "remote.format must be one of: %s" % \
+                    ", ".join(self.valid_formats)
+
+    @property
+    def pool_size(self):
+        """ Return the pool_size attr """
+        return self._pool_size
+
+    @pool_size.setter
+    def pool_size(self, new_value):
+        """ Validate and set an overriding pool_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "remote.pool_size must be an integer"
+        if new_value > 0:
+            self._pool_size = new_value
+        else:
+            raise ConfigException, "remote.pool_size must be greater than 0"
+
+    @property
+    def timeout(self):
+        """ Return the timeout attr (seconds) """
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, new_value):
+        """ Validate and set an overriding timeout """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "remote.timeout must be a number of seconds"
+        if new_value > 0:
+            self._timeout = new_value
+        else:
+            raise ConfigException, "remote.timeout must be greater than 0"
+
+    @property
+    def retry_interval(self):
+        """ Return the retry_interval attr (seconds) """
+        return self._retry_interval
+
+    @retry_interval.setter
+    def retry_interval(self, new_value):
+        """ Validate and set an overriding retry_interval """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "remote.retry_interval must be a number of seconds"
+        if new_value >= 0:
+            self._retry_interval = new_value
+        else:
+            raise ConfigException, "remote.retry_interval must not be negative"
+
+
+class _JournaldConfig(object):
+    """ Data structure for the native journald writer configurations """
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._socket_path = "/run/systemd/journal/socket"
+
+    @property
+    def socket_path(self):
+        """ Return the socket_path attr """
+        return self._socket_path
+
+    @socket_path.setter
+    def socket_path(self, new_value):
+        """ Validate and set an overriding socket_path """
+        if new_value and new_value.startswith("/"):
+            self._socket_path = new_value
+        else:
+            raise ConfigException, "journald.socket_path must be an absolute path"
+
+
+class _FileConfig(object):
+    """ Data structure for the local file writer configurations """
+
+    valid_fsync_policies = ("records", "interval", "shutdown")
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._path = "/var/log/ocelog/ocelog.log"
+        self._buffer_size = 1048576
+        self._rotate_size = 104857600
+        self._rotate_interval = 0
+        self._fsync = "interval"
+        self._fsync_records = 1000
+        self._fsync_interval = 1.0
+
+    @property
+    def path(self):
+        """ Return the path attr """
+        return self._path
+
+    @path.setter
+    def path(self, new_value):
+        """ Validate and set an overriding path """
+        if new_value and new_value.startswith("/") and not new_value.endswith("/"):
+            self._path = new_value
+        else:
+            raise ConfigException, "file.path must be an absolute file path"
+
+    @property
+    def buffer_size(self):
+        """ Return the buffer_size attr (bytes) """
+        return self._buffer_size
+
+    @buffer_size.setter
+    def buffer_size(self, new_value):
+        """ Validate and set an overriding buffer_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "file.buffer_size must be an integer"
+        if new_value >= 4096:
+            self._buffer_size = new_value
+        else:
+            raise ConfigException, "file.buffer_size must be at least 4096"
+
+    @property
+    def rotate_size(self):
+        """ Return the rotate_size attr (bytes, 0 to never rotate by size) """
+        return self._rotate_size
+
+    @rotate_size.setter
+    def rotate_size(self, new_value):
+        """ Validate and set an overriding rotate_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "file.rotate_size must be an integer"
+        if new_value >= 0:
+            self._rotate_size = new_value
+        else:
+            raise ConfigException, "file.rotate_size must not be negative"
+
+    @property
+    def rotate_interval(self):
+        """ Return the rotate_interval attr (seconds, 0 to never rotate by time) """
+        return self._rotate_interval
+
+    @rotate_interval.setter
+    def rotate_interval(self, new_value):
+        """ Validate and set an overriding rotate_interval """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "file.rotate_interval must be a number of seconds"
+        if new_value >= 0:
+            self._rotate_interval = new_value
+        else:
+            raise ConfigException, "file.rotate_interval must not be negative"
+
+    @property
+    def fsync(self):
+        """ Return the fsync attr """
+        return self._fsync
+
+    @fsync.setter
+    def fsync(self, new_value):
+        """ Validate and set an overriding fsync """
+        if new_value in self.valid_fsync_policies:
+            self._fsync = new_value
+        else:
+            raise ConfigException, "file.fsync must be one of: %s" % \
+                    ", ".join(self.valid_fsync_policies)
+
+    @property
+    def fsync_records(self):
+        """ Return the fsync_records attr """
+        return self._fsync_records
+
+    @fsync_records.setter
+    def fsync_records(self, new_value):
+        """ Validate and set an overriding fsync_records """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "file.fsync_records must be an integer"
+        if new_value > 0:
+            self._fsync_records = new_value
+        else:
+            raise ConfigException, "file.fsync_records must be greater than 0"
+
+    @property
+    def fsync_interval(self):
+        """ Return the fsync_interval attr (seconds) """
+        return self._fsync_interval
+
+    @fsync_interval.setter
+    def fsync_interval(self, new_value):
+        """ Validate and set an overriding fsync_interval """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "file.fsync_interval must be a number of seconds"
+        if new_value > 0:
+            self._fsync_interval = new_value
+        else:
+            raise ConfigException, "file.fsync_interval must be greater than 0"
+
+
+def register_writer(name):
+    """ Accept name in writers.enabled and writers.required
+
+    ocelog.pipeline.register() calls this for each writer it makes
+    available, so register writers before the config file is read.
+    """
+    if name not in _WritersConfig.valid_writers:
+        _WritersConfig.valid_writers += (name,)
+
+def _parse_writer_names(option, new_value):
+    """ Return a tuple of writer names from a comma separated string or a list """
+    if isinstance(new_value, basestring):
+        new_value = new_value.split(",")
+    names = tuple(name.strip() for name in new_value if name.strip())
+    for name in names:
+        if name not in _WritersConfig.valid_writers:
+            raise ConfigException, "writers.%s must only name: %s" % (option,
+                    ", ".join(_WritersConfig.valid_writers))
+    return names
+
+
+class _WritersConfig(object):
+    """ Data structure for the writer pipeline configurations """
+
+    # the writers ocelog.pipeline can build; see register_writer()
+    valid_writers = ("syslog", "remote", "journald", "file")
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._enabled = ("syslog",)
+        self._required = ("syslog",)
+        self._timeout = 5.0
+        self._max_depth = 10000
+        self._batch_size = 100
+
+    @property
+    def enabled(self):
+        """ Return the enabled attr (a tuple of writer names) """
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, new_value):
+        """ Validate and set an overriding enabled """
+        names = _parse_writer_names("enabled", new_value)
+        if names:
+            self._enabled = names
+        else:
+            raise ConfigException, "writers.enabled must name at least one writer"
+
+    @property
+    def required(self):
+        """ Return the required attr (a tuple of writer names) """
+        return self._required
+
+    @required.setter
+    def required(self, new_value):
+        """ Validate and set an overriding required """
+        self._required = _parse_writer_names("required", new_value)
+
+    @property
+    def timeout(self):
+        """ Return the timeout attr (seconds) """
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, new_value):
+        """ Validate and set an overriding timeout """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "writers.timeout must be a number of seconds"
+        if new_value > 0:
+            self._timeout = new_value
+        else:
+            raise ConfigException, "writers.timeout must be greater than 0"
+
+    @property
+    def max_depth(self):
+        """ Return the max_depth attr """
+        return self._max_depth
+
+    @max_depth.setter
+    def max_depth(self, new_value):
+        """ Validate and set an overriding max_depth """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "writers.max_depth must be an integer"
+        if new_value > 0:
+            self._max_depth = new_value
+        else:
+            raise ConfigException, "writers.max_depth must be greater than 0"
+
+    @property
+    def batch_size(self):
+        """ Return the batch_size attr """
+        return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, new_value):
+        """ Validate and set an overriding batch_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "writers.batch_size must be an integer"
+        if new_value > 0:
+            self._batch_size = new_value
+        else:
+            raise ConfigException, "writers.batch_size must be greater than 0"
+
+
+class _AdmissionConfig(object):
+    """ Data structure for the overload admission control configurations """
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._enabled = False
+        self._max_in_flight = 256
+        self._shed_start = 0.5
+        self._protected_priority = "crit"
+        self._retry_after = 1
+
+    @property
+    def enabled(self):
+        """ Return the enabled attr """
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, new_value):
+        """ Validate and set an overriding enabled """
+        if new_value in ("True", "False"):
+            self._enabled = eval(new_value)
+        elif new_value in (True, False):
+            self._enabled = new_value
+        else:
+            raise ConfigException, "admission.enabled must be set to true or false"
+
+    @property
+    def max_in_flight(self):
+        """ Return the max_in_flight attr """
+        return self._max_in_flight
+
+    @max_in_flight.setter
+    def max_in_flight(self, new_value):
+        """ Validate and set an overriding max_in_flight """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "admission.max_in_flight must be an integer"
+        if new_value > 0:
+            self._max_in_flight = new_value
+        else:
+            raise ConfigException, "admission.max_in_flight must be greater than 0"
+
+    @property
+    def shed_start(self):
+        """ Return the shed_start attr (a fraction of capacity) """
+        return self._shed_start
+
+    @shed_start.setter
+    def shed_start(self, new_value):
+        """ Validate and set an overriding shed_start """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "admission.shed_start must be a number"
+        if 0 <= new_value < 1:
+            self._shed_start = new_value
+        else:
+            raise ConfigException, "admission.shed_start must be at least 0 and less than 1"
+
+    @property
+    def protected_priority(self):
+        """ Return the protected_priority attr """
+        return self._protected_priority
+
+    @protected_priority.setter
+    def protected_priority(self, new_value):
+        """ Validate and set an overriding protected_priority """
+        if new_value in _MessageConfig.valid_priorities:
+            self._protected_priority = new_value
+        else:
+            raise ConfigException, "admission.protected_priority must be a valid syslog priority"
+
+    @property
+    def retry_after(self):
+        """ Return the retry_after attr (seconds) """
+        return self._retry_after
+
+    @retry_after.setter
+    def retry_after(self, new_value):
+        """ Validate and set an overriding retry_after """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "admission.retry_after must be a whole number of seconds"
+        if new_value > 0:
+            self._retry_after = new_value
+        else:
+            raise ConfigException, "admission.retry_after must be greater than 0"
+
+
+def _parse_limits(option, new_value):
+    """ Return a dict of key: (rate, burst) from a comma separated string
+
+    Each limit is given as key=rate/burst, or key=rate for a burst of one
+    second's worth of messages.
+    """
+    if isinstance(new_value, dict):
+        new_value = ["%s=%s/%s" % (key, rate, burst)
+                for key, (rate, burst) in new_value.items()]
+    elif isinstance(new_value, basestring):
+        new_value = new_value.split(",")
+    limits = {}
+    for limit in new_value:
+        limit = limit.strip()
+        if not limit:
+            continue
+        try:
+            key, rate = limit.rsplit("=", 1)
+            if "/" in rate:
+                rate, burst = rate.split("/", 1)
+            else:
+                burst = rate
+            rate, burst = float(rate), float(burst)
+        except ValueError:
+            raise ConfigException, "ratelimit.%s must be a list of key=rate/burst" % option
+        if not key.strip() or rate <= 0 or burst < 1:
+            raise ConfigException, "ratelimit.%s must be a list of key=rate/burst" % option
+        limits[key.strip()] = (rate, burst)
+    return limits
+
+
+class _RateLimitConfig(object):
+    """ Data structure for the per-appname and per-client rate limit configurations """
+
+    valid_keys = ("appname", "client", "both")
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._enabled = False
+        self._key = "appname"
+        self._rate = 100.0
+        self._burst = 200.0
+        self._appname_limits = {}
+        self._client_limits = {}
+        self._table_size = 65536
+
+    @property
+    def enabled(self):
+        """ Return the enabled attr """
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, new_value):
+        """ Validate and set an overriding enabled """
+        if new_value in ("True", "False"):
+            self._enabled = eval(new_value)
+        elif new_value in (True, False):
+            self._enabled = new_value
+        else:
+            raise ConfigException, "ratelimit.enabled must be set to true or false"
+
+    @property
+    def key(self):
+        """ Return the key attr (what the limits are kept per) """
+        return self._key
+
+    @key.setter
+    def key(self, new_value):
+        """ Validate and set an overriding key """
+        if new_value in self.valid_keys:
+            self._key = new_value
+        else:
+            raise ConfigException, "ratelimit.key must be one of: %s" % \
+                    ", ".join(self.valid_keys)
+
+    @property
+    def rate(self):
+        """ Return the rate attr (messages per second) """
+        return self._rate
+
+    @rate.setter
+    def rate(self, new_value):
+        """ Validate and set an overriding rate """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "ratelimit.rate must be a number"
+        if new_value > 0:
+            self._rate = new_value
+        else:
+            raise ConfigException, "ratelimit.rate must be greater than 0"
+
+    @property
+    def burst(self):
+        """ Return the burst attr (messages) """
+        return self._burst
+
+    @burst.setter
+    def burst(self, new_value):
+        """ Validate and set an overriding burst """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "ratelimit.burst must be a number"
+        if new_value >= 1:
+            self._burst = new_value
+        else:
+            raise ConfigException, "ratelimit.burst must be at least 1"
+
+    @property
+    def appname_limits(self):
+        """ Return the appname_limits attr (a dict of appname: (rate, burst)) """
+        return self._appname_limits
+
+    @appname_limits.setter
+    def appname_limits(self, new_value):
+        """ Validate and set an overriding appname_limits """
+        self._appname_limits = _parse_limits("appname_limits", new_value)
+
+    @property
+    def client_limits(self):
+        """ Return the client_limits attr (a dict of address: (rate, burst)) """
+        return self._client_limits
+
+    @client_limits.setter
+    def client_limits(self, new_value):
+        """ Validate and set an overriding client_limits """
+        self._client_limits = _parse_limits("client_limits", new_value)
+
+    @property
+    def table_size(self):
+        """ Return the table_size attr (keys tracked) """
+        return self._table_size
+
+    @table_size.setter
+    def table_size(self, new_value):
+        """ Validate and set an overriding table_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "ratelimit.table_size must be an integer"
+        if new_value >= 16:
+            self._table_size = new_value
+        else:
+            raise ConfigException, "ratelimit.table_size must be at least 16"
+
+
+class _DedupConfig(object):
+    """ Data structure for the duplicate message suppression configurations """
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._enabled = False
+        self._window = 5.0
+        self._table_size = 4096
+
+    @property
+    def enabled(self):
+        """ Return the enabled attr """
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, new_value):
+        """ Validate and set an overriding enabled """
+        if new_value in ("True", "False"):
+            self._enabled = eval(new_value)
+        elif new_value in (True, False):
+            self._enabled = new_value
+        else:
+            raise ConfigException, "dedup.enabled must be set to true or false"
+
+    @property
+    def window(self):
+        """ Return the window attr (seconds) """
+        return self._window
+
+    @window.setter
+    def window(self, new_value):
+        """ Validate and set an overriding window """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "dedup.window must be a number of seconds"
+        if new_value > 0:
+            self._window = new_value
+        else:
+            raise ConfigException, "dedup.window must be greater than 0"
+
+    @property
+    def table_size(self):
+        """ Return the table_size attr (distinct messages tracked) """
+        return self._table_size
+
+    @table_size.setter
+    def table_size(self, new_value):
+        """ Validate and set an overriding table_size """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "dedup.table_size must be an integer"
+        if new_value > 0:
+            self._table_size = new_value
+        else:
+            raise ConfigException, "dedup.table_size must be greater than 0"
+
+
+class _IdempotencyConfig(object):
+    """ Data structure for the X-Idempotency-Key replay cache configurations """
+
+    def __init__(self):
+        """ Initialize the object with the default configurations """
+        self._enabled = False
+        self._ttl = 300.0
+        self._max_entries = 100000
+
+    @property
+    def enabled(self):
+        """ Return the enabled attr """
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, new_value):
+        """ Validate and set an overriding enabled """
+        if new_value in ("True", "False"):
+            self._enabled = eval(new_value)
+        elif new_value in (True, False):
+            self._enabled = new_value
+        else:
+            raise ConfigException, "idempotency.enabled must be set to true or false"
+
+    @property
+    def ttl(self):
+        """ Return the ttl attr (seconds) """
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, new_value):
+        """ Validate and set an overriding ttl """
+        try:
+            new_value = float(new_value)
+        except ValueError:
+            raise ConfigException, "idempotency.ttl must be a number of seconds"
+        if new_value > 0:
+            self._ttl = new_value
+        else:
+            raise ConfigException, "idempotency.ttl must be greater than 0"
+
+    @property
+    def max_entries(self):
+        """ Return the max_entries attr """
+        return self._max_entries
+
+    @max_entries.setter
+    def max_entries(self, new_value):
+        """ Validate and set an overriding max_entries """
+        try:
+            new_value = int(new_value)
+        except ValueError:
+            raise ConfigException, "idempotency.max_entries must be an integer"
+        if new_value > 0:
+            self._max_entries = new_value
+        else:
+            raise ConfigException, "idempotency.max_entries must be greater than 0"
+
 
 class Config(object):
     """ A data structure and manager for application configurations
@@ -174,10 +1445,42 @@ class Config(object):
     initialization, if there is no config file passed in, then the objects are 
     initialized and the defaults are used.  If a config file is passed in, then 
     it is read and any overriding user settings are applied.
+
+    The config file can be read again with reload(), which replaces the 
+    sections and publishes a new snapshot only if the whole file validates.
     """
 
     _instance = None
     _initialized = False
+    _config_file = None
+
+    # configuration sections and their options, in the order they are applied
+    sections = (
+        ("server", ("port", "host", "watch_interval", "workers", "reuse_port",
+                "threads", "max_connections", "max_buffered", "application")),
+        ("message", ("default_facility", "default_priority", 
+                "max_request_size", "max_batch_size")),
+        ("syslog", ("enabled", "socket_path")),
+        ("security", ("shared_secret", "keys", "key_expiry", "appname_keys",
+                "require_token", "token_type", "sign_body")),
+        ("queue", ("enabled", "max_depth", "batch_size", "flush_interval", 
+                "workers")),
+        ("spool", ("enabled", "directory", "segment_size", "max_segments",
+                "fsync", "fsync_interval", "retry_interval")),
+        ("remote", ("relays", "protocol", "format", "pool_size", "timeout",
+                "retry_interval")),
+        ("journald", ("socket_path",)),
+        ("file", ("path", "buffer_size", "rotate_size", "rotate_interval",
+                "fsync", "fsync_records", "fsync_interval")),
+        ("writers", ("enabled", "required", "timeout", "max_depth", 
+                "batch_size")),
+        ("admission", ("enabled", "max_in_flight", "shed_start", 
+                "protected_priority", "retry_after")),
+        ("ratelimit", ("enabled", "key", "rate", "burst", "appname_limits", 
+                "client_limits", "table_size")),
+        ("dedup", ("enabled", "window", "table_size")),
+        ("idempotency", ("enabled", "ttl", "max_entries")),
+        )
 
     def __new__(cls, *args, **kwds):
         """ Enforce a singleton patter """
@@ -190,16 +1493,60 @@ class Config(object):
 
         if self._initialized is False:
             # setup configs and defaults
-            self.server = _ServerConfig()
-            self.message = _MessageConfig()
-            self.syslog = _SyslogConfig()
-            self.security = _SecurityConfig()
+            self._setup_sections()
             # if a config file is provided, validate and apply overriding configs
+            self._config_file = config_file
             if config_file is not None:
                 self._apply_config_file(config_file)
             # we don't want to overwrite configs so set a flag
             self._initialized = True
 
+    def _setup_sections(self):
+        """ Create each configuration section with its defaults """
+        self.server = _ServerConfig()
+        self.message = _MessageConfig()
+        self.syslog = _SyslogConfig()
+        self.security = _SecurityConfig()
+        self.queue = _QueueConfig()
+        self.spool = _SpoolConfig()
+        self.remote = _RemoteConfig()
+        self.journald = _JournaldConfig()
+        self.file = _FileConfig()
+        self.writers = _WritersConfig()
+        self.admission = _AdmissionConfig()
+        self.ratelimit = _RateLimitConfig()
+        self.dedup = _DedupConfig()
+        self.idempotency = _IdempotencyConfig()
+
+    def reload(self, config_file=None):
+        """ Re-read the config file, then replace the sections and publish
+
+        The file is applied to a fresh set of sections (starting from the 
+        defaults) through the usual setters.  If any option fails validation,
+        a ConfigException is raised and the running configuration is left 
+        untouched.  Otherwise the sections are replaced and a new snapshot is
+        published; requests already holding the old snapshot finish with it.
+        Changes made to the sections at runtime are discarded.
+
+        Settings read once at startup (server host/port, the queue, the 
+        spool, the writers) still need a restart to take effect.
+        """
+        _reload_lock.acquire()
+        try:
+            if config_file is None:
+                config_file = self._config_file
+            if config_file is None:
+                raise ConfigException, "there is no configuration file to reload"
+            staged = object.__new__(Config)
+            staged._setup_sections()
+            staged._apply_config_file(config_file)
+            for section,options in self.sections:
+                setattr(self, section, getattr(staged, section))
+            self._config_file = config_file
+            return publish(self.snapshot())
+        finally:
+            _reload_lock.release()
+
     def _apply_config_file(self, config_file):
         """ Retrieve and set any overriding configurations from config file
        
@@ -215,20 +1562,164 @@ class Config(object):
         except:
             raise ConfigException, "unable to read configuration file"
 
-        # configuration sections and options
-        sections = {}
-        sections["server"] = ("port", "host")
-        sections["message"] = ("default_facility", "default_priority")
-        sections["syslog"] = ("enabled",)
-        sections["security"] = ("shared_secret", "require_token")
-
         # iterate through each section and each option, and if that option 
         #  is available in the config file, get it and override the attribute
-        for section,options in sections.items():
+        for section,options in self.sections:
             for option in options:
                 if config.has_option(section, option):
                     new_value = config.get(section, option)
                     section_config = self.__dict__[section]
                     setattr(section_config, option, new_value)
 
+    def snapshot(self):
+        """ Return a read-only ConfigSnapshot of the current configuration """
+        return ConfigSnapshot(self)
+
+
+class _FrozenSection(object):
+    """ Base class for the read-only copy of one configuration section """
+
+    __slots__ = ()
+
+    def __init__(self, section_config):
+        """ Copy each option value from the section_config object """
+        for option in self.__slots__:
+            object.__setattr__(self, option, getattr(section_config, option))
+
+    def __setattr__(self, name, value):
+        """ Refuse all changes """
+        raise ConfigException, "configuration snapshots are read-only"
+
+    def __delattr__(self, name):
+        """ Refuse all changes """
+        raise ConfigException, "configuration snapshots are read-only"
+
+
+def _frozen_section_class(section, options):
+    """ Return a _FrozenSection subclass with a slot for each option """
+    name = "_Frozen%sConfig" % section.title()
+    return type(name, (_FrozenSection,), {"__slots__": options})
+
+
+class ConfigSnapshot(object):
+    """ An immutable copy of every configuration section
+
+    A snapshot is built once (at startup, or whenever the configuration
+    changes) and handed to the request handlers, messages, and writers.  Its
+    sections have the same attribute names as the Config sections, so either 
+    can be passed wherever a config is accepted, but reading an option is a
+    plain slot lookup rather than a trip through the Config singleton and a
+    property getter.  Because snapshots never change, swapping in a new one
+    is a single reference assignment (see publish()).
+    """
+
+    __slots__ = tuple(section for section,options in Config.sections)
+
+    _section_classes = dict((section, _frozen_section_class(section, options))
+            for section,options in Config.sections)
+
+    def __init__(self, config):
+        """ Freeze a copy of each section of the given Config """
+        for section in self.__slots__:
+            frozen = self._section_classes[section](getattr(config, section))
+            object.__setattr__(self, section, frozen)
+
+    def __setattr__(self, name, value):
+        """ Refuse all changes """
+        raise ConfigException, "configuration snapshots are read-only"
+
+    def __delattr__(self, name):
+        """ Refuse all changes """
+        raise ConfigException, "configuration snapshots are read-only"
+
+
+# the snapshot in use by the request handlers; replaced, never modified
+_current = None
+
+def publish(snapshot):
+    """ Make snapshot the current configuration and return it
+
+    Requests that already hold the previous snapshot keep using it; only 
+    later calls to current() see the new one.
+    """
+    global _current
+    _current = snapshot
+    return snapshot
+
+def current():
+    """ Return the current snapshot, publishing one from Config() if needed """
+    snapshot = _current
+    if snapshot is None:
+        snapshot = publish(Config().snapshot())
+    return snapshot
+
+
+# serializes reloads from the SIGHUP handler and the watcher
+_reload_lock = threading.Lock()
+
+def _reload_in_background():
+    """ Reload the configuration in a new thread, reporting any failure
+
+    Reloading takes a lock, so it is never done inside a signal handler,
+    which may have interrupted the thread holding that lock.
+    """
+    def reload_config():
+        try:
+            Config().reload()
+        except ConfigException, e:
+            sys.stderr.write("ocelog: configuration reload failed: %s\n" % e)
+    thread = threading.Thread(target=reload_config, name="ocelog-reload")
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def install_reload_handler():
+    """ Reload the configuration file whenever the process receives SIGHUP """
+    signal.signal(signal.SIGHUP, lambda signum, frame: _reload_in_background())
+
+
+class ConfigWatcher(object):
+    """ Reload the configuration when the config file's mtime changes
+
+    The watcher polls the file every interval seconds from a daemon thread.
+    check() does a single poll and can also be called directly.
+    """
+
+    def __init__(self, config_file, interval):
+        """ Record the file's current mtime; start() begins polling """
+        self.config_file = config_file
+        self.interval = interval
+        self._mtime = self._get_mtime()
+        self._thread = None
+
+    def _get_mtime(self):
+        """ Return the file's mtime, or None if it can't be read """
+        try:
+            return os.stat(self.config_file).st_mtime
+        except OSError:
+            return None
+
+    def check(self):
+        """ Reload if the mtime has changed, returning True if reloaded """
+        mtime = self._get_mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            Config().reload(self.config_file)
+        except ConfigException, e:
+            sys.stderr.write("ocelog: configuration reload failed: %s\n" % e)
+            return False
+        return True
+
+    def start(self):
+        """ Start polling in a daemon thread """
+        def watch():
+            while True:
+                time.sleep(self.interval)
+                self.check()
+        self._thread = threading.Thread(target=watch, name="ocelog-watcher")
+        self._thread.daemon = True
+        self._thread.start()
+
 
@@ -0,0 +1,286 @@
+""" ocelog.dedup - collapse repeated messages into a "repeated N times" record """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import atexit
+import collections
+import threading
+import time
+
+import ocelog.config
+import ocelog.message
+import ocelog.metrics
+import ocelog.pipeline
+import ocelog.queued
+
+
+class _Window(object):
+    """ The first message of a run of duplicates and how many followed it """
+
+    __slots__ = ("message", "started", "repeats")
+
+    def __init__(self, message, started):
+        """ Start a window at the time its first message was written """
+        self.message = message
+        self.started = started
+        self.repeats = 0
+
+
+class DedupWriter(object):
+    """ Accept Message() objects and suppress duplicates within a window
+
+    DedupWriter wraps another writer.  The first message with a given
+    (hostname, appname, facility, priority, msg) is written through and
+    opens a window of window seconds; identical messages inside the window
+    are only counted.  When the window closes, a single
+
+        message repeated N times: [the message]
+
+    record with the same hostname, appname, facility and priority is written
+    in their place.  Windows are closed by the next identical message after
+    they expire, or by a background sweep so a count is never held for long.
+
+    The open windows live in a dict keyed by the message tuple (its hash is
+    the digest and the tuple comparison rules out collisions), in the order
+    they were opened.  At most table_size are kept: the oldest is closed
+    early to make room, and the sweep only has to look at the front.
+
+    A window is only opened once the wrapped writer has taken its first
+    message.  When that write fails no window is opened, so a retry is
+    written rather than counted, and duplicates of it in the same batch
+    get its failure.  Other suppressed messages are reported as written,
+    and counted in ocelog_dedup_suppressed_total.
+    """
+
+    def __init__(self, writer, window=5.0, table_size=4096, config=None):
+        """ Initialize an empty table; the sweep starts with the first write
+
+        The optional config is a Config or ConfigSnapshot used to build the
+        summary messages; Config() is used if none is given.
+        """
+        if config is None:
+            config = ocelog.config.Config()
+        self.config = config
+        self.writer = writer
+        self.window = window
+        self.table_size = table_size
+        self._windows = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._closed = False
+
+    #--------------------------------------------------------------------------
+    # window tracking
+    #--------------------------------------------------------------------------
+    def _summary(self, window):
+        """ Return the Message standing in for a window's suppressed repeats """
+        message = window.message
+        return ocelog.message.Message(message.hostname, message.appname,
+                "message repeated %d times: [%s]" % (window.repeats, message.msg),
+                message.facility, message.priority, self.config)
+
+    def _key(self, message):
+        """ Return the table key of a message """
+        return (message.hostname, message.appname, message.facility,
+                message.priority, message.msg)
+
+    def _admit(self, message, now, outgoing, pending):
+        """ Return (written, window) for a message (lock held)
+
+        written is True if the message should be written, with window the
+        one it would open; it is added to pending, and only to the table
+        once the write succeeds.  Otherwise the message was counted as a
+        duplicate in window.  Summaries for windows that have expired are
+        appended to outgoing, ahead of the message itself.
+        """
+        key = self._key(message)
+        window = self._windows.get(key)
+        if window is not None:
+            if now - window.started < self.window:
+                window.repeats += 1
+                return False, window
+            del self._windows[key]
+            if window.repeats:
+                outgoing.append(self._summary(window))
+        window = pending.get(key)
+        if window is not None:
+            window.repeats += 1
+            return False, window
+        window = _Window(message, now)
+        pending[key] = window
+        return True, window
+
+    def _open(self, windows):
+        """ Add windows whose first message was written to the table (lock held)
+
+        Returns the summaries of the windows closed to make room.
+        """
+        summaries = []
+        for window in windows:
+            key = self._key(window.message)
+            current = self._windows.get(key)
+            if current is not None:
+                # another write opened it in the meantime
+                if window.started - current.started < self.window:
+                    current.repeats += window.repeats
+                    continue
+                del self._windows[key]
+                if current.repeats:
+                    summaries.append(self._summary(current))
+            elif len(self._windows) >= self.table_size:
+                oldest = self._windows.popitem(last=False)[1]
+                if oldest.repeats:
+                    summaries.append(self._summary(oldest))
+            self._windows[key] = window
+        return summaries
+
+    def _expire(self, now, everything=False):
+        """ Close every expired window and return their summaries (lock held) """
+        summaries = []
+        while self._windows:
+            key, window = next(self._windows.iteritems())
+            if not everything and now - window.started < self.window:
+                break
+            del self._windows[key]
+            if window.repeats:
+                summaries.append(self._summary(window))
+        return summaries
+
+    def _sweep_periodically(self):
+        """ Background loop closing windows that saw no further messages """
+        while not self._closed:
+            time.sleep(self.window / 2)
+            self.flush()
+
+    #--------------------------------------------------------------------------
+    # writing
+    #--------------------------------------------------------------------------
+    def write(self, message):
+        """ Accept ocelog.message.Message and write it unless it's a duplicate """
+        return self.write_batch([message])[0]
+
+    def write_batch(self, messages):
+        """ Write the messages that aren't duplicates and return a list of results """
+        if self._sweeper is None:
+            self._start()
+        now = time.time()
+        results = []
+        outgoing = []
+        positions = []
+        duplicates = []
+        # the windows opened by this batch, and the outgoing index of each
+        # one's first message
+        pending = {}
+        opened = {}
+        self._lock.acquire()
+        try:
+            for message in messages:
+                written, window = self._admit(message, now, outgoing, pending)
+                if written:
+                    opened[window] = len(outgoing)
+                    positions.append((len(results), len(outgoing)))
+                    outgoing.append(message)
+                else:
+                    duplicates.append(len(results))
+                    if window in opened:
+                        positions.append((len(results), opened[window]))
+                results.append(True)
+        finally:
+            self._lock.release()
+        written = self._write(outgoing)
+        for result_index, outgoing_index in positions:
+            results[result_index] = written[outgoing_index]
+        kept = [window for window, index in
+                sorted(opened.items(), key=lambda item: item[1])
+                if written[index]]
+        if kept:
+            self._lock.acquire()
+            try:
+                summaries = self._open(kept)
+            finally:
+                self._lock.release()
+            self._write(summaries)
+        suppressed = len([i for i in duplicates if results[i]])
+        if suppressed:
+            ocelog.metrics.count("ocelog_dedup_suppressed_total", (), suppressed)
+        return results
+
+    def _write(self, messages):
+        """ Hand messages to the wrapped writer and return its results """
+        if not messages:
+            return []
+        writer_batch = getattr(self.writer, "write_batch", None)
+        if writer_batch is not None:
+            return writer_batch(messages)
+        return [self.writer.write(message) for message in messages]
+
+    def _start(self):
+        """ Start the background sweep """
+        self._lock.acquire()
+        try:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_periodically,
+                        name="ocelog-dedup-sweeper")
+                self._sweeper.daemon = True
+                self._sweeper.start()
+                atexit.register(self.close)
+        finally:
+            self._lock.release()
+
+    def flush(self, everything=False):
+        """ Write the summaries of expired windows, or every window """
+        self._lock.acquire()
+        try:
+            summaries = self._expire(time.time(), everything)
+        finally:
+            self._lock.release()
+        self._write(summaries)
+
+    def close(self):
+        """ Write the summaries of every open window and stop the sweep """
+        self._closed = True
+        self.flush(everything=True)
+
+
+_default_writer = None
+_default_lock = threading.Lock()
+
+def default_writer(config=None):
+    """ Return the shared DedupWriter used when dedup.enabled is set
+
+    It wraps the writer the /log handler would otherwise use: the shared
+    QueuedWriter if queue.enabled is set, or the writer pipeline.
+    """
+    global _default_writer
+    if _default_writer is None:
+        _default_lock.acquire()
+        try:
+            if _default_writer is None:
+                oconfig = config
+                if oconfig is None:
+                    oconfig = ocelog.config.Config()
+                if oconfig.queue.enabled:
+                    owriter = ocelog.queued.default_writer(oconfig)
+                else:
+                    owriter = ocelog.pipeline.default_writer(oconfig)
+                _default_writer = DedupWriter(owriter,
+                        window=oconfig.dedup.window,
+                        table_size=oconfig.dedup.table_size, config=oconfig)
+        finally:
+            _default_lock.release()
+    return _default_writer
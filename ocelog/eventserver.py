@@ -0,0 +1,927 @@
+""" ocelog.eventserver - a single-threaded, event-driven http/1.1 wsgi server """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import collections
+import cStringIO
+import errno
+import fcntl
+import httplib
+import os
+import Queue
+import resource
+import select
+import socket
+import sys
+import threading
+import time
+import traceback
+import urllib
+from wsgiref.handlers import format_date_time
+
+import ocelog.prefork
+
+
+# bytes read from a connection at a time
+_READ_SIZE = 16384
+# a request line and headers longer than this are refused
+_MAX_HEADER = 16384
+# a connection isn't read while this much of its output is unsent, so a
+# client pipelining requests without reading the responses is held back
+_HIGH_WATER = 262144
+# connections accepted per wakeup of the listening socket
+_ACCEPT_BATCH = 64
+# the loop wakes at least this often to close idle connections
+_TICK = 1.0
+# open files kept free for everything besides client connections
+_SPARE_FILES = 64
+
+# placed on the executor's queue once per thread to ask it to exit
+_STOP = object()
+# how long shutdown waits for the handler threads to finish their jobs
+_STOP_TIMEOUT = 10.0
+
+# accept() errors that only mean there is nothing (more) to accept now
+_accept_again = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR,
+        errno.ECONNABORTED, errno.EPROTO)
+# headers the server manages itself for each connection
+_hop_by_hop = frozenset(("connection", "keep-alive", "transfer-encoding"))
+# the interim response to a client that sent Expect: 100-continue
+_CONTINUE = "HTTP/1.1 100 Continue\r\n\r\n"
+# responses that never have a body (besides 1xx)
+_bodiless = ("204", "304")
+# reasons httplib doesn't know
+_reasons = {429: "Too Many Requests", 431: "Request Header Fields Too Large"}
+
+
+def _error_code(e):
+    """ Return the errno of a socket, select or os error """
+    if e.args:
+        return e.args[0]
+    return None
+
+def status_line(code):
+    """ Return the status (code and reason) for an http status code """
+    reason = httplib.responses.get(code) or _reasons.get(code, "Unknown")
+    return "%d %s" % (code, reason)
+
+
+#-----------------------------------------------------------------------------
+# pollers - epoll where the platform has it, select everywhere else
+#-----------------------------------------------------------------------------
+class _EpollPoller(object):
+    """ Readiness notification with epoll (linux) """
+
+    def __init__(self):
+        """ Open the epoll descriptor """
+        self._epoll = select.epoll()
+
+    def _mask(self, readable, writable):
+        """ Return the event mask for the interest """
+        mask = 0
+        if readable:
+            mask |= select.EPOLLIN
+        if writable:
+            mask |= select.EPOLLOUT
+        return mask
+
+    def register(self, fd, readable, writable):
+        """ Start watching fd """
+        self._epoll.register(fd, self._mask(readable, writable))
+
+    def modify(self, fd, readable, writable):
+        """ Change what fd is watched for """
+        self._epoll.modify(fd, self._mask(readable, writable))
+
+    def unregister(self, fd):
+        """ Stop watching fd """
+        self._epoll.unregister(fd)
+
+    def poll(self, timeout):
+        """ Return a list of (fd, readable, writable) that are ready
+
+        Errors and hangups are reported as readable, so the next recv()
+        reports them.
+        """
+        events = []
+        for fd, mask in self._epoll.poll(timeout):
+            events.append((fd,
+                bool(mask & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP)),
+                bool(mask & select.EPOLLOUT)))
+        return events
+
+    def close(self):
+        """ Close the epoll descriptor """
+        self._epoll.close()
+
+
+class _SelectPoller(object):
+    """ Readiness notification with select (portable, up to FD_SETSIZE fds) """
+
+    def __init__(self):
+        """ Start with nothing watched """
+        self._readers = set()
+        self._writers = set()
+
+    def register(self, fd, readable, writable):
+        """ Start watching fd """
+        self.modify(fd, readable, writable)
+
+    def modify(self, fd, readable, writable):
+        """ Change what fd is watched for """
+        if readable:
+            self._readers.add(fd)
+        else:
+            self._readers.discard(fd)
+        if writable:
+            self._writers.add(fd)
+        else:
+            self._writers.discard(fd)
+
+    def unregister(self, fd):
+        """ Stop watching fd """
+        self._readers.discard(fd)
+        self._writers.discard(fd)
+
+    def poll(self, timeout):
+        """ Return a list of (fd, readable, writable) that are ready """
+        readable, writable, errors = select.select(self._readers,
+                self._writers, [], timeout)
+        readable = set(readable)
+        writable = set(writable)
+        return [(fd, fd in readable, fd in writable)
+                for fd in readable | writable]
+
+    def close(self):
+        """ Nothing to release """
+        pass
+
+def make_poller(epoll=True):
+    """ Return an epoll poller if asked for and available, or a select one """
+    if epoll and hasattr(select, "epoll"):
+        return _EpollPoller()
+    return _SelectPoller()
+
+
+#-----------------------------------------------------------------------------
+# connections and requests
+#-----------------------------------------------------------------------------
+class _BadRequest(Exception):
+    """ A request the server refuses itself, with the status to send """
+
+    def __init__(self, code):
+        """ Keep the http status code """
+        Exception.__init__(self, code)
+        self.code = code
+
+
+class _Request(object):
+    """ A parsed request head waiting for its body """
+
+    __slots__ = ("environ", "length", "keep_alive", "head", "expect_continue",
+            "read_body")
+
+    def __init__(self, environ, length, keep_alive, head, expect_continue,
+            read_body):
+        """ Keep the parsed head """
+        self.environ = environ
+        self.length = length
+        self.keep_alive = keep_alive
+        self.head = head
+        self.expect_continue = expect_continue
+        self.read_body = read_body
+
+
+class _Connection(object):
+    """ A client connection: its socket, unparsed input and unsent output """
+
+    __slots__ = ("sock", "fd", "address", "chunks", "buffered", "request",
+            "output", "output_size", "close_after", "last_active", "interest",
+            "busy", "reserved", "waiting", "closed")
+
+    def __init__(self, sock, address, now):
+        """ Start with empty buffers """
+        self.sock = sock
+        self.fd = sock.fileno()
+        self.address = address
+        # received data not yet consumed, and its total length
+        self.chunks = []
+        self.buffered = 0
+        # the request whose head has been parsed, waiting for its body
+        self.request = None
+        # serialized responses not yet sent, and their total length
+        self.output = []
+        self.output_size = 0
+        # close once the output is sent
+        self.close_after = False
+        self.last_active = now
+        # the (readable, writable) interest registered with the poller
+        self.interest = (True, False)
+        # a request is with the executor
+        self.busy = False
+        # the body bytes reserved for the request, or waiting for room to be
+        self.reserved = 0
+        self.waiting = False
+        self.closed = False
+
+    def take(self, length):
+        """ Remove and return the first length bytes of the input """
+        if len(self.chunks) == 1:
+            data = self.chunks[0]
+        else:
+            data = "".join(self.chunks)
+        rest = data[length:]
+        if rest:
+            self.chunks = [rest]
+        else:
+            self.chunks = []
+        self.buffered = len(rest)
+        return data[:length]
+
+
+class _Executor(object):
+    """ Threads running the application off the loop's thread
+
+    Each finished job's connection and result are appended to done, and
+    wake is called so the loop picks them up.
+    """
+
+    def __init__(self, threads, done, wake):
+        """ Start the threads """
+        self._jobs = Queue.Queue()
+        self._done = done
+        self._wake = wake
+        self._threads = []
+        for i in range(threads):
+            thread = threading.Thread(target=self._run,
+                    name="ocelog-event-handler-%d" % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, conn, function, *args):
+        """ Run function(*args) on a thread for conn """
+        self._jobs.put((conn, function, args))
+
+    def _run(self):
+        """ Run jobs until asked to stop """
+        while True:
+            job = self._jobs.get()
+            if job is _STOP:
+                return
+            conn, function, args = job
+            self._done.append((conn, function(*args)))
+            self._wake()
+
+    def stop(self, timeout=_STOP_TIMEOUT):
+        """ Ask the threads to exit after the queued jobs, and join them
+
+        The join waits at most timeout seconds in all.  Daemon threads still
+        blocked in the queue when the interpreter exits die with tracebacks,
+        so they're joined rather than abandoned.
+        """
+        for thread in self._threads:
+            self._jobs.put(_STOP)
+        deadline = time.time() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.time()))
+
+
+#-----------------------------------------------------------------------------
+# the server
+#-----------------------------------------------------------------------------
+class EventServer(object):
+    """ Serve a wsgi application from one thread with an event loop
+
+    Every connection is non-blocking and watched with epoll (select where
+    epoll isn't available).  Connections are http/1.1 keep-alive by default, and requests
+    pipelined on a connection are answered in order, with the responses to
+    everything that arrived together sent in one write.
+
+    A request is handed to the application once its whole body has been
+    received; the response is collected in full, given a Content-Length,
+    and sent.  With threads, the application runs on that many executor
+    threads and the loop only moves bytes: a connection's next request
+    waits until the response to the one before is ready, so pipelined
+    responses stay in order.  With threads set to 0 the application runs
+    on the loop's thread, and nothing else is served while it runs.
+
+    Input is read in small fixed chunks.  A request head is limited to
+    max_header bytes, and a body over max_body bytes is not read at all:
+    the application gets its Content-Length with an empty wsgi.input (the
+    ocelog handlers refuse it with a 413 before reading), and the
+    connection is closed after the response.  Connections idle for
+    keepalive_timeout seconds are closed, and no more than max_connections
+    are held at once (the open file limit is raised to fit them if it can
+    be).
+
+    Bodies are buffered whole, so a connection costs up to max_body bytes
+    while its body arrives.  Before reading the rest of a body, a
+    connection reserves its Content-Length out of max_buffered bytes
+    shared by all of them, and holds it until the response is queued.
+    When there isn't room, the connection isn't read until there is, and
+    connections are given room in the order they asked for it; a body
+    larger than max_buffered is only read while nothing else is reserved.
+    Any other connection holds no more than about max_header bytes.
+
+    Bodies sent with Transfer-Encoding are refused with a 411.
+    """
+
+    def __init__(self, app, host, port, max_body=4194304,
+            keepalive_timeout=60.0, max_connections=10000, threads=0,
+            epoll=True, reuse_port=False, max_header=_MAX_HEADER,
+            max_buffered=268435456):
+        """ Initialize the server; serve_forever() starts it """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.max_header = max_header
+        self.keepalive_timeout = keepalive_timeout
+        self.max_connections = max_connections
+        self.max_buffered = max_buffered
+        self.threads = threads
+        self.reuse_port = reuse_port
+        self.connections = {}
+        self.socket = None
+        self._executor = None
+        self._done = collections.deque()
+        # the body bytes reserved, and the connections waiting for room
+        self._reserved = 0
+        self._waiting = collections.deque()
+        self._epoll = epoll
+        self._poller = None
+        self._accepting = False
+        self._stopping = False
+        self._date = (0, None)
+        # written to by shutdown() to wake the loop from another thread
+        self._wake_r, self._wake_w = os.pipe()
+        for fd in (self._wake_r, self._wake_w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def bind(self):
+        """ Bind the listening socket (serve_forever() does if needed) """
+        if self.socket is None:
+            self.socket = ocelog.prefork.listen(self.host, self.port,
+                    reuse_port=self.reuse_port)
+            self.socket.setblocking(0)
+            self.port = self.socket.getsockname()[1]
+        return self.socket
+
+    def shutdown(self):
+        """ Stop accepting and exit serve_forever() once responses are sent
+
+        Connections are closed as their requests are answered.  Safe to call
+        from a signal handler or another thread.  A server can't be
+        restarted once it has stopped.
+        """
+        self._stopping = True
+        self.wake()
+
+    def wake(self):
+        """ Wake the loop from another thread """
+        wake_w = self._wake_w
+        if wake_w is None:
+            return
+        try:
+            os.write(wake_w, "x")
+        except OSError:
+            pass
+
+    #--------------------------------------------------------------------------
+    # the loop
+    #--------------------------------------------------------------------------
+    def serve_forever(self):
+        """ Serve until shutdown() """
+        self._raise_file_limit()
+        self.bind()
+        server_name = socket.getfqdn(self.host)
+        self.base_environ = {
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(self.port),
+            'SCRIPT_NAME': "",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': "http",
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': self.threads > 0,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            }
+        if self.threads:
+            self._executor = _Executor(self.threads, self._done, self.wake)
+        self._poller = make_poller(self._epoll)
+        self._poller.register(self._wake_r, True, False)
+        self._listen(True)
+        next_sweep = time.time() + _TICK
+        stop_begun = False
+        try:
+            while not self._stopping or self.connections:
+                if self._stopping and not stop_begun:
+                    self._begin_stop()
+                    stop_begun = True
+                try:
+                    events = self._poller.poll(_TICK)
+                except (select.error, IOError, OSError), e:
+                    if _error_code(e) == errno.EINTR:
+                        continue
+                    raise
+                listen_fd = self.socket.fileno()
+                for fd, readable, writable in events:
+                    if fd == listen_fd:
+                        self._accept()
+                    elif fd == self._wake_r:
+                        self._drain_wakeups()
+                        self._complete()
+                    else:
+                        conn = self.connections.get(fd)
+                        if conn is None:
+                            continue
+                        if readable:
+                            self._read(conn)
+                        if writable and not conn.closed:
+                            self._pump(conn)
+                        if not conn.closed:
+                            self._update_interest(conn)
+                now = time.time()
+                if now >= next_sweep:
+                    self._sweep(now)
+                    next_sweep = now + _TICK
+        finally:
+            self._stopping = True
+            if self._executor is not None:
+                self._executor.stop()
+            for conn in self.connections.values():
+                self._close(conn)
+            self._poller.close()
+            self.socket.close()
+            self.socket = None
+            wake_r, wake_w = self._wake_r, self._wake_w
+            self._wake_r = self._wake_w = None
+            os.close(wake_r)
+            os.close(wake_w)
+
+    def _raise_file_limit(self):
+        """ Raise the soft open file limit to fit max_connections if it's lower """
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = self.max_connections + _SPARE_FILES
+        if soft == resource.RLIM_INFINITY or soft >= wanted:
+            return
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        if wanted > soft:
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+            except (ValueError, resource.error):
+                pass
+
+    def _listen(self, accepting):
+        """ Start or stop watching the listening socket """
+        if accepting == self._accepting:
+            return
+        if accepting:
+            self._poller.register(self.socket.fileno(), True, False)
+        else:
+            self._poller.unregister(self.socket.fileno())
+        self._accepting = accepting
+
+    def _begin_stop(self):
+        """ Stop accepting, and close connections once they're answered """
+        self._listen(False)
+        for conn in self.connections.values():
+            # a request still arriving or running is closed once it's answered
+            if conn.request is not None or conn.busy:
+                continue
+            conn.close_after = True
+            if conn.output:
+                self._update_interest(conn)
+            else:
+                self._close(conn)
+
+    def _drain_wakeups(self):
+        """ Empty the wakeup pipe """
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except OSError:
+            pass
+
+    def _sweep(self, now):
+        """ Close connections that have been idle too long
+
+        Connections waiting for room for their bodies aren't idle.
+        """
+        horizon = now - self.keepalive_timeout
+        for conn in self.connections.values():
+            if conn.last_active < horizon and not conn.busy and \
+                    not conn.waiting:
+                self._close(conn)
+
+    def _accept(self):
+        """ Accept the waiting connections """
+        now = time.time()
+        for i in range(_ACCEPT_BATCH):
+            try:
+                sock, address = self.socket.accept()
+            except socket.error, e:
+                if _error_code(e) in _accept_again:
+                    return
+                if _error_code(e) in (errno.EMFILE, errno.ENFILE,
+                        errno.ENOBUFS, errno.ENOMEM):
+                    sys.stderr.write("ocelog: can't accept connection: %s\n" % e)
+                    return
+                raise
+            sock.setblocking(0)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = _Connection(sock, address, now)
+            self.connections[conn.fd] = conn
+            self._poller.register(conn.fd, True, False)
+            if len(self.connections) >= self.max_connections:
+                self._listen(False)
+                return
+
+    def _close(self, conn):
+        """ Close a connection and forget it """
+        if conn.closed:
+            return
+        conn.closed = True
+        self.connections.pop(conn.fd, None)
+        try:
+            self._poller.unregister(conn.fd)
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        try:
+            if conn.close_after:
+                conn.sock.shutdown(socket.SHUT_WR)
+        except socket.error:
+            pass
+        conn.sock.close()
+        self._release(conn)
+        if not self._stopping and \
+                len(self.connections) < self.max_connections:
+            self._listen(True)
+
+    def _update_interest(self, conn):
+        """ Watch a connection for what it can do next """
+        interest = (not conn.close_after and not conn.busy and
+                not conn.waiting and conn.output_size < _HIGH_WATER,
+                bool(conn.output))
+        if interest != conn.interest:
+            self._poller.modify(conn.fd, *interest)
+            conn.interest = interest
+
+    #--------------------------------------------------------------------------
+    # reading and writing
+    #--------------------------------------------------------------------------
+    def _read(self, conn):
+        """ Read what the client has sent and answer any complete requests """
+        try:
+            data = conn.sock.recv(_READ_SIZE)
+        except socket.error, e:
+            if _error_code(e) in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            self._close(conn)
+            return
+        if not data:
+            self._close(conn)
+            return
+        conn.last_active = time.time()
+        conn.chunks.append(data)
+        conn.buffered += len(data)
+        self._pump(conn)
+
+    def _pump(self, conn):
+        """ Answer the buffered requests and send output, as far as possible """
+        while not conn.closed:
+            answered = self._process(conn)
+            if not self._flush(conn) or not answered:
+                break
+        if not conn.closed and conn.close_after and not conn.output:
+            self._close(conn)
+
+    def _flush(self, conn):
+        """ Send as much output as the socket takes
+
+        Returns True if all of it was sent.
+        """
+        while conn.output:
+            if len(conn.output) == 1:
+                data = conn.output[0]
+            else:
+                data = "".join(conn.output)
+            try:
+                sent = conn.sock.send(data)
+            except socket.error, e:
+                if _error_code(e) in (errno.EAGAIN, errno.EWOULDBLOCK,
+                        errno.EINTR):
+                    conn.output = [data]
+                    conn.output_size = len(data)
+                    return False
+                self._close(conn)
+                return False
+            conn.last_active = time.time()
+            if sent < len(data):
+                conn.output = [data[sent:]]
+                conn.output_size = len(data) - sent
+                return False
+            conn.output = []
+            conn.output_size = 0
+        return True
+
+    def _process(self, conn):
+        """ Answer the complete requests in the input
+
+        Returns True if any were answered.
+        """
+        answered = False
+        while not conn.closed and not conn.close_after and not conn.busy and \
+                conn.output_size < _HIGH_WATER:
+            if conn.request is None:
+                if not self._parse_head(conn):
+                    break
+            request = conn.request
+            if request.read_body and request.length > conn.buffered:
+                if not conn.reserved and not self._reserve(conn):
+                    break
+                if request.expect_continue:
+                    request.expect_continue = False
+                    self._send(conn, _CONTINUE)
+                    answered = True
+                break
+            conn.request = None
+            if request.read_body:
+                body = conn.take(request.length)
+            else:
+                body = ""
+            if self._executor is not None:
+                conn.busy = True
+                self._executor.submit(conn, self._handle, request, body)
+                break
+            self._deliver(conn, self._handle(request, body))
+            answered = True
+        return answered
+
+    def _complete(self):
+        """ Send the responses the executor has finished """
+        while self._done:
+            conn, result = self._done.popleft()
+            conn.busy = False
+            if conn.closed:
+                continue
+            self._deliver(conn, result)
+            self._pump(conn)
+            if not conn.closed:
+                self._update_interest(conn)
+
+    def _reserve(self, conn):
+        """ Reserve room for the body of conn's request
+
+        Returns False, and queues the connection to be given room later, if
+        there isn't room now.
+        """
+        if conn.waiting:
+            return False
+        length = conn.request.length
+        if self._waiting or (self._reserved and
+                self._reserved + length > self.max_buffered):
+            conn.waiting = True
+            self._waiting.append(conn)
+            return False
+        conn.reserved = length
+        self._reserved += length
+        return True
+
+    def _release(self, conn):
+        """ Give back the room reserved for conn's body, or its place in line """
+        if conn.reserved:
+            self._reserved -= conn.reserved
+            conn.reserved = 0
+        elif not conn.waiting:
+            return
+        conn.waiting = False
+        self._admit()
+
+    def _admit(self):
+        """ Give room to the waiting connections in order, while there is some """
+        while self._waiting:
+            conn = self._waiting[0]
+            if conn.closed:
+                self._waiting.popleft()
+                continue
+            request = conn.request
+            if self._reserved and \
+                    self._reserved + request.length > self.max_buffered:
+                return
+            self._waiting.popleft()
+            conn.waiting = False
+            conn.reserved = request.length
+            self._reserved += request.length
+            conn.last_active = time.time()
+            if request.expect_continue:
+                request.expect_continue = False
+                self._send(conn, _CONTINUE)
+            self._update_interest(conn)
+
+    def _deliver(self, conn, result):
+        """ Queue a response from _handle() """
+        self._release(conn)
+        data, keep_alive = result
+        self._send(conn, data)
+        if not keep_alive:
+            conn.close_after = True
+
+    def _send(self, conn, data):
+        """ Queue data for the client """
+        conn.output.append(data)
+        conn.output_size += len(data)
+
+    #--------------------------------------------------------------------------
+    # requests and responses
+    #--------------------------------------------------------------------------
+    def _parse_head(self, conn):
+        """ Parse the next request head in the input into conn.request
+
+        Returns False if the head isn't complete yet or was refused.
+        """
+        if not conn.buffered:
+            return False
+        data = conn.take(conn.buffered)
+        # empty lines between pipelined requests are ignored (rfc 7230 3.5)
+        data = data.lstrip("\r\n")
+        end = data.find("\r\n\r\n")
+        if end < 0:
+            if data:
+                conn.chunks = [data]
+            conn.buffered = len(data)
+            if len(data) > self.max_header:
+                self._refuse(conn, 431)
+            return False
+        rest = data[end + 4:]
+        if rest:
+            conn.chunks = [rest]
+        conn.buffered = len(rest)
+        if end > self.max_header:
+            self._refuse(conn, 431)
+            return False
+        try:
+            conn.request = self._parse_request(conn, data[:end])
+        except _BadRequest, e:
+            self._refuse(conn, e.code)
+            return False
+        return True
+
+    def _parse_request(self, conn, head):
+        """ Return the _Request for a request head """
+        lines = head.split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3:
+            raise _BadRequest(400)
+        method, target, version = parts
+        if version not in ("HTTP/1.1", "HTTP/1.0"):
+            if version.startswith("HTTP/"):
+                raise _BadRequest(505)
+            raise _BadRequest(400)
+        path, sep, query = target.partition("?")
+        environ = self.base_environ.copy()
+        environ['REQUEST_METHOD'] = method
+        environ['PATH_INFO'] = urllib.unquote(path)
+        environ['QUERY_STRING'] = query
+        environ['SERVER_PROTOCOL'] = version
+        environ['REMOTE_ADDR'] = conn.address[0]
+        environ['REMOTE_PORT'] = str(conn.address[1])
+        # wsgiref's default, which the handlers have always seen
+        environ['CONTENT_TYPE'] = "text/plain"
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            # obsolete header folding is refused (rfc 7230 3.2.4)
+            if not sep or not name or name[0] in " \t" or name[-1] in " \t":
+                raise _BadRequest(400)
+            key = name.upper().replace("-", "_")
+            value = value.strip()
+            if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                if key == "CONTENT_LENGTH" and key in environ and \
+                        environ[key] != value:
+                    raise _BadRequest(400)
+                environ[key] = value
+                continue
+            key = "HTTP_" + key
+            if key in environ:
+                environ[key] += "," + value
+            else:
+                environ[key] = value
+        if "HTTP_TRANSFER_ENCODING" in environ:
+            raise _BadRequest(411)
+        length = environ.get("CONTENT_LENGTH")
+        if length is None:
+            length = 0
+        else:
+            if not length.isdigit():
+                raise _BadRequest(400)
+            length = int(length)
+        connection = environ.get("HTTP_CONNECTION", "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = "close" not in connection
+        else:
+            keep_alive = "keep-alive" in connection
+        read_body = length <= self.max_body
+        if not read_body:
+            keep_alive = False
+        expect_continue = read_body and length > 0 and \
+                environ.get("HTTP_EXPECT", "").lower() == "100-continue"
+        return _Request(environ, length, keep_alive, method == "HEAD",
+                expect_continue, read_body)
+
+    def _date_header(self):
+        """ Return the Date header line, formatted once a second """
+        now = int(time.time())
+        if self._date[0] != now:
+            self._date = (now, "Date: %s\r\n" % format_date_time(now))
+        return self._date[1]
+
+    def _refuse(self, conn, code):
+        """ Answer a request the server can't parse, and close """
+        conn.request = None
+        conn.chunks = []
+        conn.buffered = 0
+        self._send(conn, "HTTP/1.1 %s\r\nContent-Length: 0\r\n%s"
+                "Connection: close\r\n\r\n" % (status_line(code),
+                self._date_header()))
+        conn.close_after = True
+
+    def _call(self, environ):
+        """ Run the application and return its status, headers and body """
+        state = []
+        written = []
+        def start_response(status, headers, exc_info=None):
+            # nothing is sent before the application returns, so an error
+            # response simply replaces the original one
+            state[:] = [status, headers]
+            return written.append
+        try:
+            result = self.app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        written.append(chunk)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+            if not state:
+                raise RuntimeError("the application didn't call start_response")
+        except Exception:
+            traceback.print_exc(file=environ['wsgi.errors'])
+            return status_line(500), [("Content-Type", "text/plain")], \
+                    "Internal Server Error", False
+        return state[0], state[1], "".join(written), True
+
+    def _handle(self, request, body):
+        """ Call the application for a request
+
+        Returns the response bytes and whether to keep the connection.
+        """
+        environ = request.environ
+        environ['wsgi.input'] = cStringIO.StringIO(body)
+        status, headers, content, keep_alive = self._call(environ)
+        keep_alive = keep_alive and request.keep_alive and not self._stopping
+        return self.serialize(status, headers, content, request.head,
+                keep_alive, environ['SERVER_PROTOCOL']), keep_alive
+
+    def serialize(self, status, headers, content, head=False, keep_alive=True,
+            version="HTTP/1.1"):
+        """ Return the bytes of a complete response """
+        lines = ["HTTP/1.1 ", status, "\r\n"]
+        has_length = False
+        for name, value in headers:
+            lower = name.lower()
+            if lower in _hop_by_hop:
+                continue
+            if lower == "content-length":
+                has_length = True
+            lines.append("%s: %s\r\n" % (name, value))
+        bodiless = status[:1] == "1" or status[:3] in _bodiless
+        if not has_length and not bodiless:
+            lines.append("Content-Length: %d\r\n" % len(content))
+        lines.append(self._date_header())
+        if not keep_alive:
+            lines.append("Connection: close\r\n")
+        elif version == "HTTP/1.0":
+            lines.append("Connection: keep-alive\r\n")
+        lines.append("\r\n")
+        if not head and not bodiless:
+            lines.append(content)
+        return "".join(lines)
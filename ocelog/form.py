@@ -0,0 +1,92 @@
+""" ocelog.form - a minimal x-www-form-urlencoded parser for log requests """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import urllib
+
+
+# the only fields a log record may contain
+field_names = frozenset(("hostname", "appname", "msg", "facility", "priority"))
+
+
+class FormException(Exception):
+    """ A rejected form, carrying the http status and an error message """
+
+    def __init__(self, status, error_msg):
+        """ Keep the status and error message for the response """
+        Exception.__init__(self, status, error_msg)
+        self.status = status
+        self.error_msg = error_msg
+
+
+def parse_fields(data):
+    """ Decode an x-www-form-urlencoded string into a dict of log fields
+
+    Only the fields in field_names are accepted and each may appear once.
+    Values are only unquoted when they contain an escape, so plain values are
+    used as they are sliced out of the data.
+    """
+    fields = {}
+    for pair in data.split("&"):
+        if not pair:
+            continue
+        key, sep, value = pair.partition("=")
+        if "%" in key:
+            key = urllib.unquote(key)
+        if key not in field_names:
+            raise FormException(400, "Request included an unknown field")
+        if key in fields:
+            raise FormException(400, "Request included a duplicate field")
+        if "%" in value or "+" in value:
+            value = urllib.unquote_plus(value)
+        fields[key] = value
+    return fields
+
+def read_body(environ, max_length):
+    """ Read at most Content-Length bytes from wsgi.input
+
+    A FormException is raised with a 413 if the body is larger than
+    max_length, before anything is read.
+    """
+    try:
+        length = max(0, int(environ.get("CONTENT_LENGTH") or 0))
+    except ValueError:
+        raise FormException(400, "Request included an invalid Content-Length")
+    if length > max_length:
+        raise FormException(413, "Request body is too large")
+    if length == 0:
+        return ""
+    return environ["wsgi.input"].read(length)
+
+
+class LogRequest(object):
+    """ The body and fields of a POST to /log, read from the WSGI environ
+
+    LogRequest takes the place of bottle.request for the /log handler.  It
+    offers the same environ and POST attributes used by ocelog.auth and
+    ocelog.message, but POST only ever holds the known log fields and is
+    parsed without cgi.FieldStorage.  The raw body is kept for auth.
+    """
+
+    __slots__ = ("environ", "body", "POST")
+
+    def __init__(self, environ, max_length):
+        """ Read and parse the request body """
+        self.environ = environ
+        self.body = read_body(environ, max_length)
+        self.POST = parse_fields(self.body)
@@ -0,0 +1,362 @@
+""" ocelog.handlers - the /log and /log/batch request handlers
+
+The handlers take a WSGI environ and a RequestTimer and return a Reply.
+Everything a request needs is passed to them or returned from them rather
+than held in bottle's thread-local request and response, so they can run on
+any thread of any server.  ocelog.wsgi wraps them as bottle routes.
+"""
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import hashlib
+import math
+
+import ocelog.admission
+import ocelog.auth
+import ocelog.config
+import ocelog.dedup
+import ocelog.form
+import ocelog.idempotency
+import ocelog.message
+import ocelog.pipeline
+import ocelog.queued
+import ocelog.ratelimit
+
+
+# the longest X-Idempotency-Key accepted
+max_idempotency_key = 255
+
+
+class Reply(object):
+    """ The status, headers and body a handler answers with
+
+    headers holds only what the handler set; the server adds the rest.
+    """
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status=200, headers=None, body=""):
+        """ Initialize a reply, by default an empty 200 """
+        self.status = status
+        self.headers = headers or []
+        self.body = body
+
+    def error(self, status, error_msg):
+        """ Answer with status and an x-ocelog-error header, and return self """
+        self.headers.append(("x-ocelog-error", error_msg))
+        self.status = status
+        return self
+
+
+class _BatchRequest(object):
+    """ The environ of a /log/batch request, as ocelog.auth and
+    ocelog.message expect to find it """
+
+    __slots__ = ("environ",)
+
+    def __init__(self, environ):
+        """ Wrap the environ """
+        self.environ = environ
+
+
+def default_writer(oconfig):
+    """ Return the writer valid messages are handed to
+
+    That's the shared QueuedWriter if queue.enabled is set, or the writer
+    pipeline, wrapped to suppress duplicates if dedup.enabled is set.
+    """
+    if oconfig.dedup.enabled:
+        return ocelog.dedup.default_writer(oconfig)
+    if oconfig.queue.enabled:
+        return ocelog.queued.default_writer(oconfig)
+    return ocelog.pipeline.default_writer(oconfig)
+
+def shed(reply, priority, oconfig):
+    """ Turn the request away with a 503 and a Retry-After header """
+    reply.headers.append(("Retry-After", str(oconfig.admission.retry_after)))
+    return reply.error(503, "Server is overloaded, shedding %s messages" %
+            priority)
+
+def rate_limited(reply, kind, key, wait):
+    """ Turn the request away with a 429 and a Retry-After header """
+    reply.headers.append(("Retry-After", str(int(math.ceil(wait)))))
+    return reply.error(429, "Rate limit exceeded for %s %s" % (kind, key))
+
+def admitted(handler, environ, timer):
+    """ Run a handler with its request counted as in flight
+
+    The count is one half of the load ocelog.admission uses to decide which
+    messages to shed.
+    """
+    controller = ocelog.admission.AdmissionController()
+    controller.enter()
+    try:
+        return handler(environ, timer)
+    finally:
+        controller.leave()
+
+
+#-----------------------------------------------------------------------------
+# POST /log
+#-----------------------------------------------------------------------------
+def log(environ, timer):
+    """ Accept a message and send it to syslog
+
+    1> filter the request by headers
+    2> rate limit the client with a 429 (ratelimit.enabled)
+    3> shed the message with a 503 if overloaded (admission.enabled)
+    4> authorize the request if required (sec token)
+    5> rate limit the appname with a 429 (ratelimit.enabled)
+    6> replay the original result of a retried X-Idempotency-Key
+       (idempotency.enabled)
+    7> validate the incoming message
+    8> write the message (or queue it and return 202 if queue.enabled)
+
+    The time spent in each stage is recorded through the timer.
+    """
+    reply = Reply()
+    # Confirm support for incoming content-type
+    content_type = environ['CONTENT_TYPE']
+    timer.stage("content_type")
+    if content_type != "application/x-www-form-urlencoded":
+        return reply.error(415, "Data must be x-www-form-urlencoded")
+    # Every stage of the request uses the same configuration snapshot
+    oconfig = ocelog.config.current()
+    # A client over its rate limit is turned away before the body is read
+    ratelimit = oconfig.ratelimit.enabled and oconfig.ratelimit.key
+    if ratelimit in ("client", "both"):
+        client = environ.get("REMOTE_ADDR")
+        wait = ocelog.ratelimit.check("client", client, oconfig)
+        timer.stage("ratelimit")
+        if wait:
+            return rate_limited(reply, "client", client, wait)
+    # Read only the known fields, skipping bottle's generic form parsing
+    try:
+        log_request = ocelog.form.LogRequest(environ,
+                oconfig.message.max_request_size)
+    except ocelog.form.FormException, e:
+        return reply.error(e.status, e.error_msg)
+    finally:
+        timer.stage("parse")
+    # Under overload, turn away low priority messages before doing any work.
+    # A priority that isn't valid is judged as the default one, so it's
+    # refused by validation with a 400 rather than shed with a 503.
+    if oconfig.admission.enabled:
+        priority = log_request.POST.get("priority")
+        if priority not in ocelog.message.Message.valid_priorities:
+            priority = oconfig.message.default_priority
+        admit = ocelog.admission.AdmissionController().admit(priority, oconfig)
+        timer.stage("admission")
+        if not admit:
+            return shed(reply, priority, oconfig)
+    # Authorize the request
+    authorized = ocelog.auth.authorize_request(log_request, oconfig)
+    timer.stage("authorize")
+    if not authorized:
+        return reply.error(400, "Request failed authorization")
+    # Only authorized requests are charged to the appname, so a client can't
+    # drain the bucket of an app it can't sign for
+    if ratelimit in ("appname", "both"):
+        appname = log_request.POST.get("appname")
+        wait = ocelog.ratelimit.check("appname", appname, oconfig)
+        timer.stage("ratelimit")
+        if wait:
+            return rate_limited(reply, "appname", appname, wait)
+    # A retry with an X-Idempotency-Key seen before gets the original result
+    key = environ.get("HTTP_X_IDEMPOTENCY_KEY")
+    if key and oconfig.idempotency.enabled:
+        if len(key) > max_idempotency_key:
+            return reply.error(400, "Request included an invalid idempotency key")
+        cache = ocelog.idempotency.default_cache(oconfig)
+        key = ocelog.idempotency.scoped_key(key,
+                log_request.POST.get("appname"), environ)
+        fingerprint = hashlib.sha1(log_request.body).hexdigest()
+        result = cache.begin(key, fingerprint)
+        timer.stage("idempotency")
+        if result is ocelog.idempotency.IN_PROGRESS:
+            return reply.error(409,
+                    "A request with this idempotency key is in progress")
+        if result is ocelog.idempotency.MISMATCH:
+            return reply.error(422,
+                    "Idempotency key was used for a different request")
+        if result is not None:
+            reply.status, headers = result
+            reply.headers.extend(headers)
+            reply.headers.append(("x-ocelog-idempotent-replay", "true"))
+            return reply
+        try:
+            message = write_message(reply, log_request, oconfig, timer)
+        except:
+            cache.finish(key, None)
+            raise
+        # only final results are kept; a retry after a failed write is
+        # written again
+        if message.status in ("success", "validation-failure"):
+            cache.finish(key, (reply.status, list(reply.headers)))
+        else:
+            cache.finish(key, None)
+        return reply
+    write_message(reply, log_request, oconfig, timer)
+    return reply
+
+def write_message(reply, log_request, oconfig, timer):
+    """ Validate and write the message from a /log request
+
+    This is the end of the /log handler, from validation on, and sets the
+    reply status in the same way.  Returns the Message, whose status tells
+    a validation failure from a failed write.
+    """
+    # Extract and validate the message
+    message = ocelog.message.parse_request(log_request, oconfig)
+    timer.stage("validate")
+    if not message.valid:
+        reply.error(400, message.error_msg)
+        return message
+    # In async mode, queue the message and accept it without waiting
+    if oconfig.queue.enabled:
+        message.write(default_writer(oconfig))
+        timer.stage("write")
+        if message.status == "success":
+            reply.status = 202
+        else:
+            reply.error(503, "Message queue is full")
+        return message
+    # If valid, attempt the write to every enabled writer
+    message.write(default_writer(oconfig))
+    timer.stage("write")
+    if message.status == "success":
+        reply.status = 201
+    else:
+        reply.error(400, message.error_msg)
+    return message
+
+
+#-----------------------------------------------------------------------------
+# POST /log/batch
+#-----------------------------------------------------------------------------
+def log_batch(environ, timer):
+    """ Accept many messages in one request and send them to syslog
+
+    The text/plain body holds one x-www-form-urlencoded record per line, each
+    with the same fields as a POST to /log.  If tokens are required, the
+    x-token header must be generated from the entire body.
+
+    1> filter the request by headers
+    2> authorize the request if required (sec token)
+    3> validate each record
+    4> rate limit records with a 429 (ratelimit.enabled)
+    5> shed records with a 503 if overloaded (admission.enabled)
+    6> write the remaining valid messages in one pass
+    7> return one status line per record, in order
+
+    Each status line holds the code the record would have received from /log,
+    followed by the error message if there was one.
+    """
+    reply = Reply()
+    request = _BatchRequest(environ)
+    # Confirm support for incoming content-type
+    content_type = environ['CONTENT_TYPE']
+    timer.stage("content_type")
+    if content_type != "text/plain":
+        return reply.error(415,
+                "Data must be text/plain with one record per line")
+    # Every stage of the request uses the same configuration snapshot
+    oconfig = ocelog.config.current()
+    try:
+        body = ocelog.form.read_body(environ, oconfig.message.max_batch_size)
+    except ocelog.form.FormException, e:
+        return reply.error(e.status, e.error_msg)
+    finally:
+        timer.stage("read")
+    # Authorize the request
+    authorized = ocelog.auth.authorize_batch_request(request, body, oconfig)
+    timer.stage("authorize")
+    if not authorized:
+        return reply.error(400, "Request failed authorization")
+    # Extract and validate the messages
+    messages = ocelog.message.parse_batch_request(request, body, oconfig)
+    timer.stage("validate")
+    if not messages:
+        return reply.error(400, "Batch included no records")
+    # Records for an appname bound to other keys are refused
+    if oconfig.security.appname_keys:
+        for message in messages:
+            if message.valid and not ocelog.auth.authorize_batch_record(
+                    request, message, oconfig):
+                message.valid = False
+                message.status = "validation-failure"
+                message.error_msg = "Request failed authorization"
+    # Each record counts against the client's and its appname's limits
+    limited_messages = {}
+    ratelimit = oconfig.ratelimit.enabled and oconfig.ratelimit.key
+    if ratelimit:
+        client = environ.get("REMOTE_ADDR")
+        for message in messages:
+            if not message.valid:
+                continue
+            wait = 0
+            if ratelimit in ("client", "both"):
+                wait = ocelog.ratelimit.check("client", client, oconfig)
+            if not wait and ratelimit in ("appname", "both"):
+                wait = ocelog.ratelimit.check("appname", message.appname,
+                        oconfig)
+            if wait:
+                limited_messages[id(message)] = wait
+        timer.stage("ratelimit")
+    # Under overload, turn away low priority records
+    shed_messages = set()
+    if oconfig.admission.enabled:
+        controller = ocelog.admission.AdmissionController()
+        cutoff = controller.shed_below(oconfig)
+        for message in messages:
+            if message.valid and id(message) not in limited_messages and \
+                    not controller.admit(message.priority, oconfig, cutoff):
+                shed_messages.add(id(message))
+        timer.stage("admission")
+    # Write the valid messages in one pass
+    owriter = default_writer(oconfig)
+    if oconfig.queue.enabled:
+        success_line, failure_line = "202", "503 Message queue is full"
+    else:
+        success_line, failure_line = "201", None
+    ocelog.message.write_batch([m for m in messages if m.valid and
+            id(m) not in limited_messages and id(m) not in shed_messages],
+            owriter)
+    timer.stage("write")
+    lines = []
+    for message in messages:
+        if id(message) in limited_messages:
+            lines.append("429 Rate limit exceeded")
+        elif id(message) in shed_messages:
+            lines.append("503 Server is overloaded")
+        elif message.status == "success":
+            lines.append(success_line)
+        elif message.status == "write-failure" and failure_line is not None:
+            lines.append(failure_line)
+        else:
+            lines.append("400 %s" % message.error_msg)
+    # Tell the client when to retry the records that were turned away
+    retry_after = limited_messages.values()
+    if shed_messages:
+        retry_after.append(oconfig.admission.retry_after)
+    if retry_after:
+        reply.headers.append(("Retry-After",
+                str(int(math.ceil(max(retry_after))))))
+    reply.headers.append(("Content-Type", "text/plain"))
+    reply.body = "\n".join(lines) + "\n"
+    return reply
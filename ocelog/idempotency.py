@@ -0,0 +1,175 @@
+""" ocelog.idempotency - replay the result of a request retried with the same key """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import collections
+import threading
+import time
+
+import ocelog.config
+
+
+# the ttl is divided into this many buckets, so entries outlive it by at
+# most one bucket's worth of time
+_BUCKETS = 10
+
+# begin() returns this while the first request with a key is still running
+IN_PROGRESS = object()
+# begin() returns this when a key is reused for a different request
+MISMATCH = object()
+
+
+class IdempotencyCache(object):
+    """ A bounded, expiring map of idempotency keys to request results
+
+    A request claims its key with begin() and stores its result with
+    finish().  A retry with the same key within ttl seconds gets the stored
+    result from begin() instead of being handled again, or IN_PROGRESS if
+    the first request hasn't finished.  A request may also give a
+    fingerprint of itself (a digest of its body) when it claims a key; a
+    later request with the same key and a different fingerprint gets
+    MISMATCH instead of the result.
+
+    Keys are filed in time buckets of ttl / 10 seconds, oldest first, when
+    they are claimed.  Expiry drops whole buckets from the front, so it
+    never scans live entries and a key lives between ttl and ttl plus one
+    bucket.  At most max_entries keys are filed (including released ones
+    waiting to expire); beyond that the oldest are dropped first.
+    """
+
+    def __init__(self, ttl=300.0, max_entries=100000):
+        """ Initialize an empty cache """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._width = float(ttl) / _BUCKETS
+        # key: (bucket, result, fingerprint), and (bucket, deque of keys)
+        # oldest first
+        self._entries = {}
+        self._buckets = collections.deque()
+        self._filed = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """ Return the number of keys held """
+        return len(self._entries)
+
+    def _expire(self, now):
+        """ Drop the buckets that have fallen out of the ttl (lock held) """
+        horizon = int((now - self.ttl) // self._width)
+        buckets = self._buckets
+        while buckets and buckets[0][0] < horizon:
+            bucket, keys = buckets.popleft()
+            self._filed -= len(keys)
+            for key in keys:
+                self._discard(key, bucket)
+
+    def _discard(self, key, bucket):
+        """ Remove key if it was filed in bucket (lock held) """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == bucket:
+            del self._entries[key]
+
+    def _store(self, key, result, fingerprint, now):
+        """ File key under the current bucket with result (lock held) """
+        bucket = int(now // self._width)
+        buckets = self._buckets
+        if not buckets or buckets[-1][0] != bucket:
+            buckets.append((bucket, collections.deque()))
+        buckets[-1][1].append(key)
+        self._filed += 1
+        self._entries[key] = (bucket, result, fingerprint)
+        # evict the oldest keys beyond max_entries
+        while self._filed > self.max_entries:
+            oldest, keys = buckets[0]
+            self._discard(keys.popleft(), oldest)
+            self._filed -= 1
+            if not keys:
+                buckets.popleft()
+
+    def begin(self, key, fingerprint=None, now=None):
+        """ Claim key for a request
+
+        Returns None if the request should go ahead, the stored result if
+        an earlier request with the key finished, IN_PROGRESS, or MISMATCH
+        if the earlier request had another fingerprint.
+        """
+        if now is None:
+            now = time.time()
+        self._lock.acquire()
+        try:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] != fingerprint:
+                    return MISMATCH
+                return entry[1]
+            self._store(key, IN_PROGRESS, fingerprint, now)
+            return None
+        finally:
+            self._lock.release()
+
+    def finish(self, key, result, fingerprint=None, now=None):
+        """ Store the result for key, or release it if result is None
+
+        The key keeps the bucket and fingerprint it was claimed with, so the
+        ttl runs from the start of the first request.
+        """
+        if now is None:
+            now = time.time()
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if result is None:
+                self._entries.pop(key, None)
+            elif entry is not None:
+                self._entries[key] = (entry[0], result, entry[2])
+            else:
+                self._store(key, result, fingerprint, now)
+        finally:
+            self._lock.release()
+
+
+def scoped_key(key, appname, environ):
+    """ Return the cache key for an X-Idempotency-Key
+
+    Keys are only unique to a client, so the cache key also holds the
+    x-key-id the request was signed with (or the client address) and the
+    appname it logs for.
+    """
+    return (environ.get("HTTP_X_KEY_ID") or environ.get("REMOTE_ADDR"),
+            appname, key)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def default_cache(config=None):
+    """ Return the shared IdempotencyCache, created on first use """
+    global _default_cache
+    if _default_cache is None:
+        _default_lock.acquire()
+        try:
+            if _default_cache is None:
+                oconfig = config
+                if oconfig is None:
+                    oconfig = ocelog.config.Config()
+                _default_cache = IdempotencyCache(oconfig.idempotency.ttl,
+                        oconfig.idempotency.max_entries)
+        finally:
+            _default_lock.release()
+    return _default_cache
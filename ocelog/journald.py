@@ -0,0 +1,195 @@
+""" ocelog.journald - write messages to the systemd journal's native socket """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import errno
+import socket
+import struct
+import threading
+import time
+
+import ocelog.config
+from ocelog.writer import facility_codes
+from ocelog.writer import priority_codes
+
+
+# an oversized entry is cut down to this fraction of its message per attempt
+_TRUNCATE_FACTOR = 0.5
+# and gives up below this many bytes of message
+_MIN_TRUNCATED_MSG = 1024
+# a send refused for want of buffer space (ENOBUFS) is tried this many more
+# times, waiting this many seconds longer before each
+_NOBUFS_RETRIES = 3
+_NOBUFS_DELAY = 0.01
+
+
+def _field(name, value):
+    """ Return one journal field in the native protocol's encoding
+
+    Values without a newline are sent as NAME=value.  Others are sent as the
+    name, a newline, the value's length as a little-endian 64 bit integer,
+    the value, and a newline.
+    """
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    if "\n" in value:
+        return "%s\n%s%s\n" % (name, struct.pack("<Q", len(value)), value)
+    return "%s=%s\n" % (name, value)
+
+
+class JournaldWriter(object):
+    """ Accept Message() objects and send them to journald as native entries
+
+    Each message becomes one datagram on a long-lived AF_UNIX socket
+    connected to journald, holding the fields MESSAGE, PRIORITY,
+    SYSLOG_FACILITY, SYSLOG_IDENTIFIER (the appname) and OCELOG_SOURCE_HOST
+    (the hostname), so the structure survives into the journal.
+
+    journald's own clients pass entries too large for one datagram in a
+    memfd over SCM_RIGHTS, but Python 2 has no socket.sendmsg().  Instead an
+    oversized entry has its MESSAGE truncated until it fits, and is marked
+    with OCELOG_TRUNCATED=1.
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwds):
+        """ Enforce singleton behavior """
+        if cls._instance is None:
+            cls._instance = object.__new__(cls)
+        return cls._instance
+
+    def __init__(self, config=None):
+        """ Initialize the JournaldWriter and prepare for writing
+
+        The optional config is a Config or ConfigSnapshot; Config() is used
+        if none is given.  It is only bound when the writer is first created,
+        so requests in flight never see it change; see reload().
+        """
+        if self._initialized is False:
+            if config is None:
+                config = ocelog.config.Config()
+            self.config = config
+            self._lock = threading.Lock()
+            self._sock = None
+            self._sock_path = None
+            self._initialized = True
+
+    def reload(self, config=None):
+        """ Use config, or the published snapshot, for the writes that follow """
+        if config is None:
+            config = ocelog.config.current()
+        self.config = config
+
+    def _connect(self):
+        """ (Re)connect the datagram socket to the configured journal socket """
+        self._lock.acquire()
+        try:
+            self.close()
+            path = self.config.journald.socket_path
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                sock.connect(path)
+            except socket.error:
+                sock.close()
+                raise
+            self._sock = sock
+            self._sock_path = path
+            return sock
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """ Close the journal socket if it is open """
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+
+    def format(self, message, msg=None, truncated=False):
+        """ Return the native journal entry for a message
+
+        msg replaces the message's msg, and truncated adds OCELOG_TRUNCATED.
+        """
+        if msg is None:
+            msg = message.msg
+        fields = [
+            _field("MESSAGE", msg),
+            "PRIORITY=%d\n" % priority_codes[message.priority],
+            "SYSLOG_FACILITY=%d\n" % facility_codes[message.facility],
+            _field("SYSLOG_IDENTIFIER", message.appname),
+            _field("OCELOG_SOURCE_HOST", message.hostname),
+            ]
+        if truncated:
+            fields.append("OCELOG_TRUNCATED=1\n")
+        return "".join(fields)
+
+    def write(self, message):
+        """ Accept ocelog.message.Message and send it to the journal """
+        try:
+            entry = self.format(message)
+        except:
+            return False
+        result = self.send(entry)
+        if result is not None:
+            return result
+        # too large for one datagram: shrink the message until it fits
+        msg = message.msg
+        if isinstance(msg, unicode):
+            msg = msg.encode("utf-8")
+        while len(msg) > _MIN_TRUNCATED_MSG:
+            msg = msg[:int(len(msg) * _TRUNCATE_FACTOR)]
+            result = self.send(self.format(message, msg, truncated=True))
+            if result is not None:
+                return result
+        return False
+
+    def send(self, entry):
+        """ Send one entry, reconnecting once if the send fails
+
+        Returns True or False, or None if the entry is too large to send as
+        a single datagram (EMSGSIZE).  A shortage of buffer space (ENOBUFS)
+        passes, so the send is tried again a few times, and then fails; the
+        entry isn't cut down for it.
+        """
+        reconnected = False
+        shortages = 0
+        while True:
+            try:
+                sock = self._sock
+                # a reloaded config may point at a different socket
+                if sock is None or \
+                        self._sock_path != self.config.journald.socket_path:
+                    sock = self._connect()
+                sock.send(entry)
+                return True
+            except socket.error, e:
+                code = e.args and e.args[0]
+                if code == errno.EMSGSIZE:
+                    return None
+                if code == errno.ENOBUFS:
+                    if shortages == _NOBUFS_RETRIES:
+                        return False
+                    shortages += 1
+                    time.sleep(_NOBUFS_DELAY * shortages)
+                    continue
+                self.close()
+                # one retry with a fresh connection covers a restarted journald
+                if reconnected:
+                    return False
+                reconnected = True
@@ -0,0 +1,252 @@
+""" ocelog.lean - the ocelog routes as a wsgi application without bottle
+
+The application is available as: ocelog.lean.application
+
+It answers every request exactly as ocelog.wsgi.application does, down to
+the status lines, the header names and the error pages, but it answers
+from precomputed status lines and header lists.  Bottle's thread-local
+request and response, its header wrapper, cookies and output casting are
+skipped entirely.
+"""
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import mimetypes
+import os
+import os.path
+import time
+import traceback
+
+import ocelog.bottle
+from ocelog.bottle import HTTP_CODES
+from ocelog.bottle import HTTP_ERROR_TEMPLATE
+from ocelog.bottle import TRACEBACK_TEMPLATE
+from ocelog.bottle import parse_date
+import ocelog.handlers
+import ocelog.metrics
+import ocelog.routing
+
+
+file_path = os.path.dirname(os.path.abspath(__file__))
+doc_path = os.path.normpath(os.path.join(file_path, "../doc/"))
+
+# bottle predates 422 (rfc 4918) and 429 (rfc 6585)
+HTTP_CODES.setdefault(422, "UNPROCESSABLE ENTITY")
+HTTP_CODES.setdefault(429, "TOO MANY REQUESTS")
+
+# the status line of every code, as bottle formats it
+status_lines = dict((code, "%d %s" % (code, reason))
+        for code, reason in HTTP_CODES.iteritems())
+
+# the headers of an empty reply, which is most of them
+_EMPTY_HEADERS = (("Content-Type", "text/html"), ("Content-Length", "0"))
+_METRICS_TYPE = "text/plain; version=0.0.4"
+
+# rfc2616 section 4.3: these are sent without a body, as is any HEAD response
+_BODILESS = (100, 101, 204, 304)
+
+
+def error_page(status, path, error_msg):
+    """ Return the html page bottle sends for an error """
+    return HTTP_ERROR_TEMPLATE % {
+        'status': status,
+        'url': path,
+        'error_name': HTTP_CODES.get(status, 'Unknown').title(),
+        'error_message': error_msg,
+        }
+
+def error_reply(status, path, error_msg):
+    """ Return the status, headers and body of bottle's error page """
+    body = error_page(status, path, error_msg)
+    return status, [("Content-Type", "text/html"),
+            ("Content-Length", str(len(body)))], body
+
+def reply_headers(reply):
+    """ Return the wsgi headers of an ocelog.handlers.Reply
+
+    A handler's header replaces any earlier one of the same name, and names
+    are title cased, as bottle's response does it.
+    """
+    if not reply.headers and not reply.body:
+        return list(_EMPTY_HEADERS)
+    headers = [("Content-Type", "text/html")]
+    for name, value in reply.headers:
+        lower = name.lower()
+        headers = [h for h in headers if h[0].lower() != lower]
+        headers.append((name.title(), str(value)))
+    headers.append(("Content-Length", str(len(reply.body))))
+    return headers
+
+
+class StaticFile(object):
+    """ A file sent as bottle's send_file() sends it
+
+    The file is read again only when its size or modification time changes.
+    """
+
+    def __init__(self, filename, root):
+        """ Initialize the object for the file at root/filename """
+        root = os.path.abspath(root) + os.sep
+        self.path = os.path.abspath(os.path.join(root, filename.strip('/\\')))
+        self.mimetype = mimetypes.guess_type(self.path)[0] or "text/plain"
+        # ((st_mtime, st_size), st_mtime, headers, content) of the last read
+        self._cached = None
+
+    def send(self, environ, path):
+        """ Return the status, headers and body of a response with the file """
+        try:
+            stats = os.stat(self.path)
+        except OSError:
+            stats = None
+        if stats is None or not os.path.isfile(self.path):
+            return error_reply(404, path, "File does not exist.")
+        cached = self._cached
+        if cached is None or cached[0] != (stats.st_mtime, stats.st_size):
+            try:
+                content = open(self.path, 'rb').read()
+            except IOError:
+                return error_reply(401, path,
+                        "You do not have permission to access this file.")
+            last_modified = time.strftime("%a, %d %b %Y %H:%M:%S GMT",
+                    time.gmtime(stats.st_mtime))
+            headers = (("Content-Type", self.mimetype),
+                    ("Last-Modified", last_modified),
+                    ("Content-Length", str(len(content))))
+            cached = ((stats.st_mtime, stats.st_size), stats.st_mtime,
+                    headers, content)
+            self._cached = cached
+        stamp, mtime, headers, content = cached
+        if 'HTTP_IF_MODIFIED_SINCE' in environ:
+            # IE sends "<date>; length=146"
+            ims = environ['HTTP_IF_MODIFIED_SINCE'].split(";")[0].strip()
+            ims = parse_date(ims)
+            if ims is not None and ims >= mtime:
+                # bottle sends the length of the error page it didn't send
+                return 304, list(headers[:2]) + [("Content-Length",
+                        str(len(error_page(304, path, "Not modified"))))], ""
+        return 200, list(headers), content
+
+
+class LeanApplication(object):
+    """ The wsgi application serving the ocelog routes
+
+    Routes are matched by an ocelog.routing.Router, as bottle would match
+    them.  A path with routes for other methods gets a 405, and anything
+    else gets bottle's 404 page.
+    """
+
+    def __init__(self):
+        """ Initialize the object and compile its routes """
+        self.help_doc = StaticFile("help.htm", doc_path)
+        self.router = ocelog.routing.Router()
+        self.add_route("GET", "/", self.show_help_doc)
+        self.add_route("GET", "/log", self.show_help_doc)
+        self.add_route("POST", "/log", self.log)
+        self.add_route("POST", "/log/batch", self.log_batch)
+        self.add_route("GET", "/metrics", self.show_metrics)
+        self.router.compile()
+
+    def add_route(self, method, path, handler):
+        """ Route method requests for path to handler(environ, path)
+
+        Parameters of the path are passed as keyword arguments, and the
+        handler returns the status, the wsgi headers and the body.
+        """
+        self.router.add(path, handler, method=method)
+
+    def __call__(self, environ, start_response):
+        """ The wsgi interface """
+        path = environ.get('PATH_INFO', '/').strip()
+        if not path.startswith('/'):
+            path = '/' + path
+        method = environ.get('REQUEST_METHOD', 'GET').upper()
+        try:
+            handler, args = self.router.match(path, method)
+            if handler is not None:
+                status, headers, body = handler(environ, path, **args)
+            else:
+                allowed = self.router.allowed(path)
+                if allowed:
+                    status, headers, body = self.invalid_method(environ, path,
+                            allowed)
+                else:
+                    status, headers, body = error_reply(404, path, "Not found")
+            if not body or method == 'HEAD' or status in _BODILESS:
+                output = []
+            else:
+                output = [body]
+        except (KeyboardInterrupt, SystemExit, MemoryError):
+            raise
+        except Exception, e:
+            err = "Unhandled Exception: %s\n" % (repr(e))
+            if ocelog.bottle.DEBUG:
+                err += TRACEBACK_TEMPLATE % traceback.format_exc(10)
+            status, headers = 500, [("Content-Type", "text/html")]
+            output = [error_page(500, path, err)]
+            environ['wsgi.errors'].write(err)
+        start_response(status_lines[status], headers)
+        return output
+
+    #--------------------------------------------------------------------------
+    # handlers
+    #--------------------------------------------------------------------------
+    def show_help_doc(self, environ, path):
+        """ Return a help page to the user """
+        return self.help_doc.send(environ, path)
+
+    def log(self, environ, path):
+        """ Accept a message and send it to syslog (see ocelog.handlers.log) """
+        return self.timed(ocelog.handlers.log, environ, path)
+
+    def log_batch(self, environ, path):
+        """ Accept many messages in one request and send them to syslog
+
+        See ocelog.handlers.log_batch.
+        """
+        return self.timed(ocelog.handlers.log_batch, environ, path)
+
+    def invalid_method(self, environ, path, allowed):
+        """ Return a 405 for invalid methods on valid uris """
+        ocelog.metrics.RequestTimer(path).finish(405)
+        return 405, [("Content-Type", "text/html"),
+                ("Allow", ", ".join(allowed)), ("Content-Length", "0")], ""
+
+    def show_metrics(self, environ, path):
+        """ Return the request counters and latencies in prometheus text format """
+        body = ocelog.metrics.render_prometheus()
+        return 200, [("Content-Type", _METRICS_TYPE),
+                ("Content-Length", str(len(body)))], body
+
+    def timed(self, handler, environ, path):
+        """ Run an ocelog.handlers handler with an ocelog.metrics.RequestTimer
+
+        The whole request is recorded under the reply status, or under 200 if
+        the handler raised, as ocelog.wsgi.timed records it.
+        """
+        timer = ocelog.metrics.RequestTimer(path)
+        status = 200
+        try:
+            reply = ocelog.handlers.admitted(handler, environ, timer)
+            status = reply.status
+        finally:
+            timer.finish(status)
+        return status, reply_headers(reply), reply.body
+
+
+# make the wsgi application available for servers to access
+application = LeanApplication()
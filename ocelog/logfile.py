@@ -0,0 +1,240 @@
+""" ocelog.logfile - write messages to a buffered, rotated local file """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import atexit
+import os
+import os.path
+import threading
+import time
+
+import ocelog.config
+
+
+class FileWriter(object):
+    """ Accept Message() objects and append them as lines to a local file
+
+    The file is opened once and written through a userspace buffer of
+    file.buffer_size bytes, so most writes are a memory copy.  Each message
+    is one line:
+
+        2010-10-18T18:34:56.250000Z webhost1 app1 local3.err: the message
+
+    with any newline in the message written as a literal \\n.
+
+    The file is rotated once it would grow past file.rotate_size bytes, or
+    when a file.rotate_interval boundary (counted from the epoch, so a daily
+    interval rotates at midnight utc) is crossed.  Rotation flushes and
+    syncs the file, then renames it to path.YYYYmmdd-HHMMSS; the rename is
+    atomic, so the current path always names a complete file.
+
+    The file.fsync policy decides how often the buffer is flushed and the
+    file synced to disk:
+        records  - after every file.fsync_records records
+        interval - every file.fsync_interval seconds, from a background thread
+        shutdown - only on rotation and close(), which is run at exit
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwds):
+        """ Enforce singleton behavior """
+        if cls._instance is None:
+            cls._instance = object.__new__(cls)
+        return cls._instance
+
+    def __init__(self, config=None):
+        """ Initialize the FileWriter; the file is opened on the first write
+
+        The optional config is a Config or ConfigSnapshot; Config() is used
+        if none is given.  It is only bound when the writer is first created,
+        so requests in flight never see it change; see reload().
+        """
+        if self._initialized is False:
+            if config is None:
+                config = ocelog.config.Config()
+            self.config = config
+            self._lock = threading.Lock()
+            self._file = None
+            self._path = None
+            self._size = 0
+            self._rotate_at = None
+            self._unsynced = 0
+            self._flusher = None
+            self._stamp = (None, None)
+            self._initialized = True
+            atexit.register(self.close)
+
+    def reload(self, config=None):
+        """ Use config, or the published snapshot, for the writes that follow """
+        if config is None:
+            config = ocelog.config.current()
+        self.config = config
+
+    #--------------------------------------------------------------------------
+    # formatting
+    #--------------------------------------------------------------------------
+    def _timestamp(self, now):
+        """ Return the utc timestamp, with the seconds formatted once per second """
+        second = int(now)
+        cached_second, stamp = self._stamp
+        if second != cached_second:
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._stamp = (second, stamp)
+        return "%s.%06dZ" % (stamp, int((now - second) * 1000000))
+
+    def format(self, message, now=None):
+        """ Return the line for a message """
+        if now is None:
+            now = time.time()
+        msg = message.msg
+        if "\n" in msg:
+            msg = msg.replace("\\", "\\\\").replace("\n", "\\n")
+        line = "%s %s %s %s.%s: %s\n" % (self._timestamp(now), message.hostname,
+                message.appname, message.facility, message.priority, msg)
+        if isinstance(line, unicode):
+            line = line.encode("utf-8")
+        return line
+
+    #--------------------------------------------------------------------------
+    # writing
+    #--------------------------------------------------------------------------
+    def write(self, message):
+        """ Accept ocelog.message.Message and append it to the file """
+        return self.write_batch([message])[0]
+
+    def write_batch(self, messages):
+        """ Append a list of messages in one write and return a list of results """
+        now = time.time()
+        lines = []
+        results = []
+        for message in messages:
+            try:
+                lines.append(self.format(message, now))
+                results.append(True)
+            except:
+                results.append(False)
+        if lines and not self._append("".join(lines), len(lines), now):
+            results = [False] * len(results)
+        return results
+
+    def _append(self, data, records, now):
+        """ Append data holding records lines, rotating and syncing as needed """
+        settings = self.config.file
+        self._lock.acquire()
+        try:
+            try:
+                if self._file is None or self._path != settings.path:
+                    self._open(settings, now)
+                elif (settings.rotate_size and
+                        self._size + len(data) > settings.rotate_size and
+                        self._size > 0) or \
+                        (self._rotate_at is not None and now >= self._rotate_at):
+                    self._rotate(settings, now)
+                self._file.write(data)
+                self._size += len(data)
+                self._unsynced += records
+                if settings.fsync == "records" and \
+                        self._unsynced >= settings.fsync_records:
+                    self._sync()
+                return True
+            except (IOError, OSError):
+                self._close()
+                return False
+        finally:
+            self._lock.release()
+
+    def _open(self, settings, now):
+        """ Open (appending to) the configured file (lock held) """
+        self._close()
+        directory = os.path.dirname(settings.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._file = open(settings.path, "ab", settings.buffer_size)
+        self._path = settings.path
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._rotate_at = None
+        if settings.rotate_interval:
+            self._rotate_at = (int(now / settings.rotate_interval) + 1) * \
+                    settings.rotate_interval
+        if settings.fsync == "interval" and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_periodically,
+                    name="ocelog-file-flusher")
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def _rotate(self, settings, now):
+        """ Sync and rename the current file, then open a new one (lock held) """
+        self._close()
+        rotated = "%s.%s" % (settings.path,
+                time.strftime("%Y%m%d-%H%M%S", time.gmtime(now)))
+        candidate = rotated
+        suffix = 1
+        while os.path.exists(candidate):
+            candidate = "%s.%d" % (rotated, suffix)
+            suffix += 1
+        os.rename(settings.path, candidate)
+        self._open(settings, now)
+
+    def _sync(self):
+        """ Flush the buffer and fsync the file (lock held) """
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _close(self):
+        """ Sync and close the file if it is open (lock held) """
+        log_file, self._file = self._file, None
+        if log_file is not None:
+            try:
+                log_file.flush()
+                os.fsync(log_file.fileno())
+            finally:
+                log_file.close()
+        self._unsynced = 0
+
+    def _flush_periodically(self):
+        """ Background loop for the interval policy """
+        while True:
+            time.sleep(self.config.file.fsync_interval)
+            self.sync()
+
+    def sync(self):
+        """ Flush the buffer and fsync the file if anything was written """
+        self._lock.acquire()
+        try:
+            if self._unsynced:
+                try:
+                    self._sync()
+                except (IOError, OSError):
+                    self._close()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """ Flush, sync and close the file; the next write opens it again """
+        self._lock.acquire()
+        try:
+            try:
+                self._close()
+            except (IOError, OSError):
+                pass
+        finally:
+            self._lock.release()
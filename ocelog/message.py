@@ -18,20 +18,23 @@ limitations under the License.
 
 
 import ocelog.config
+import ocelog.form
 
 
-def parse_request(request):
+def parse_request(request, config=None):
     """ Accept a bottle.request object and return a Message object
 
     This function is responsible for taking an incoming HTTP request, 
     extracting the request components, and returning a Message object.
 
     Currently, the parser expects application/x-www-form-urlencoded data in 
-    an HTTP POST.  The data is automatically extracted by bottle and placed
-    in bottle.request.POST.  In the future, the parser may allow for xml or 
-    other data formats in the body.
+    an HTTP POST.  The data is extracted by bottle into bottle.request.POST,
+    or, on the /log hot path, by ocelog.form.LogRequest which offers the same 
+    POST attribute.  In the future, the parser may allow for xml or other 
+    data formats in the body.
 
-    The parser performs no validation.
+    The parser performs no validation.  The optional config (a Config or a
+    ConfigSnapshot) is passed on to the Message.
     """
     hostname = request.POST.get("hostname")
     if hostname is None:
@@ -40,7 +43,52 @@ def parse_request(request):
     msg = request.POST.get("msg", None)
     facility = request.POST.get("facility")
     priority = request.POST.get("priority")
-    return Message(hostname, appname, msg, facility, priority)
+    return Message(hostname, appname, msg, facility, priority, config)
+
+def parse_batch_request(request, body, config=None):
+    """ Accept a bottle.request and its raw body and return a list of Messages
+
+    The body holds one x-www-form-urlencoded record per line, with the same 
+    fields accepted by parse_request.  Blank lines are skipped.  Each record 
+    becomes a Message (and so is validated) in the order it was sent.  A 
+    record rejected by ocelog.form becomes an invalid Message carrying the 
+    form's error message.
+    """
+    remote_addr = request.environ['REMOTE_ADDR']
+    messages = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            fields = ocelog.form.parse_fields(line.strip())
+        except ocelog.form.FormException, e:
+            message = Message(None, None, None, config=config)
+            message.error_msg = e.error_msg
+            messages.append(message)
+            continue
+        hostname = fields.get("hostname")
+        if hostname is None:
+            hostname = remote_addr
+        messages.append(Message(hostname, fields.get("appname"), 
+                fields.get("msg"), fields.get("facility"), 
+                fields.get("priority"), config))
+    return messages
+
+def write_batch(messages, writer):
+    """ Write a list of valid messages in one pass and set each status
+
+    If the writer has a write_batch() method, it is given the whole list at 
+    once.  Otherwise each message is written individually.
+    """
+    writer_batch = getattr(writer, "write_batch", None)
+    if writer_batch is None:
+        for message in messages:
+            message.write(writer)
+        return
+    results = writer_batch(messages)
+    for message, retval in zip(messages, results):
+        message._set_write_status(retval)
+    return
 
 
 class MessageException(Exception):
@@ -74,6 +122,9 @@ class Message(object):
     optional message data:
       facility - an overriding syslog facility
       priority - an overriding syslog priority
+    optional externals:
+      config - a Config or ConfigSnapshot to take defaults from (Config() is
+        used if none is given)
     """
 
     valid_facilities = ("auth", "authpriv", "cron", "daemon", "ftp", "kern",
@@ -83,10 +134,13 @@ class Message(object):
     valid_priorities = ("emerg", "alert", "crit", "err", "warning", "notice",
         "info", "debug")
 
-    def __init__(self, hostname, appname, msg, facility=None, priority=None):
+    def __init__(self, hostname, appname, msg, facility=None, priority=None,
+            config=None):
         """ Validate and Authenticate the message """
         # get externals
-        self.config = ocelog.config.Config()
+        if config is None:
+            config = ocelog.config.Config()
+        self.config = config
         # set defaults
         self.valid = False
         self.status = None
@@ -141,6 +195,11 @@ class Message(object):
     def write(self, writer):
         """ Write the message to all enabled writers """
         retval = writer.write(self)
+        self._set_write_status(retval)
+        return
+
+    def _set_write_status(self, retval):
+        """ Set the status and error_msg from a writer's return value """
         if retval == True:
             self.status = "success"
         else:
@@ -0,0 +1,271 @@
+""" ocelog.metrics - request counters and latency histograms """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import math
+import threading
+import time
+import weakref
+
+
+# each power of two (in microseconds) is split into this many buckets
+SUB_BUCKETS = 4
+# enough buckets for latencies up to 2**40 microseconds (about 12 days)
+NUM_BUCKETS = 41 * SUB_BUCKETS
+
+quantiles = (0.5, 0.99, 0.999)
+
+
+class Histogram(object):
+    """ A log-bucketed latency histogram
+
+    Latencies are counted in buckets that grow geometrically: every power of
+    two microseconds is split into SUB_BUCKETS equal buckets, so a reported
+    quantile is within 25% of the true value at any scale.  Recording is a
+    frexp() and an increment.
+    """
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        """ Start with every bucket empty """
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        """ Count one latency, given in seconds """
+        micros = seconds * 1000000.0
+        if micros < 1:
+            index = 0
+        else:
+            mantissa, exponent = math.frexp(micros)
+            index = exponent * SUB_BUCKETS + \
+                    int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+            if index >= NUM_BUCKETS:
+                index = NUM_BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other):
+        """ Add the counts of another histogram to this one """
+        counts = list(other.counts)
+        for i in range(NUM_BUCKETS):
+            self.counts[i] += counts[i]
+        self.count += other.count
+        self.total += other.total
+
+    def quantile(self, q):
+        """ Return the upper bound (seconds) of the bucket holding quantile q """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in range(NUM_BUCKETS):
+            seen += self.counts[index]
+            if seen >= rank:
+                return bucket_upper_bound(index)
+        return bucket_upper_bound(NUM_BUCKETS - 1)
+
+def bucket_upper_bound(index):
+    """ Return the upper bound, in seconds, of a histogram bucket """
+    if index == 0:
+        return 0.000001
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    micros = 2.0 ** (exponent - 1) * (1 + float(sub + 1) / SUB_BUCKETS)
+    return micros / 1000000.0
+
+
+class _ThreadStats(object):
+    """ The counters and histograms recorded by a single thread
+
+    Only the owning thread writes to its stats, so recording needs no lock.
+    Readers merge the stats of every thread; they copy each container before
+    walking it, so a concurrent update is never seen half done.
+    """
+
+    __slots__ = ("histograms", "counters")
+
+    def __init__(self):
+        """ Start empty """
+        self.histograms = {}
+        self.counters = {}
+
+
+class _Owner(object):
+    """ Kept in a thread's local storage next to its stats
+
+    The thread's local storage is dropped when the thread exits, and the
+    weak reference to this object then retires the thread's stats.
+    """
+
+    __slots__ = ("__weakref__",)
+
+
+_local = threading.local()
+# weak reference to each live thread's _Owner: that thread's stats
+_all_stats = {}
+# everything recorded by threads that have exited
+_retired = _ThreadStats()
+_all_stats_lock = threading.Lock()
+
+def _merge_stats(into, stats):
+    """ Add the counters and histograms of stats to into """
+    for key, histogram in stats.histograms.items():
+        if key not in into.histograms:
+            into.histograms[key] = Histogram()
+        into.histograms[key].merge(histogram)
+    for key, value in stats.counters.items():
+        into.counters[key] = into.counters.get(key, 0) + value
+
+def _retire(owner_ref):
+    """ Fold the stats of a thread that has exited into the retired stats
+
+    Threads come and go with some servers (one per connection or request),
+    so their stats can't be kept apart for the life of the process.
+    """
+    _all_stats_lock.acquire()
+    try:
+        stats = _all_stats.pop(owner_ref, None)
+        if stats is not None:
+            _merge_stats(_retired, stats)
+    finally:
+        _all_stats_lock.release()
+
+def _thread_stats():
+    """ Return the calling thread's stats, registering them on first use """
+    stats = getattr(_local, "stats", None)
+    if stats is None:
+        stats = _ThreadStats()
+        owner = _Owner()
+        _all_stats_lock.acquire()
+        try:
+            _all_stats[weakref.ref(owner, _retire)] = stats
+        finally:
+            _all_stats_lock.release()
+        _local.owner = owner
+        _local.stats = stats
+    return stats
+
+def record(metric, labels, seconds):
+    """ Record a latency in the histogram for metric and its labels
+
+    labels is a tuple of (name, value) pairs, e.g. (("stage", "write"),).
+    """
+    histograms = _thread_stats().histograms
+    key = (metric, labels)
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = Histogram()
+    histogram.record(seconds)
+
+def count(metric, labels, amount=1):
+    """ Add to the counter for metric and its labels """
+    counters = _thread_stats().counters
+    key = (metric, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+def collect():
+    """ Return (histograms, counters) merged across every thread """
+    merged = _ThreadStats()
+    _all_stats_lock.acquire()
+    try:
+        all_stats = _all_stats.values()
+        _merge_stats(merged, _retired)
+    finally:
+        _all_stats_lock.release()
+    for stats in all_stats:
+        _merge_stats(merged, stats)
+    return (merged.histograms, merged.counters)
+
+def reset():
+    """ Discard everything recorded so far """
+    _all_stats_lock.acquire()
+    try:
+        for stats in _all_stats.values() + [_retired]:
+            stats.histograms.clear()
+            stats.counters.clear()
+    finally:
+        _all_stats_lock.release()
+
+
+class RequestTimer(object):
+    """ Time the stages of one request
+
+    stage() records the time since the previous mark (or since the timer was
+    created) as the latency of the named stage.  finish() records the latency
+    of the whole request by status code and counts the response.
+    """
+
+    __slots__ = ("route", "started", "mark")
+
+    def __init__(self, route):
+        """ Start timing a request to route """
+        self.route = route
+        self.started = self.mark = time.time()
+
+    def stage(self, name):
+        """ Record the time spent in the stage that just ended """
+        now = time.time()
+        record("ocelog_stage_latency_seconds",
+                (("route", self.route), ("stage", name)), now - self.mark)
+        self.mark = now
+
+    def finish(self, status):
+        """ Record the whole request and count its status code """
+        now = time.time()
+        labels = (("route", self.route), ("code", str(status)))
+        record("ocelog_request_latency_seconds", labels, now - self.started)
+        count("ocelog_responses_total", labels)
+
+
+def _format_labels(labels):
+    """ Return labels in prometheus {name="value",...} form """
+    if not labels:
+        return ""
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+            for name, value in labels]
+    return "{%s}" % ",".join(pairs)
+
+def render_prometheus():
+    """ Return every metric in the prometheus text exposition format
+
+    Histograms are exposed as summaries with the p50, p99 and p999 latencies.
+    """
+    histograms, counters = collect()
+    lines = []
+    for metric in sorted(set(key[0] for key in histograms)):
+        lines.append("# TYPE %s summary" % metric)
+        for key in sorted(k for k in histograms if k[0] == metric):
+            histogram = histograms[key]
+            labels = key[1]
+            for q in quantiles:
+                lines.append("%s%s %.6f" % (metric,
+                    _format_labels(labels + (("quantile", str(q)),)),
+                    histogram.quantile(q)))
+            lines.append("%s_sum%s %.6f" % (metric, _format_labels(labels),
+                    histogram.total))
+            lines.append("%s_count%s %d" % (metric, _format_labels(labels),
+                    histogram.count))
+    for metric in sorted(set(key[0] for key in counters)):
+        lines.append("# TYPE %s counter" % metric)
+        for key in sorted(k for k in counters if k[0] == metric):
+            lines.append("%s%s %d" % (metric, _format_labels(key[1]),
+                    counters[key]))
+    return "\n".join(lines) + "\n"
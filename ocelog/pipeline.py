@@ -0,0 +1,310 @@
+""" ocelog.pipeline - fan-out of each message to every enabled writer """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import atexit
+import Queue
+import threading
+import time
+
+import ocelog.config
+import ocelog.journald
+import ocelog.logfile
+import ocelog.metrics
+import ocelog.remote
+import ocelog.spool
+import ocelog.writer
+
+
+#-----------------------------------------------------------------------------
+# writer registry
+#-----------------------------------------------------------------------------
+def _syslog_writer(config):
+    """ Return the local syslog writer, behind the spool if it is enabled """
+    if config.spool.enabled:
+        return ocelog.spool.default_writer(config)
+    return ocelog.writer.SocketSyslogWriter(config)
+
+# writer name -> factory(config) returning the writer; every name here is
+# also accepted by the writers config options (see register())
+writer_factories = {
+    "syslog": _syslog_writer,
+    "remote": ocelog.remote.RemoteSyslogWriter,
+    "journald": ocelog.journald.JournaldWriter,
+    "file": ocelog.logfile.FileWriter,
+    }
+
+def register(name, factory):
+    """ Make a writer available to the pipeline under name
+
+    The name is accepted in writers.enabled and writers.required from then
+    on, so a writer has to be registered before the config file is read.
+    """
+    writer_factories[name] = factory
+    ocelog.config.register_writer(name)
+
+
+#-----------------------------------------------------------------------------
+# dispatch
+#-----------------------------------------------------------------------------
+class Ticket(object):
+    """ The combined result of one message from its required writers
+
+    A ticket counts down once for every required writer.  It succeeds only
+    if every required writer succeeded; the first failure settles it.
+    """
+
+    __slots__ = ("_remaining", "_success", "_done", "_lock")
+
+    def __init__(self, required):
+        """ Expect a result from required writers """
+        self._remaining = required
+        self._success = True
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        if required == 0:
+            self._done.set()
+
+    def result(self, success):
+        """ Record the result from one required writer """
+        self._lock.acquire()
+        try:
+            self._remaining -= 1
+            if not success:
+                self._success = False
+            if self._remaining <= 0 or not success:
+                self._done.set()
+        finally:
+            self._lock.release()
+
+    def wait(self, timeout):
+        """ Return True if every required writer succeeded within timeout """
+        if not self._done.isSet():
+            self._done.wait(max(timeout, 0))
+        self._lock.acquire()
+        try:
+            return self._done.isSet() and self._success
+        finally:
+            self._lock.release()
+
+
+# placed on a lane's queue to ask its worker to exit
+_STOP = object()
+
+
+class _Lane(object):
+    """ One writer with its own bounded queue and worker thread
+
+    The worker takes whatever is queued, up to batch_size messages, and
+    hands it to the writer's write_batch() if it has one, or write()
+    otherwise.  It never waits for a batch to fill, so a lone message is
+    written as soon as it arrives.
+    """
+
+    def __init__(self, name, writer, required, max_depth=10000, batch_size=100):
+        """ Initialize the queue; the worker is started by start() """
+        self.name = name
+        self.writer = writer
+        self.required = required
+        self.batch_size = batch_size
+        self.queue = Queue.Queue(max_depth)
+        self._thread = None
+
+    def start(self):
+        """ Start the worker thread """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._drain,
+                    name="ocelog-writer-%s" % self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def submit(self, message, ticket):
+        """ Queue a message, returning False if the queue is full """
+        try:
+            self.queue.put_nowait((message, ticket))
+            return True
+        except Queue.Full:
+            return False
+
+    def close(self):
+        """ Write everything already queued and stop the worker """
+        if self._thread is not None:
+            self.queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _drain(self):
+        """ Worker loop: write batches until a stop marker is seen """
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                self._write_batch(batch)
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        """ Write a batch of (message, ticket) and settle each ticket """
+        messages = [message for message, ticket in batch]
+        write_batch = getattr(self.writer, "write_batch", None)
+        try:
+            if write_batch is not None:
+                results = write_batch(messages)
+            else:
+                results = [self.writer.write(message) for message in messages]
+        except:
+            results = [False] * len(messages)
+        written = 0
+        for (message, ticket), success in zip(batch, results):
+            if success == True:
+                written += 1
+            if ticket is not None:
+                ticket.result(success == True)
+        labels = (("writer", self.name), ("result", "written"))
+        ocelog.metrics.count("ocelog_writer_messages_total", labels, written)
+        labels = (("writer", self.name), ("result", "failed"))
+        ocelog.metrics.count("ocelog_writer_messages_total", labels,
+                len(batch) - written)
+
+
+class Pipeline(object):
+    """ Dispatch each message to several writers in parallel
+
+    Every writer gets its own _Lane, so a slow writer only backs up its own
+    queue.  write() returns True once every required writer has written the
+    message, or False if one failed, its queue was full, or timeout seconds
+    passed first.  Best-effort writers never hold up the result; a message
+    they can't queue is dropped and counted.  With no required writers,
+    write() succeeds as soon as the message is queued.
+    """
+
+    def __init__(self, lanes, timeout=5.0):
+        """ Dispatch to lanes; the workers are started by start() """
+        self.lanes = lanes
+        self.timeout = timeout
+        self.required = len([lane for lane in lanes if lane.required])
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Start a worker for every lane """
+        self._lock.acquire()
+        try:
+            if self._started:
+                return
+            for lane in self.lanes:
+                lane.start()
+            self._started = True
+            atexit.register(self.close)
+        finally:
+            self._lock.release()
+
+    def dispatch(self, message):
+        """ Queue a message on every lane and return its Ticket """
+        ticket = Ticket(self.required)
+        for lane in self.lanes:
+            if lane.required:
+                if not lane.submit(message, ticket):
+                    ticket.result(False)
+            elif not lane.submit(message, None):
+                ocelog.metrics.count("ocelog_writer_messages_total",
+                        (("writer", lane.name), ("result", "dropped")))
+        return ticket
+
+    def write(self, message):
+        """ Write a message to every writer and return the combined result """
+        return self.dispatch(message).wait(self.timeout)
+
+    def write_batch(self, messages):
+        """ Write a list of messages and return a list of results
+
+        Every message is dispatched before waiting on any of them, and the
+        whole batch shares one timeout.
+        """
+        tickets = [self.dispatch(message) for message in messages]
+        deadline = time.time() + self.timeout
+        return [ticket.wait(deadline - time.time()) for ticket in tickets]
+
+    def load(self):
+        """ Return how full the fullest lane's queue is, from 0 to 1 """
+        return max([float(lane.queue.qsize()) / lane.queue.maxsize
+                for lane in self.lanes] or [0.0])
+
+    def close(self):
+        """ Write everything already queued and stop every worker """
+        self._lock.acquire()
+        try:
+            if not self._started:
+                return
+            self._started = False
+        finally:
+            self._lock.release()
+        for lane in self.lanes:
+            lane.close()
+
+
+_default_pipeline = None
+_default_lock = threading.Lock()
+
+def default_writer(config=None):
+    """ Return the writer for the configured writers.enabled
+
+    When syslog is the only writer and it is required, the syslog writer is
+    returned as it is, so the common setup writes in the request thread
+    without a hand-off.  Otherwise the shared Pipeline is created and
+    started on first use.  Required writers that are not enabled are
+    ignored.
+    """
+    global _default_pipeline
+    oconfig = config
+    if oconfig is None:
+        oconfig = ocelog.config.Config()
+    # the shared syslog writer keeps the config it was first created with
+    syslog_writer = _syslog_writer(oconfig)
+    writers = oconfig.writers
+    if writers.enabled == ("syslog",) and "syslog" in writers.required:
+        return syslog_writer
+    if _default_pipeline is None:
+        _default_lock.acquire()
+        try:
+            if _default_pipeline is None:
+                lanes = [_Lane(name, writer_factories[name](oconfig),
+                        name in writers.required,
+                        max_depth=writers.max_depth,
+                        batch_size=writers.batch_size)
+                        for name in writers.enabled]
+                opipeline = Pipeline(lanes, timeout=writers.timeout)
+                opipeline.start()
+                _default_pipeline = opipeline
+        finally:
+            _default_lock.release()
+    return _default_pipeline
+
+def default_load():
+    """ Return the load of the shared Pipeline, or 0 if it isn't running """
+    opipeline = _default_pipeline
+    if opipeline is None:
+        return 0.0
+    return opipeline.load()
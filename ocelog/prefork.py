@@ -0,0 +1,252 @@
+""" ocelog.prefork - serve a wsgi application from several forked processes """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import atexit
+import errno
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from wsgiref.simple_server import WSGIRequestHandler
+from wsgiref.simple_server import WSGIServer
+
+
+# python 2 doesn't name SO_REUSEPORT; this is its value on linux
+SO_REUSEPORT = getattr(socket, "SO_REUSEPORT", 15)
+
+# connections the kernel queues for each listening socket
+_BACKLOG = 1024
+# a worker that exits sooner than this after starting is respawned only
+# after a pause, so a worker that can't start doesn't spin the supervisor
+_MIN_WORKER_LIFE = 1.0
+_RESPAWN_DELAY = 1.0
+# workers still running this long after SIGTERM are killed
+_SHUTDOWN_TIMEOUT = 30.0
+
+
+def reuse_port_supported():
+    """ Return True if the kernel accepts SO_REUSEPORT """
+    if not sys.platform.startswith("linux") and \
+            not hasattr(socket, "SO_REUSEPORT"):
+        return False
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+            return True
+        except socket.error:
+            return False
+    finally:
+        sock.close()
+
+def listen(host, port, reuse_port=False):
+    """ Return a listening tcp socket bound to host and port """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(_BACKLOG)
+    return sock
+
+
+def shared_files(config):
+    """ Return the settings that would have workers write to the same files
+
+    Each worker would open the same spool segments with its own write
+    offsets, and the same log file with its own buffer and rotation, so
+    they would overwrite and interleave each other's records.
+    """
+    shared = []
+    if config.spool.enabled and "syslog" in config.writers.enabled:
+        shared.append("spool.enabled")
+    if "file" in config.writers.enabled:
+        shared.append("the file writer")
+    return shared
+
+
+class _QuietHandler(WSGIRequestHandler):
+    """ A wsgiref request handler that doesn't log each request to stderr """
+
+    def log_message(self, *args):
+        """ Skip the access log """
+        pass
+
+
+class PreforkServer(object):
+    """ Serve a wsgi application from a supervised set of forked workers
+
+    With reuse_port, each worker binds its own listening socket with
+    SO_REUSEPORT and the kernel spreads new connections across them.
+    Otherwise the socket is bound once by the supervisor and every worker
+    accepts from it.
+
+    Each worker serves one request at a time with wsgiref.  Nothing the
+    application starts lazily (writer queues, pipelines, spools) exists
+    before the fork, so each worker gets its own threads and connections.
+    post_fork, if given, is called in each worker before it serves, for
+    per-process setup such as signal handlers.  Workers share no files, so
+    the spool and the file writer can't be used with more than one (see
+    shared_files()).
+
+    The supervisor respawns workers that exit.  On SIGTERM or SIGINT it
+    passes SIGTERM to the workers, which finish the request in hand, run
+    their atexit handlers (flushing queues), and exit; any still running
+    after a timeout are killed.  Workers also exit in the same way if the
+    supervisor dies.  SIGHUP is passed on to the workers; the supervisor
+    doesn't reload its own configuration, so post_fork is where a worker
+    should read the current one.
+    """
+
+    def __init__(self, app, host, port, workers, reuse_port=True,
+            post_fork=None):
+        """ Initialize the server; serve_forever() starts it """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.reuse_port = reuse_port and reuse_port_supported()
+        self.post_fork = post_fork
+        self.socket = None
+        self.children = {}
+        self._stopping = False
+
+    #--------------------------------------------------------------------------
+    # supervisor
+    #--------------------------------------------------------------------------
+    def serve_forever(self):
+        """ Start the workers and supervise them until SIGTERM or SIGINT """
+        if not self.reuse_port:
+            self.socket = listen(self.host, self.port)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_hup)
+        for i in range(self.workers):
+            self._spawn()
+        while not self._stopping:
+            try:
+                pid, status = os.wait()
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            started = self.children.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+            if time.time() - started < _MIN_WORKER_LIFE:
+                time.sleep(_RESPAWN_DELAY)
+            if not self._stopping:
+                self._spawn()
+        self._stop_workers()
+
+    def _spawn(self):
+        """ Fork one worker """
+        supervisor = os.getpid()
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.time()
+            return
+        # in the worker: never return into the supervisor's code
+        status = 0
+        try:
+            try:
+                self._serve(supervisor)
+            except SystemExit, e:
+                status = e.code or 0
+            except:
+                traceback.print_exc()
+                status = 1
+        finally:
+            try:
+                atexit._run_exitfuncs()
+            finally:
+                os._exit(status)
+
+    def _handle_stop(self, signum, frame):
+        """ Begin a graceful shutdown of the supervisor and workers """
+        self._stopping = True
+        self._signal_workers(signal.SIGTERM)
+
+    def _handle_hup(self, signum, frame):
+        """ Pass SIGHUP to the workers (each reloads its configuration) """
+        self._signal_workers(signal.SIGHUP)
+
+    def _signal_workers(self, signum):
+        """ Send signum to every worker """
+        for pid in self.children.keys():
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+
+    def _stop_workers(self):
+        """ Wait for the workers to exit, killing any that take too long """
+        deadline = time.time() + _SHUTDOWN_TIMEOUT
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    break
+                raise
+            if pid:
+                self.children.pop(pid, None)
+            elif time.time() > deadline:
+                self._signal_workers(signal.SIGKILL)
+                deadline = time.time() + _SHUTDOWN_TIMEOUT
+            else:
+                time.sleep(0.05)
+        self.children.clear()
+
+    #--------------------------------------------------------------------------
+    # worker
+    #--------------------------------------------------------------------------
+    def _serve(self, supervisor):
+        """ Serve requests until SIGTERM or the supervisor exits (in a worker) """
+        self._stopping = False
+        self.children = {}
+        signal.signal(signal.SIGTERM, self._handle_worker_stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        sock = self.socket
+        if sock is None:
+            sock = listen(self.host, self.port, reuse_port=True)
+        if self.post_fork is not None:
+            self.post_fork()
+        server = WSGIServer((self.host, self.port), _QuietHandler,
+                bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+        server.server_address = sock.getsockname()
+        server.server_name = socket.getfqdn(self.host)
+        server.server_port = server.server_address[1]
+        server.setup_environ()
+        server.set_app(self.app)
+        # wake up regularly to notice a shutdown between requests
+        server.timeout = 0.5
+        while not self._stopping and os.getppid() == supervisor:
+            server.handle_request()
+
+    def _handle_worker_stop(self, signum, frame):
+        """ Stop serving once the request in hand is finished """
+        self._stopping = True
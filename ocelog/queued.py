@@ -0,0 +1,211 @@
+""" ocelog.queued - asynchronous, queued message writing """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import atexit
+import Queue
+import threading
+import time
+
+import ocelog.config
+import ocelog.pipeline
+
+
+# placed on the queue once per worker to ask it to exit
+_STOP = object()
+
+
+class QueuedWriter(object):
+    """ Accept Message() objects into a bounded queue drained by worker threads
+
+    QueuedWriter wraps another writer.  write() only enqueues the message and
+    returns immediately; False is returned if the queue is full or closed.
+    Worker threads take up to batch_size messages at a time, waiting at most
+    flush_interval seconds for a batch to fill, and hand each batch to the
+    wrapped writer's write_batch() if it has one, or write() otherwise.
+
+    close() stops accepting messages, writes everything already queued, and
+    stops the workers.  It is registered with atexit when the workers start.
+    """
+
+    def __init__(self, writer, max_depth=10000, batch_size=100,
+            flush_interval=0.05, workers=1):
+        """ Initialize the queue; the workers are started by start() """
+        self.writer = writer
+        self.queue = Queue.Queue(max_depth)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.workers = workers
+        self.written = 0
+        self.failed = 0
+        self._threads = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Start the worker threads """
+        self._lock.acquire()
+        try:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._drain,
+                        name="ocelog-queue-%d" % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.close)
+        finally:
+            self._lock.release()
+
+    def write(self, message):
+        """ Queue a message for writing, returning False if it was refused
+
+        The closed check and the put are made under the lock close() takes
+        to set _closed, so every accepted message is queued ahead of the
+        workers' stop markers and written.
+        """
+        self._lock.acquire()
+        try:
+            if self._closed:
+                return False
+            self.queue.put_nowait(message)
+            return True
+        except Queue.Full:
+            return False
+        finally:
+            self._lock.release()
+
+    def write_batch(self, messages):
+        """ Queue a list of messages and return a list of results """
+        return [self.write(message) for message in messages]
+
+    def depth(self):
+        """ Return the approximate number of queued messages """
+        return self.queue.qsize()
+
+    def load(self):
+        """ Return how full the queue is, from 0 to 1 """
+        return float(self.queue.qsize()) / self.queue.maxsize
+
+    def flush(self):
+        """ Block until every queued message has been written """
+        self.queue.join()
+
+    def close(self):
+        """ Stop accepting messages, write the backlog, and stop the workers """
+        self._lock.acquire()
+        try:
+            if self._closed:
+                return
+            self._closed = True
+            threads = self._threads
+        finally:
+            self._lock.release()
+        for thread in threads:
+            self.queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+
+    def _next_batch(self):
+        """ Block for one message, then collect a batch until full or timed out """
+        batch = [self.queue.get()]
+        if batch[0] is _STOP:
+            return batch
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    message = self.queue.get(True, remaining)
+                else:
+                    message = self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            batch.append(message)
+            if message is _STOP:
+                break
+        return batch
+
+    def _drain(self):
+        """ Worker loop: write batches until a stop marker is seen """
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                self._write_batch(batch)
+            for i in range(len(batch) + int(stop)):
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        """ Write a batch through the wrapped writer and count the results """
+        write_batch = getattr(self.writer, "write_batch", None)
+        try:
+            if write_batch is not None:
+                results = write_batch(batch)
+            else:
+                results = [self.writer.write(message) for message in batch]
+        except:
+            results = [False] * len(batch)
+        written = results.count(True)
+        self._lock.acquire()
+        try:
+            self.written += written
+            self.failed += len(batch) - written
+        finally:
+            self._lock.release()
+
+
+_default_writer = None
+_default_lock = threading.Lock()
+
+def default_writer(config=None):
+    """ Return the shared QueuedWriter used by the /log handler
+
+    The writer is created and started on first use so that worker threads are
+    only started in the process that actually serves requests.
+    """
+    global _default_writer
+    if _default_writer is None:
+        _default_lock.acquire()
+        try:
+            if _default_writer is None:
+                oconfig = config
+                if oconfig is None:
+                    oconfig = ocelog.config.Config()
+                owriter = QueuedWriter(ocelog.pipeline.default_writer(oconfig),
+                        max_depth=oconfig.queue.max_depth,
+                        batch_size=oconfig.queue.batch_size,
+                        flush_interval=oconfig.queue.flush_interval,
+                        workers=oconfig.queue.workers)
+                owriter.start()
+                _default_writer = owriter
+        finally:
+            _default_lock.release()
+    return _default_writer
+
+def default_load():
+    """ Return the load of the shared QueuedWriter, or 0 if it isn't running """
+    owriter = _default_writer
+    if owriter is None:
+        return 0.0
+    return owriter.load()
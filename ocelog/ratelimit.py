@@ -0,0 +1,134 @@
+""" ocelog.ratelimit - per-appname and per-client token bucket rate limits """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import collections
+import threading
+import time
+
+import ocelog.config
+import ocelog.metrics
+
+
+# the table is split into this many independently locked stripes
+_STRIPES = 16
+
+
+class _Stripe(object):
+    """ One lock and the least recently used ordered buckets it guards """
+
+    __slots__ = ("lock", "buckets", "capacity")
+
+    def __init__(self, capacity):
+        """ Initialize an empty stripe holding at most capacity buckets """
+        self.lock = threading.Lock()
+        self.buckets = collections.OrderedDict()
+        self.capacity = capacity
+
+
+class RateLimiter(object):
+    """ A fixed-size table of token buckets
+
+    Each key has a bucket of at most burst tokens, refilled at rate tokens a
+    second, and each message takes one.  The buckets are only updated when
+    a key is seen, so an idle key costs nothing.
+
+    The table holds at most table_size keys, spread over a fixed number of
+    stripes by hash so that concurrent requests rarely wait on the same
+    lock.  Each stripe keeps its buckets in least recently used order and
+    evicts the oldest when it is full; an evicted key starts again with a
+    full bucket, which is what an idle key would have had anyway.
+    """
+
+    def __init__(self, table_size=65536, stripes=_STRIPES):
+        """ Initialize an empty table of table_size keys """
+        capacity = max(1, table_size // stripes)
+        self.table_size = table_size
+        self._stripes = tuple(_Stripe(capacity) for i in range(stripes))
+
+    def __len__(self):
+        """ Return the number of keys in the table """
+        return sum(len(stripe.buckets) for stripe in self._stripes)
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        """ Take cost tokens from the bucket for key
+
+        Returns 0 if the tokens were taken, otherwise the seconds until the
+        bucket will hold enough (nothing is taken in that case).
+        """
+        if now is None:
+            now = time.time()
+        stripe = self._stripes[hash(key) % len(self._stripes)]
+        buckets = stripe.buckets
+        stripe.lock.acquire()
+        try:
+            bucket = buckets.pop(key, None)
+            if bucket is None:
+                tokens = burst
+                if len(buckets) >= stripe.capacity:
+                    buckets.popitem(last=False)
+            else:
+                tokens, last = bucket
+                tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0
+            else:
+                wait = (cost - tokens) / rate
+            buckets[key] = (tokens, now)
+            return wait
+        finally:
+            stripe.lock.release()
+
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+def default_limiter(config=None):
+    """ Return the shared RateLimiter, created on first use """
+    global _default_limiter
+    if _default_limiter is None:
+        _default_lock.acquire()
+        try:
+            if _default_limiter is None:
+                oconfig = config
+                if oconfig is None:
+                    oconfig = ocelog.config.Config()
+                _default_limiter = RateLimiter(oconfig.ratelimit.table_size)
+        finally:
+            _default_lock.release()
+    return _default_limiter
+
+def check(kind, key, config):
+    """ Take a token for an appname or client key under the configured limits
+
+    kind is "appname" or "client".  The key's own limit from
+    ratelimit.appname_limits or ratelimit.client_limits is used if there is
+    one, otherwise ratelimit.rate and ratelimit.burst.  Returns 0 if the
+    message may go ahead, otherwise the seconds until it could.
+    """
+    settings = config.ratelimit
+    if kind == "appname":
+        limits = settings.appname_limits
+    else:
+        limits = settings.client_limits
+    rate, burst = limits.get(key, (settings.rate, settings.burst))
+    wait = default_limiter(config).take((kind, key), rate, burst)
+    if wait:
+        ocelog.metrics.count("ocelog_ratelimited_total", (("key", kind),))
+    return wait
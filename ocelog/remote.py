@@ -0,0 +1,260 @@
+""" ocelog.remote - forward messages to remote syslog relays over udp or tcp """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import re
+import select
+import socket
+import threading
+import time
+
+import ocelog.config
+from ocelog.writer import facility_codes
+from ocelog.writer import priority_codes
+from ocelog.writer import _months
+
+
+# RFC5424 header fields are printable us-ascii without spaces
+_unprintable = re.compile(r"[^\x21-\x7e]")
+
+
+def _header_field(value, max_length):
+    """ Return value as an RFC5424 header field, or the nil value "-" """
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    value = _unprintable.sub("_", value[:max_length])
+    return value or "-"
+
+
+def _is_open(sock):
+    """ Return False if the peer has closed (or reset) a connected tcp socket
+
+    A relay sends nothing back, so anything to read on an idle connection
+    is the end of the stream or an error.  A send on a socket the peer has
+    closed still succeeds locally, and the data is lost.
+    """
+    try:
+        readable, writable, errors = select.select([sock], [], [], 0)
+        if not readable:
+            return True
+        return sock.recv(1, socket.MSG_PEEK) != ""
+    except (select.error, socket.error):
+        return False
+
+
+class RemoteSyslogWriter(object):
+    """ Accept Message() objects and send them to remote syslog relays
+
+    Records are formatted as RFC5424 (or RFC3164) and sent over udp, one
+    record per datagram, or over tcp with RFC6587 octet-counting framing
+    ("LENGTH RECORD").  Over tcp, every record of a write_batch() is framed
+    into one buffer and sent with a single sendall(), so a queued backlog
+    costs one system call rather than one per record.  Connections are kept
+    in a small pool for each relay and reused.
+
+    The relays are tried in the configured order.  A relay that can't be
+    reached is skipped for retry_interval seconds, and the batch is sent to
+    the next one.  Over tcp a batch that failed part way is sent again in
+    full, so a relay may see a record twice.
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwds):
+        """ Enforce singleton behavior """
+        if cls._instance is None:
+            cls._instance = object.__new__(cls)
+        return cls._instance
+
+    def __init__(self, config=None):
+        """ Initialize the RemoteSyslogWriter and prepare for writing
+
+        The optional config is a Config or ConfigSnapshot; Config() is used
+        if none is given.  It is only bound when the writer is first created,
+        so requests in flight never see it change; see reload().
+        """
+        if self._initialized is False:
+            if config is None:
+                config = ocelog.config.Config()
+            self.config = config
+            self._lock = threading.Lock()
+            # (host, port, protocol) -> list of idle sockets
+            self._pools = {}
+            # (host, port) -> time before which the relay is skipped
+            self._down_until = {}
+            self._stamp3164 = (None, None)
+            self._stamp5424 = (None, None)
+            self._initialized = True
+
+    def reload(self, config=None):
+        """ Use config, or the published snapshot, for the writes that follow """
+        if config is None:
+            config = ocelog.config.current()
+        self.config = config
+
+    #--------------------------------------------------------------------------
+    # formatting
+    #--------------------------------------------------------------------------
+    def _timestamp3164(self, now):
+        """ Return the RFC3164 timestamp, formatted at most once per second """
+        second = int(now)
+        cached_second, stamp = self._stamp3164
+        if second != cached_second:
+            t = time.localtime(second)
+            stamp = "%s %2d %02d:%02d:%02d" % (_months[t.tm_mon - 1],
+                    t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+            self._stamp3164 = (second, stamp)
+        return stamp
+
+    def _timestamp5424(self, now):
+        """ Return the RFC5424 (utc, microsecond) timestamp """
+        second = int(now)
+        cached_second, stamp = self._stamp5424
+        if second != cached_second:
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._stamp5424 = (second, stamp)
+        return "%s.%06dZ" % (stamp, int((now - second) * 1000000))
+
+    def format(self, message, now=None):
+        """ Return the record for a message in the configured format """
+        if now is None:
+            now = time.time()
+        pri = (facility_codes[message.facility] << 3) | \
+                priority_codes[message.priority]
+        if self.config.remote.format == "rfc3164":
+            record = "<%d>%s %s %s: %s" % (pri, self._timestamp3164(now),
+                    message.hostname, message.appname, message.msg)
+        else:
+            record = "<%d>1 %s %s %s - - - %s" % (pri, self._timestamp5424(now),
+                    _header_field(message.hostname, 255),
+                    _header_field(message.appname, 48), message.msg)
+        if isinstance(record, unicode):
+            record = record.encode("utf-8")
+        return record
+
+    #--------------------------------------------------------------------------
+    # writing
+    #--------------------------------------------------------------------------
+    def write(self, message):
+        """ Accept ocelog.message.Message and send it to a relay """
+        return self.write_batch([message])[0]
+
+    def write_batch(self, messages):
+        """ Send a list of messages to one relay and return a list of results """
+        now = time.time()
+        records = []
+        results = []
+        for message in messages:
+            try:
+                records.append(self.format(message, now))
+                results.append(True)
+            except:
+                results.append(False)
+        if records and not self.send(records):
+            results = [False] * len(results)
+        return results
+
+    def send(self, records):
+        """ Send formatted records to the first relay that takes them all """
+        remote = self.config.remote
+        protocol = remote.protocol
+        if protocol == "tcp":
+            data = "".join(["%d %s" % (len(record), record) for record in records])
+        now = time.time()
+        for relay in remote.relays:
+            if self._down_until.get(relay, 0) > now:
+                continue
+            # a pooled connection may have been closed by the relay while it
+            # sat idle, so a failure on one is retried on a new connection
+            for fresh in (False, True):
+                sock = None
+                pooled = False
+                try:
+                    sock, pooled = self._acquire(relay, protocol,
+                            remote.timeout, fresh)
+                    if protocol == "tcp":
+                        sock.sendall(data)
+                    else:
+                        for record in records:
+                            sock.send(record)
+                    self._release(relay, protocol, sock, remote.pool_size)
+                    return True
+                except socket.error:
+                    if sock is not None:
+                        sock.close()
+                    if not pooled:
+                        break
+            self._down_until[relay] = now + remote.retry_interval
+        return False
+
+    #--------------------------------------------------------------------------
+    # connection pool
+    #--------------------------------------------------------------------------
+    def _acquire(self, relay, protocol, timeout, fresh=False):
+        """ Return (socket, pooled): an idle pooled socket, or a new one
+
+        With fresh set, the pool is skipped and a new socket is connected.
+        Pooled tcp sockets the relay has closed are thrown away.
+        """
+        while not fresh:
+            self._lock.acquire()
+            try:
+                idle = self._pools.get(relay + (protocol,))
+                if not idle:
+                    break
+                sock = idle.pop()
+            finally:
+                self._lock.release()
+            if protocol != "tcp" or _is_open(sock):
+                return (sock, True)
+            sock.close()
+        if protocol == "tcp":
+            sock = socket.create_connection(relay, timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            family, socktype, proto, canonname, address = socket.getaddrinfo(
+                    relay[0], relay[1], 0, socket.SOCK_DGRAM)[0]
+            sock = socket.socket(family, socktype, proto)
+            sock.settimeout(timeout)
+            sock.connect(address)
+        return (sock, False)
+
+    def _release(self, relay, protocol, sock, pool_size):
+        """ Return a socket to the relay's pool, closing it if the pool is full """
+        self._lock.acquire()
+        try:
+            idle = self._pools.setdefault(relay + (protocol,), [])
+            if len(idle) < pool_size:
+                idle.append(sock)
+                return
+        finally:
+            self._lock.release()
+        sock.close()
+
+    def close(self):
+        """ Close every pooled socket and forget which relays were down """
+        self._lock.acquire()
+        try:
+            pools, self._pools = self._pools, {}
+            self._down_until = {}
+        finally:
+            self._lock.release()
+        for idle in pools.values():
+            for sock in idle:
+                sock.close()
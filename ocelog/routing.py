@@ -0,0 +1,247 @@
+""" ocelog.routing - route tables compiled for dispatch
+
+A Router holds routes written as bottle writes them ("log/batch",
+"item/:id", "item/:id#[0-9]+#") and compiles them on first use: static
+routes into a table of paths, each holding its handlers by method, and the
+parameterized routes of each method into one combined regular expression.
+A request then costs one dict lookup, or one regex match, instead of
+bottle's linear scan.  The table also knows every method a path accepts,
+so a request with any other method gets a 405 rather than a 404.
+
+RoutedBottle is a Bottle that dispatches through a Router.
+"""
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import re
+
+from ocelog.bottle import BaseController
+from ocelog.bottle import Bottle
+from ocelog.bottle import response
+
+
+# python 2's re supports at most 99 groups in one expression
+_MAX_GROUPS = 99
+
+_simple_route = re.compile(r'^(\w+/)*\w*$')
+_group_name = re.compile(r'\(\?P([<=])(\w+)')
+
+
+def normalize(route):
+    """ Return a route as bottle stores it, without anchors or slashes """
+    return route.strip().lstrip('$^/ ').rstrip('$^ ')
+
+def route_pattern(route):
+    """ Return the regular expression bottle builds for a route
+
+    ":name" matches one path segment, and ":name#regex#" (with any non-word
+    character in place of the #) matches regex, as the name parameter.
+    """
+    route = re.sub(r':([a-zA-Z_]+)(?P<uniq>[^\w/])(?P<re>.+?)(?P=uniq)',
+                   r'(?P<\1>\g<re>)', route)
+    return re.sub(r':([a-zA-Z_]+)', r'(?P<\1>[^/]+)', route)
+
+
+class _Combined(object):
+    """ Several parameterized routes matched with one regular expression
+
+    Each route is wrapped in a group of its own, and its parameter groups
+    are renamed to be unique, so the group that matched (lastindex) tells
+    which route it was.
+    """
+
+    __slots__ = ("regex", "routes")
+
+    def __init__(self, entries):
+        """ Compile entries of (pattern, handler, group count) """
+        alternatives = []
+        # the handler and the (group, parameter) names of each outer group
+        self.routes = {}
+        group = 1
+        for i, (pattern, handler, groups) in enumerate(entries):
+            params = []
+            def rename(match):
+                name = "r%d_%s" % (i, match.group(2))
+                if match.group(1) == "<":
+                    params.append((name, match.group(2)))
+                return "(?P%s%s" % (match.group(1), name)
+            alternatives.append("(%s)$" % _group_name.sub(rename, pattern))
+            self.routes[group] = (handler, params)
+            group += groups + 1
+        self.regex = re.compile("^(?:%s)" % "|".join(alternatives))
+
+    def match(self, url):
+        """ Return (handler, args) for the first route matching url, or None """
+        match = self.regex.match(url)
+        if match is None:
+            return None
+        handler, params = self.routes[match.lastindex]
+        return handler, dict((param, match.group(name))
+                for name, param in params)
+
+
+class Router(object):
+    """ Routes compiled into a path table and combined regular expressions
+
+    Routes are matched as bottle matches them: static routes first, then
+    parameterized routes in the order they were added, with HEAD falling
+    back to GET.
+    """
+
+    def __init__(self):
+        """ Initialize an empty router """
+        # (method, route, handler, simple) in the order they were added
+        self.routes = []
+        self._compiled = None
+
+    def add(self, route, handler, method='GET', simple=False):
+        """ Add a route; simple routes are matched literally """
+        self.routes.append((method.strip().upper(), normalize(route), handler,
+                simple))
+        self._compiled = None
+
+    def compile(self):
+        """ Build the path table and the combined expressions
+
+        This happens on the first match after routes are added; call it at
+        startup to pay for it there.
+        """
+        static = {}
+        dynamic = {}
+        for method, route, handler, simple in self.routes:
+            if simple or _simple_route.match(route):
+                static.setdefault(route, {})[method] = handler
+            else:
+                pattern = route_pattern(route)
+                groups = re.compile(pattern).groups
+                dynamic.setdefault(method, []).append((pattern, handler,
+                        groups))
+        combined = {}
+        for method, entries in dynamic.items():
+            chunks = []
+            chunk = []
+            size = 0
+            for entry in entries:
+                if chunk and size + entry[2] + 1 > _MAX_GROUPS:
+                    chunks.append(_Combined(chunk))
+                    chunk = []
+                    size = 0
+                chunk.append(entry)
+                size += entry[2] + 1
+            chunks.append(_Combined(chunk))
+            combined[method] = chunks
+        self._compiled = (static, combined)
+        return self._compiled
+
+    def match(self, url, method='GET'):
+        """ Return (handler, args) for a request, or (None, None) """
+        compiled = self._compiled or self.compile()
+        url = url.strip().lstrip("/ ")
+        # static routes are the common case, so they're looked up inline
+        methods = compiled[0].get(url)
+        if methods is not None and method in methods:
+            return methods[method], {}
+        found = self._match_dynamic(compiled, url, method)
+        if found is None and method == 'HEAD':
+            if methods is not None and 'GET' in methods:
+                return methods['GET'], {}
+            found = self._match_dynamic(compiled, url, 'GET')
+        return found or (None, None)
+
+    def _match_dynamic(self, compiled, url, method):
+        """ Return (handler, args) from method's regex routes, or None """
+        for chunk in compiled[1].get(method, ()):
+            found = chunk.match(url)
+            if found is not None:
+                return found
+        return None
+
+    def allowed(self, url):
+        """ Return the sorted methods any route accepts for url
+
+        HEAD is included wherever GET is.  An empty list means no route
+        matches the path at all.
+        """
+        compiled = self._compiled or self.compile()
+        static, combined = compiled
+        url = url.strip().lstrip("/ ")
+        methods = set(static.get(url, ()))
+        for method, chunks in combined.items():
+            if method not in methods:
+                for chunk in chunks:
+                    if chunk.match(url) is not None:
+                        methods.add(method)
+                        break
+        if 'GET' in methods:
+            methods.add('HEAD')
+        return sorted(methods)
+
+
+def method_not_allowed(allowed):
+    """ Answer with a 405 and an Allow header listing the allowed methods """
+    response.status = 405
+    response.header['Allow'] = ", ".join(allowed)
+
+
+class RoutedBottle(Bottle):
+    """ A Bottle dispatching with a Router
+
+    A request for a known path with a method no route accepts is passed to
+    the not_allowed handler, with the accepted methods as its allowed
+    argument, rather than answered with a 404.
+    """
+
+    def __init__(self, *args, **kargs):
+        """ Initialize the application with an empty Router """
+        Bottle.__init__(self, *args, **kargs)
+        self.router = Router()
+        self.not_allowed_handler = method_not_allowed
+
+    def add_route(self, route, handler, method='GET', simple=False, **kargs):
+        """ Adds a new route to the route mappings. """
+        Bottle.add_route(self, route, handler, method=method, simple=simple,
+                **kargs)
+        # controllers come back through here for each of their actions
+        if not (isinstance(handler, type) and
+                issubclass(handler, BaseController)) and \
+                not isinstance(handler, BaseController):
+            self.router.add(route, handler, method=method, simple=simple)
+
+    def match_url(self, url, method='GET'):
+        """
+        Returns the matching handler and a parameter dict or (None, None)
+        """
+        handler, args = self.router.match(url, method)
+        if handler is not None:
+            return handler, args
+        if self.default_route:
+            return (self.default_route, {})
+        allowed = self.router.allowed(url)
+        if allowed:
+            return (self.not_allowed_handler, {'allowed': allowed})
+        return (None, None)
+
+    def set_not_allowed(self, handler):
+        self.not_allowed_handler = handler
+
+    def not_allowed(self):
+        """ Decorator for the 405 handler. Same as set_not_allowed(handler). """
+        def wrapper(handler):
+            self.set_not_allowed(handler)
+            return handler
+        return wrapper
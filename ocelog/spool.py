@@ -0,0 +1,487 @@
+""" ocelog.spool - a disk-backed write-ahead spool for undeliverable records """
+
+"""
+Copyright 2010 Cody Collier
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import atexit
+import mmap
+import os
+import os.path
+import struct
+import threading
+import time
+import zlib
+
+import ocelog.config
+import ocelog.metrics
+import ocelog.writer
+
+
+# each record is a big-endian length and crc32 followed by the record bytes
+_header = struct.Struct(">II")
+
+_segment_suffix = ".seg"
+_cursor_name = "cursor"
+
+
+class SpoolException(Exception):
+    """ A generic exception class for the spool """
+
+
+def _segment_name(number):
+    """ Return the file name of a segment """
+    return "%016d%s" % (number, _segment_suffix)
+
+def _checksum(record):
+    """ Return the unsigned crc32 of a record """
+    return zlib.crc32(record) & 0xffffffff
+
+def _read_record(segment_map, offset):
+    """ Return (record, next_offset) at offset, or (None, offset) at the end
+
+    The end of the data is a zero length (the segment is preallocated with
+    zeros), a header that would run past the segment, or a record whose
+    checksum doesn't match (a write torn by a crash).
+    """
+    size = len(segment_map)
+    if offset + _header.size > size:
+        return (None, offset)
+    length, crc = _header.unpack_from(segment_map, offset)
+    start = offset + _header.size
+    if length == 0 or start + length > size:
+        return (None, offset)
+    record = segment_map[start:start + length]
+    if _checksum(record) != crc:
+        return (None, offset)
+    return (record, start + length)
+
+
+class _Segment(object):
+    """ One preallocated, memory-mapped segment file """
+
+    __slots__ = ("number", "path", "map")
+
+    def __init__(self, directory, number, size):
+        """ Open (creating and preallocating if needed) and map the segment """
+        self.number = number
+        self.path = os.path.join(directory, _segment_name(number))
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+
+    def sync(self, start=0, end=None):
+        """ msync the mapped pages holding bytes start to end """
+        if end is None:
+            end = len(self.map)
+        start -= start % mmap.PAGESIZE
+        if end > start:
+            self.map.flush(start, end - start)
+
+    def close(self):
+        """ Unmap the segment """
+        self.map.close()
+
+    def remove(self):
+        """ Unmap and delete the segment file """
+        self.close()
+        os.remove(self.path)
+
+
+class Spool(object):
+    """ An append-only, size-capped queue of records in mmap'd segment files
+
+    append() copies a record into the mapped segment being written, which
+    costs no system call unless the segment is full or the fsync policy says
+    to sync.  A full segment is synced and a new one is started, up to
+    max_segments; after that append() refuses records.  Records are read in
+    the order they were appended with peek() and consume(), and a segment is
+    deleted once everything in it has been consumed.
+
+    The fsync policy decides when mapped pages are forced to disk:
+        always   - after every append
+        interval - at most once per fsync_interval (see sync_if_due())
+        never    - only when a segment fills and on close(), otherwise
+                   whenever the kernel writes them back
+
+    The read position is saved in a small cursor file whenever the spool is
+    synced, so after a restart the spool resumes close to where it stopped.
+    Delivery is at least once: records consumed after the last sync are
+    read again.
+    """
+
+    def __init__(self, directory, segment_size=4194304, max_segments=16,
+            fsync="interval", fsync_interval=1.0):
+        """ Open the spool in directory, recovering any existing segments """
+        if fsync not in ocelog.config._SpoolConfig.valid_fsync_policies:
+            raise SpoolException, "unknown fsync policy: %s" % fsync
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+        self._closed = False
+        self._dirty_from = None
+        self._cursor_saved = None
+        self._last_sync = time.time()
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        self._open()
+
+    def _open(self):
+        """ Map the existing segments and find the read and write positions """
+        numbers = sorted([int(name[:-len(_segment_suffix)])
+                for name in os.listdir(self.directory)
+                if name.endswith(_segment_suffix)])
+        read_number, read_offset = self._load_cursor()
+        # segments before the saved cursor were already consumed
+        for number in numbers:
+            if number < read_number:
+                os.remove(os.path.join(self.directory, _segment_name(number)))
+        numbers = [number for number in numbers if number >= read_number]
+        if not numbers:
+            numbers = [max(read_number, 1)]
+            read_offset = 0
+        elif numbers[0] != read_number:
+            read_offset = 0
+        self._segments = [_Segment(self.directory, number, self.segment_size)
+                for number in numbers]
+        # the write position is the end of the valid records in the last segment
+        tail = self._segments[-1]
+        offset = 0
+        while True:
+            record, next_offset = _read_record(tail.map, offset)
+            if record is None:
+                break
+            offset = next_offset
+        self._write_offset = offset
+        if len(self._segments) == 1:
+            read_offset = min(read_offset, offset)
+        self._read_offset = read_offset
+        self._cursor_saved = (self._segments[0].number, read_offset)
+
+    def _load_cursor(self):
+        """ Return the saved (segment number, offset), or (0, 0) if there isn't one """
+        path = os.path.join(self.directory, _cursor_name)
+        try:
+            cursor_file = open(path)
+            try:
+                number, offset = cursor_file.read().split()
+                return (int(number), int(offset))
+            finally:
+                cursor_file.close()
+        except (IOError, ValueError):
+            return (0, 0)
+
+    def _save_cursor(self):
+        """ Atomically replace the cursor file if the read position moved """
+        cursor = (self._segments[0].number, self._read_offset)
+        if cursor == self._cursor_saved:
+            return
+        path = os.path.join(self.directory, _cursor_name)
+        staged = path + ".tmp"
+        cursor_file = open(staged, "w")
+        try:
+            cursor_file.write("%d %d\n" % cursor)
+            cursor_file.flush()
+            if self.fsync != "never":
+                os.fsync(cursor_file.fileno())
+        finally:
+            cursor_file.close()
+        os.rename(staged, path)
+        self._cursor_saved = cursor
+
+    def append(self, record):
+        """ Append a record, returning False if the spool is full or closed """
+        size = _header.size + len(record)
+        if not record or size > self.segment_size:
+            return False
+        self._lock.acquire()
+        try:
+            if self._closed:
+                return False
+            tail = self._segments[-1]
+            if self._write_offset + size > self.segment_size:
+                if len(self._segments) >= self.max_segments:
+                    return False
+                self._sync_tail()
+                tail = _Segment(self.directory, tail.number + 1,
+                        self.segment_size)
+                self._segments.append(tail)
+                self._write_offset = 0
+            offset = self._write_offset
+            end = offset + size
+            tail.map[offset + _header.size:end] = record
+            tail.map[offset:offset + _header.size] = \
+                    _header.pack(len(record), _checksum(record))
+            self._write_offset = end
+            if self._dirty_from is None:
+                self._dirty_from = offset
+            if self.fsync == "always":
+                self._sync()
+            elif self.fsync == "interval":
+                self._sync_if_due()
+            self._appended.notify()
+            return True
+        finally:
+            self._lock.release()
+
+    def peek(self):
+        """ Return the oldest unconsumed record without consuming it, or None """
+        self._lock.acquire()
+        try:
+            if self._closed:
+                return None
+            while True:
+                head = self._segments[0]
+                if len(self._segments) == 1 and \
+                        self._read_offset >= self._write_offset:
+                    return None
+                record, next_offset = _read_record(head.map, self._read_offset)
+                if record is not None:
+                    return record
+                if len(self._segments) == 1:
+                    return None
+                # everything in the head segment was consumed; move on
+                self._segments.pop(0)
+                head.remove()
+                self._read_offset = 0
+        finally:
+            self._lock.release()
+
+    def consume(self):
+        """ Discard the record last returned by peek() """
+        self._lock.acquire()
+        try:
+            if self._closed:
+                return
+            record, next_offset = _read_record(self._segments[0].map,
+                    self._read_offset)
+            if record is not None:
+                self._read_offset = next_offset
+        finally:
+            self._lock.release()
+
+    def pending(self):
+        """ Return True if there are unconsumed records """
+        self._lock.acquire()
+        try:
+            return len(self._segments) > 1 or \
+                    self._read_offset < self._write_offset
+        finally:
+            self._lock.release()
+
+    def wait(self, timeout):
+        """ Wait up to timeout seconds for a record to be appended """
+        self._lock.acquire()
+        try:
+            if not self._closed and len(self._segments) == 1 and \
+                    self._read_offset >= self._write_offset:
+                self._appended.wait(timeout)
+        finally:
+            self._lock.release()
+
+    def sync(self):
+        """ Force appended records and the read position to disk """
+        self._lock.acquire()
+        try:
+            if not self._closed:
+                self._sync()
+        finally:
+            self._lock.release()
+
+    def sync_if_due(self):
+        """ Sync if the interval policy's fsync_interval has passed """
+        self._lock.acquire()
+        try:
+            if not self._closed and self.fsync == "interval":
+                self._sync_if_due()
+        finally:
+            self._lock.release()
+
+    def _sync_if_due(self):
+        """ Sync if fsync_interval has passed since the last sync (lock held) """
+        if time.time() - self._last_sync >= self.fsync_interval:
+            self._sync()
+
+    def _sync(self):
+        """ msync the dirty part of the tail and save the cursor (lock held) """
+        self._sync_tail()
+        self._save_cursor()
+        self._last_sync = time.time()
+
+    def _sync_tail(self):
+        """ msync the tail pages written since the last sync (lock held) """
+        if self._dirty_from is not None:
+            self._segments[-1].sync(self._dirty_from, self._write_offset)
+            self._dirty_from = None
+
+    def close(self):
+        """ Sync and unmap every segment; records left unconsumed are kept """
+        self._lock.acquire()
+        try:
+            if self._closed:
+                return
+            self._sync()
+            self._closed = True
+            for segment in self._segments:
+                segment.close()
+            self._appended.notifyAll()
+        finally:
+            self._lock.release()
+
+
+class SpoolingWriter(object):
+    """ Deliver records through a SocketSyslogWriter, spooling what it can't take
+
+    Each message is formatted once and sent without waiting.  If the send
+    fails, or the syslog socket is full because the service is slow, the
+    record is appended to the spool instead and the write still succeeds.
+    While the spool holds records, new records are appended behind them so
+    that delivery stays in order.  A replay thread sends the spooled records,
+    oldest first, once the syslog service accepts them again, retrying every
+    retry_interval seconds until it does.
+
+    write() only returns False when a record could neither be sent nor
+    spooled (the spool is full).
+    """
+
+    def __init__(self, writer, spool, retry_interval=1.0):
+        """ Wrap writer; the replay thread is started by start() """
+        self.writer = writer
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self._thread = None
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Start the replay thread """
+        self._lock.acquire()
+        try:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._replay,
+                    name="ocelog-spool-replay")
+            self._thread.daemon = True
+            self._thread.start()
+            atexit.register(self.close)
+        finally:
+            self._lock.release()
+
+    def write(self, message):
+        """ Accept ocelog.message.Message and send or spool its record """
+        if not self.writer.config.syslog.enabled:
+            return True
+        try:
+            record = self.writer.format(message)
+        except:
+            return False
+        return self._deliver(record)
+
+    def write_batch(self, messages):
+        """ Write a list of messages and return a list of results """
+        if not self.writer.config.syslog.enabled:
+            return [True] * len(messages)
+        now = time.time()
+        results = []
+        for message in messages:
+            try:
+                record = self.writer.format(message, now)
+            except:
+                results.append(False)
+                continue
+            results.append(self._deliver(record))
+        return results
+
+    def _deliver(self, record):
+        """ Send a record now if nothing is spooled ahead of it, else spool it """
+        if not self.spool.pending() and self.writer.send(record, wait=False):
+            return True
+        if self.spool.append(record):
+            ocelog.metrics.count("ocelog_spool_records_total",
+                    (("event", "spooled"),))
+            return True
+        ocelog.metrics.count("ocelog_spool_records_total",
+                (("event", "refused"),))
+        return False
+
+    def _replay(self):
+        """ Replay loop: send spooled records in order until closed """
+        while not self._closed.isSet():
+            self.spool.sync_if_due()
+            record = self.spool.peek()
+            if record is None:
+                self.spool.wait(self.spool.fsync_interval)
+            elif self.writer.config.syslog.enabled and self.writer.send(record):
+                self.spool.consume()
+                ocelog.metrics.count("ocelog_spool_records_total",
+                        (("event", "replayed"),))
+            else:
+                self._closed.wait(self.retry_interval)
+
+    def close(self):
+        """ Stop the replay thread and close the spool
+
+        Closing the spool wakes the replay thread if it is waiting for records.
+        """
+        self._closed.set()
+        self._lock.acquire()
+        try:
+            thread = self._thread
+        finally:
+            self._lock.release()
+        self.spool.close()
+        if thread is not None:
+            thread.join()
+
+
+_default_writer = None
+_default_lock = threading.Lock()
+
+def default_writer(config=None):
+    """ Return the shared SpoolingWriter used when spool.enabled is set
+
+    The spool is opened and the replay thread started on first use so that
+    the thread only runs in the process that actually serves requests.
+    """
+    global _default_writer
+    if _default_writer is None:
+        _default_lock.acquire()
+        try:
+            if _default_writer is None:
+                oconfig = config
+                if oconfig is None:
+                    oconfig = ocelog.config.Config()
+                ospool = Spool(oconfig.spool.directory,
+                        segment_size=oconfig.spool.segment_size,
+                        max_segments=oconfig.spool.max_segments,
+                        fsync=oconfig.spool.fsync,
+                        fsync_interval=oconfig.spool.fsync_interval)
+                owriter = SpoolingWriter(
+                        ocelog.writer.SocketSyslogWriter(oconfig), ospool,
+                        retry_interval=oconfig.spool.retry_interval)
+                owriter.start()
+                _default_writer = owriter
+        finally:
+            _default_lock.release()
+    return _default_writer
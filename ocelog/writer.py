@@ -17,11 +17,30 @@ limitations under the License.
 """
 
 
+import errno
+import socket
 import syslog
+import threading
+import time
 
 import ocelog.config
 
 
+# RFC3164 facility and severity codes.  These are spelled out rather than
+# taken from the syslog module because not every platform build of the module
+# defines LOG_AUTHPRIV and LOG_FTP.
+facility_codes = {"kern": 0, "user": 1, "mail": 2, "daemon": 3, "auth": 4,
+    "syslog": 5, "lpr": 6, "news": 7, "uucp": 8, "cron": 9, "authpriv": 10,
+    "ftp": 11, "local0": 16, "local1": 17, "local2": 18, "local3": 19,
+    "local4": 20, "local5": 21, "local6": 22, "local7": 23}
+
+priority_codes = {"emerg": 0, "alert": 1, "crit": 2, "err": 3, "warning": 4,
+    "notice": 5, "info": 6, "debug": 7}
+
+_months = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", 
+    "Oct", "Nov", "Dec")
+
+
 class WriterException(Exception):
     """ A generic exception class for the Writer """
 
@@ -60,6 +79,146 @@ class SyslogWriter(object):
                 return False
 
 
+class SocketSyslogWriter(object):
+    """ Accept Message() objects and send them to the local syslog socket
+
+    Unlike SyslogWriter, this writer does not touch the process-global state 
+    of the syslog module.  It keeps one long-lived AF_UNIX datagram socket 
+    connected to the local syslog service, formats RFC3164 records itself, and
+    only reconnects after a send fails.  The ident is written into each record
+    so concurrent writes from threaded servers can't clobber each other.
+    """
 
+    _instance = None
+    _initialized = False
+
+    def __new__(cls, *args, **kwds):
+        """ Enforce singleton behavior """
+        if cls._instance is None:
+            cls._instance = object.__new__(cls)
+        return cls._instance
 
+    def __init__(self, config=None):
+        """ Initialize the SocketSyslogWriter and prepare for writing 
+
+        The optional config is a Config or ConfigSnapshot; Config() is used
+        if none is given.  It is only bound when the writer is first created,
+        so requests in flight never see it change; see reload().
+        """
+        if self._initialized is False:
+            if config is None:
+                config = ocelog.config.Config()
+            self.config = config
+            self._lock = threading.Lock()
+            self._sock = None
+            self._sock_path = None
+            self._stamp = (None, None)
+            self._initialized = True
+
+    def reload(self, config=None):
+        """ Use config, or the published snapshot, for the writes that follow """
+        if config is None:
+            config = ocelog.config.current()
+        self.config = config
+
+    def _connect(self):
+        """ (Re)connect the datagram socket to the configured syslog socket """
+        self._lock.acquire()
+        try:
+            self.close()
+            path = self.config.syslog.socket_path
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                sock.connect(path)
+            except socket.error:
+                sock.close()
+                raise
+            self._sock = sock
+            self._sock_path = path
+            return sock
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """ Close the syslog socket if it is open """
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+
+    def _timestamp(self, now):
+        """ Return the RFC3164 timestamp, formatted at most once per second """
+        second = int(now)
+        cached_second, stamp = self._stamp
+        if second != cached_second:
+            t = time.localtime(second)
+            stamp = "%s %2d %02d:%02d:%02d" % (_months[t.tm_mon - 1], 
+                    t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+            self._stamp = (second, stamp)
+        return stamp
+
+    def format(self, message, now=None):
+        """ Return the RFC3164 record for a message """
+        if now is None:
+            now = time.time()
+        pri = (facility_codes[message.facility] << 3) | \
+                priority_codes[message.priority]
+        record = "<%d>%s %s %s: %s" % (pri, self._timestamp(now), 
+                message.hostname, message.appname, message.msg)
+        if isinstance(record, unicode):
+            record = record.encode("utf-8")
+        return record
 
+    def write(self, message):
+        """ Accept ocelog.message.Message and write to the syslog socket """
+        if not self.config.syslog.enabled:
+            return True
+        try:
+            record = self.format(message)
+        except:
+            return False
+        return self.send(record)
+
+    def write_batch(self, messages):
+        """ Write a list of messages in one pass and return a list of results
+
+        The timestamp and connection are shared by the whole batch.  Syslog 
+        takes one record per datagram, so each record is still its own send.
+        """
+        if not self.config.syslog.enabled:
+            return [True] * len(messages)
+        now = time.time()
+        results = []
+        for message in messages:
+            try:
+                record = self.format(message, now)
+            except:
+                results.append(False)
+                continue
+            results.append(self.send(record))
+        return results
+
+    def send(self, record, wait=True):
+        """ Send one formatted record, reconnecting once if the send fails
+
+        With wait=False the send gives up rather than blocking when the 
+        syslog service is not keeping up (its socket buffer is full); the 
+        connection is kept and False is returned.
+        """
+        flags = 0
+        if not wait:
+            flags = socket.MSG_DONTWAIT
+        # one retry with a fresh connection covers a restarted syslog daemon
+        for attempt in (1, 2):
+            try:
+                sock = self._sock
+                # a reloaded config may point at a different socket
+                if sock is None or \
+                        self._sock_path != self.config.syslog.socket_path:
+                    sock = self._connect()
+                sock.send(record, flags)
+                return True
+            except socket.error, e:
+                if e.args and e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return False
+                self.close()
+        return False
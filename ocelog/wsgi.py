@@ -29,9 +29,10 @@ from ocelog.bottle import request
 from ocelog.bottle import abort
 from ocelog.bottle import send_file
 from ocelog.bottle import default_app
-import ocelog.message
-import ocelog.auth
-import ocelog.writer
+from ocelog.bottle import HTTP_CODES
+import ocelog.handlers
+import ocelog.metrics
+import ocelog.routing
 
 
 #-----------------------------------------------------------------------------
@@ -40,6 +41,37 @@ import ocelog.writer
 file_path = os.path.dirname(os.path.abspath(__file__))
 doc_path = os.path.normpath(os.path.join(file_path, "../doc/"))
 
+# bottle predates 422 (rfc 4918) and 429 (rfc 6585)
+HTTP_CODES.setdefault(422, "UNPROCESSABLE ENTITY")
+HTTP_CODES.setdefault(429, "TOO MANY REQUESTS")
+
+# dispatch the routes below with a compiled ocelog.routing.Router
+application = default_app(ocelog.routing.RoutedBottle())
+
+def timed(handler):
+    """ Decorate a handler to time it with an ocelog.metrics.RequestTimer
+
+    The timer is passed to the handler as its timer argument so that it can 
+    mark the end of each stage.  The whole request is recorded under the 
+    final response status.
+    """
+    def wrapper(**kargs):
+        timer = ocelog.metrics.RequestTimer(request.path)
+        try:
+            return handler(timer=timer, **kargs)
+        finally:
+            timer.finish(response.status)
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    return wrapper
+
+def send_reply(reply):
+    """ Copy an ocelog.handlers.Reply into the response and return its body """
+    response.status = reply.status
+    for name, value in reply.headers:
+        response.header[name] = value
+    return reply.body
+
 @route('/', method='GET')
 @route('/log', method='GET')
 def show_help_doc():
@@ -48,53 +80,42 @@ def show_help_doc():
     return send_file("help.htm", root=doc_path)
 
 @route('/log', method='POST')
-def log():
-    """ Accept a message and send it to syslog
+@timed
+def log(timer):
+    """ Accept a message and send it to syslog (see ocelog.handlers.log) """
+    return send_reply(ocelog.handlers.admitted(ocelog.handlers.log,
+            request.environ, timer))
+
+@route('/log/batch', method='POST')
+@timed
+def log_batch(timer):
+    """ Accept many messages in one request and send them to syslog
+
+    See ocelog.handlers.log_batch.
+    """
+    return send_reply(ocelog.handlers.admitted(ocelog.handlers.log_batch,
+            request.environ, timer))
 
-    1> filter the request by headers
-    2> authorize the request if required (sec token)
-    3> validate the incoming message
-    4> write the message
+@application.not_allowed()
+@timed
+def invalid_method(timer, allowed):
+    """ Return a 405 for invalid methods on valid uris
 
+    The router finds these itself, with the methods the uri does allow.
     """
-    # Confirm support for incoming content-type
-    content_type = request.environ['CONTENT_TYPE']
-    if content_type != "application/x-www-form-urlencoded":
-        response.header["x-ocelog-error"] = "Data must be x-www-form-urlencoded"
-        response.status = 415
-        return
-    # Authorize the request
-    authorized = ocelog.auth.authorize_request(request)
-    if not authorized:
-        response.header['x-ocelog-error'] = "Request failed authorization"
-        response.status = 400
-        return
-    # Extract and validate the message
-    message = ocelog.message.parse_request(request)
-    if not message.valid:
-        response.header["x-ocelog-error"] = message.error_msg
-        response.status = 400
-        return
-    # If valid, attempt the write
-    owriter = ocelog.writer.SyslogWriter()
-    message.write(owriter)
-    if message.status == "success":
-        response.status = 201
-    else:
-        response.header["x-ocelog-error"] = message.error_msg
-        response.status = 400
-        return
-
-@route('/', method='POST')
-@route('/', method='PUT')
-@route('/', method='DELETE')
-@route('/log', method='PUT')
-@route('/log', method='DELETE')
-def invalid_method():
-    """ Return a 405 for invalid methods on valid uris """
     response.status = 405
+    response.header['Allow'] = ", ".join(allowed)
     return
 
+@route('/metrics', method='GET')
+def show_metrics():
+    """ Return the request counters and latencies in prometheus text format """
+    response.content_type = "text/plain; version=0.0.4"
+    return ocelog.metrics.render_prometheus()
+
+
+# compile the route table now rather than on the first request
+application.router.compile()
 
 # make the wsgi application available for servers to access
 application = default_app()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""bench_config.py - compare per-request Config() lookups with a snapshot
+
+A request to /log reads the configuration in the handler, in the auth 
+check, in Message(), and in the writer.  This benchmark times the reads one 
+request makes, first through the Config() singleton and its property 
+getters, then through a ConfigSnapshot that is looked up once.
+
+usage:
+    ./bench_config.py [iterations]
+
+examples:
+    ./bench_config.py
+    ./bench_config.py 1000000
+
+"""
+
+import os.path
+import sys
+import timeit
+
+bench_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(bench_file_path, "../../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+
+
+def per_request_config():
+    """ The config reads of one request, going through Config() each time """
+    # wsgi.log
+    oconfig = ocelog.config.Config()
+    oconfig.message.max_request_size
+    oconfig.queue.enabled
+    # auth.authorize_request
+    oconfig = ocelog.config.Config()
+    oconfig.security.require_token
+    # message.Message
+    oconfig = ocelog.config.Config()
+    oconfig.message.default_facility
+    oconfig.message.default_priority
+    # writer.SocketSyslogWriter
+    oconfig = ocelog.config.Config()
+    oconfig.syslog.enabled
+    oconfig.syslog.socket_path
+
+def per_request_snapshot():
+    """ The same config reads, using one snapshot for the whole request """
+    oconfig = ocelog.config.current()
+    oconfig.message.max_request_size
+    oconfig.queue.enabled
+    oconfig.security.require_token
+    oconfig.message.default_facility
+    oconfig.message.default_priority
+    oconfig.syslog.enabled
+    oconfig.syslog.socket_path
+
+
+if __name__=="__main__":
+
+    iterations = 200000
+    if len(sys.argv) == 2:
+        iterations = int(sys.argv[1])
+
+    ocelog.config.Config()
+    ocelog.config.publish(ocelog.config.Config().snapshot())
+
+    results = []
+    for func in (per_request_config, per_request_snapshot):
+        best = min(timeit.repeat(func, repeat=5, number=iterations))
+        results.append((func.__name__, best / iterations * 1e9))
+
+    print
+    print "config reads per request (%s iterations, best of 5)" % iterations
+    for name, nsec in results:
+        print "  %-22s %8.0f ns" % (name, nsec)
+    saved = results[0][1] - results[1][1]
+    print "  %-22s %8.0f ns (%.0f%%)" % ("saved per request", saved,
+            100.0 * saved / results[0][1])
+    print
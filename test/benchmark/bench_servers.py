@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""bench_servers.py - http throughput of ocelog.wsgi.application per server
+
+Each server runs ocelog.wsgi.application in a child process on a local
+port, with syslog writing enabled and pointed at a local datagram socket
+that discards everything (the null sink).  Client processes then post the
+same valid /log message as fast as the server answers, for a fixed time,
+over a number of connections.  Each client connection is kept alive if the
+server allows it and reopened when the server closes it.
+
+Servers:
+    wsgiref     bottle.WSGIRefServer (the dev server): http/1.0, one
+                request at a time, a new connection per request
+    event       ocelog.eventserver.EventServer: http/1.1 keep-alive, with
+                the handlers on 8 threads
+    event_loop  the same, with the handlers on the loop's thread
+    cherrypy    bottle.CherryPyServer, if cherrypy is installed
+    paste       bottle.PasteServer, if paste is installed
+    fapws       bottle.FapwsServer, if fapws is installed
+
+Servers whose packages aren't installed are skipped.  Requests per second
+and latency percentiles are printed, and can be saved as JSON with
+--output.
+
+usage:
+    ./bench_servers.py [options] [server ...]
+
+examples:
+    ./bench_servers.py
+    ./bench_servers.py -c 32 -d 10 wsgiref event
+
+"""
+
+import httplib
+import json
+import multiprocessing
+import optparse
+import os
+import os.path
+import platform
+import signal
+import socket
+import sys
+import threading
+import time
+
+bench_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(bench_file_path, "../../"))
+sys.path.append(ocelog_path)
+
+import ocelog.bottle
+import ocelog.config
+import ocelog.eventserver
+import ocelog.wsgi
+
+from bench_wsgi import NullSink, configure, log_body
+
+
+#-----------------------------------------------------------------------------
+# servers - each runs ocelog.wsgi.application on a port until killed
+#-----------------------------------------------------------------------------
+def run_adapter(adapter, port):
+    """ Serve with one of bottle's server adapters """
+    adapter(host="127.0.0.1", port=port).run(ocelog.wsgi.application)
+
+def run_wsgiref(port):
+    run_adapter(ocelog.bottle.WSGIRefServer, port)
+
+def run_event(port, threads=8):
+    server = ocelog.eventserver.EventServer(ocelog.wsgi.application,
+            "127.0.0.1", port, threads=threads)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+    server.serve_forever()
+
+def run_event_loop(port):
+    run_event(port, threads=0)
+
+def run_cherrypy(port):
+    run_adapter(ocelog.bottle.CherryPyServer, port)
+
+def run_paste(port):
+    run_adapter(ocelog.bottle.PasteServer, port)
+
+def run_fapws(port):
+    run_adapter(ocelog.bottle.FapwsServer, port)
+
+# name, the module the server needs, the function running it
+servers = (
+    ("wsgiref", None, run_wsgiref),
+    ("event", None, run_event),
+    ("event_loop", None, run_event_loop),
+    ("cherrypy", "cherrypy.wsgiserver", run_cherrypy),
+    ("paste", "paste.httpserver", run_paste),
+    ("fapws", "fapws._evwsgi", run_fapws),
+    )
+
+def installed(module):
+    """ Return True if the module a server needs can be imported """
+    if module is None:
+        return True
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+def free_port():
+    """ Return a port nothing is listening on """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def start_server(run, port, sink):
+    """ Fork a child serving on port and return its pid once it answers """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # the adapters log every request
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+            configure(sink.path)
+            run(port)
+        finally:
+            os._exit(0)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 1).close()
+            return pid
+        except socket.error:
+            time.sleep(0.05)
+    stop_server(pid)
+    raise RuntimeError("the server didn't start")
+
+def stop_server(pid):
+    """ Stop a server child """
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        if os.waitpid(pid, os.WNOHANG)[0]:
+            return
+        time.sleep(0.05)
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+
+
+#-----------------------------------------------------------------------------
+# clients
+#-----------------------------------------------------------------------------
+def post_until(port, end, results):
+    """ Post /log over one connection until end, appending the latencies """
+    headers = {'Content-Type': "application/x-www-form-urlencoded"}
+    conn = None
+    latencies = []
+    errors = 0
+    while time.time() < end:
+        started = time.time()
+        try:
+            if conn is None:
+                conn = httplib.HTTPConnection("127.0.0.1", port, timeout=10)
+            conn.request("POST", "/log", log_body, headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 201:
+                errors += 1
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (socket.error, httplib.HTTPException):
+            errors += 1
+            if conn is not None:
+                conn.close()
+            conn = None
+            continue
+        latencies.append(time.time() - started)
+    if conn is not None:
+        conn.close()
+    results.append((latencies, errors))
+
+def client(port, connections, duration, queue):
+    """ Run a client process holding several connections on threads """
+    end = time.time() + duration
+    results = []
+    threads = [threading.Thread(target=post_until, args=(port, end, results))
+            for i in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies = []
+    errors = 0
+    for thread_latencies, thread_errors in results:
+        latencies.extend(thread_latencies)
+        errors += thread_errors
+    queue.put((latencies, errors))
+
+def percentile(sorted_values, q):
+    """ Return the q quantile of an already sorted list """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+def load(port, connections, processes, duration):
+    """ Load a server and return its results """
+    queue = multiprocessing.Queue()
+    per_process = max(1, connections // processes)
+    clients = [multiprocessing.Process(target=client,
+            args=(port, per_process, duration, queue))
+            for i in range(processes)]
+    started = time.time()
+    for process in clients:
+        process.start()
+    latencies = []
+    errors = 0
+    for process in clients:
+        process_latencies, process_errors = queue.get()
+        latencies.extend(process_latencies)
+        errors += process_errors
+    for process in clients:
+        process.join()
+    elapsed = time.time() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+
+
+if __name__=="__main__":
+
+    parser = optparse.OptionParser(usage="%prog [options] [server ...]")
+    parser.add_option("-c", "--connections", type="int", default=16,
+            help="client connections (default 16)")
+    parser.add_option("-p", "--processes", type="int", default=2,
+            help="client processes sharing the connections (default 2)")
+    parser.add_option("-d", "--duration", type="float", default=5.0,
+            help="seconds to load each server (default 5)")
+    parser.add_option("-o", "--output", help="write the results as JSON here")
+    options, names = parser.parse_args()
+    unknown = set(names) - set(name for name, module, run in servers)
+    if unknown:
+        parser.error("unknown server(s): %s" % ", ".join(sorted(unknown)))
+
+    sink = NullSink()
+    results = {}
+    try:
+        for name, module, run in servers:
+            if names and name not in names:
+                continue
+            if not installed(module):
+                print "%-10s skipped, %s isn't installed" % (name, module)
+                continue
+            port = free_port()
+            pid = start_server(run, port, sink)
+            try:
+                results[name] = load(port, options.connections,
+                        options.processes, options.duration)
+            finally:
+                stop_server(pid)
+    finally:
+        sink.close()
+
+    print
+    print "%-10s %10s %10s %10s %8s" % ("server", "req/s", "p50", "p99",
+            "errors")
+    for name, module, run in servers:
+        if name in results:
+            result = results[name]
+            print "%-10s %10.0f %8.2fms %8.2fms %8d" % (name,
+                    result['requests_per_sec'], result['p50_ms'],
+                    result['p99_ms'], result['errors'])
+    print
+
+    if options.output:
+        output = open(options.output, "w")
+        json.dump({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'connections': options.connections,
+            'processes': options.processes,
+            'duration': options.duration,
+            'results': results,
+            }, output, indent=2, sort_keys=True)
+        output.close()
@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+"""bench_wsgi.py - in-process benchmarks of ocelog.wsgi.application
+
+Every benchmark runs inside this process: requests are synthetic WSGI
+environs handed straight to ocelog.wsgi.application, so no network or
+server is involved.  Syslog writing is enabled and pointed at a local
+datagram socket that discards everything (the null sink).  The remote
+writer benchmarks send to local udp and tcp null relays.
+
+Full requests:
+    request_log_201       POST /log with a valid message
+    request_log_400       POST /log with an invalid facility
+    request_log_token     POST /log with an hmac-sha256 token required
+    request_batch_100     POST /log/batch with 100 records
+    request_root          GET /
+    lean_log_201          POST /log with a valid message, through
+                          ocelog.lean.application
+    lean_batch_100        POST /log/batch with 100 records, through
+                          ocelog.lean.application
+    lean_root             GET /, through ocelog.lean.application
+
+Components, in isolation:
+    bottle_request_post   bottle Request.bind() and Request.POST
+    match_url_static_500  bottle Bottle.match_url of a static route, among 500
+    match_url_param_500   bottle Bottle.match_url of the last parameterized
+                          route, among 500
+    router_static_500     ocelog.routing.Router.match of a static route,
+                          among 500
+    router_param_500      ocelog.routing.Router.match of the last
+                          parameterized route, among 500
+    form_log_request      ocelog.form.LogRequest
+    parse_request         ocelog.message.parse_request
+    message               ocelog.message.Message
+    authorize_request     ocelog.auth.authorize_request (hmac-sha256)
+    writer                ocelog.writer.SocketSyslogWriter.write
+    remote_udp            ocelog.remote.RemoteSyslogWriter.write over udp
+    remote_tcp_batch_100  ocelog.remote.RemoteSyslogWriter.write_batch of 100
+                          records over tcp
+    file_writer           ocelog.logfile.FileWriter.write (interval fsync)
+
+Results are printed and can be saved as JSON with --output.  Given a saved
+--baseline, any benchmark more than --tolerance slower than its baseline is
+reported and the script exits with status 1.
+
+usage:
+    ./bench_wsgi.py [options] [benchmark ...]
+
+examples:
+    ./bench_wsgi.py
+    ./bench_wsgi.py --output baseline.json
+    ./bench_wsgi.py --baseline baseline.json --tolerance 0.10
+    ./bench_wsgi.py -n 2000 request_log_201 writer
+
+"""
+
+import json
+import optparse
+import os
+import os.path
+import platform
+import shutil
+import socket
+import StringIO
+import sys
+import tempfile
+import threading
+import time
+import urllib
+
+bench_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(bench_file_path, "../../"))
+sys.path.append(ocelog_path)
+
+import ocelog.auth
+import ocelog.bottle
+import ocelog.config
+import ocelog.form
+import ocelog.lean
+import ocelog.logfile
+import ocelog.message
+import ocelog.remote
+import ocelog.routing
+import ocelog.writer
+import ocelog.wsgi
+
+
+#-----------------------------------------------------------------------------
+# fixtures
+#-----------------------------------------------------------------------------
+shared_secret = "beanbags"
+log_fields = {'facility': "local3", 'priority': "info", 'hostname': "webhost1",
+    'appname': "testapp", 'msg': "the coffee pot volume is low"}
+log_body = urllib.urlencode(log_fields)
+invalid_body = urllib.urlencode(dict(log_fields, facility="bad-facility"))
+batch_body = "\n".join([log_body] * 100) + "\n"
+
+
+class NullSink(object):
+    """ A local datagram socket that reads and discards every record """
+
+    def __init__(self):
+        """ Bind the socket and start draining it """
+        self.directory = tempfile.mkdtemp(prefix="ocelog-bench-")
+        self.path = os.path.join(self.directory, "log")
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.records = 0
+        thread = threading.Thread(target=self._drain)
+        thread.daemon = True
+        thread.start()
+
+    def _drain(self):
+        """ Read records forever """
+        while True:
+            self.sock.recv(65536)
+            self.records += 1
+
+    def close(self):
+        """ Remove the socket directory """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class NullRelay(object):
+    """ Local udp and tcp listeners that read and discard everything """
+
+    def __init__(self):
+        """ Bind both sockets and start draining them """
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind(("127.0.0.1", 0))
+        self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp.bind(("127.0.0.1", 0))
+        self.tcp.listen(16)
+        for target in (self._drain_udp, self._accept):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def _drain_udp(self):
+        """ Read datagrams forever """
+        while True:
+            self.udp.recv(65536)
+
+    def _accept(self):
+        """ Accept connections and drain each on its own thread """
+        while True:
+            conn, address = self.tcp.accept()
+            thread = threading.Thread(target=self._drain_tcp, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _drain_tcp(self, conn):
+        """ Read a stream until it closes """
+        while conn.recv(65536):
+            pass
+
+
+def make_environ(method, path, body="",
+        content_type="application/x-www-form-urlencoded", headers=None):
+    """ Return a synthetic WSGI environ for a request """
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': "",
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'REMOTE_ADDR': "10.1.1.1",
+        'SERVER_NAME': "localhost",
+        'SERVER_PORT': "8888",
+        'SERVER_PROTOCOL': "HTTP/1.1",
+        'wsgi.input': StringIO.StringIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': "http",
+        }
+    if headers:
+        environ.update(headers)
+    return environ
+
+def start_response(status, headers, exc_info=None):
+    """ A WSGI start_response that discards the response """
+    return None
+
+def configure(sink_path, require_token=False):
+    """ Set and publish the configuration used by the benchmarks """
+    oconfig = ocelog.config.Config()
+    oconfig.syslog.enabled = True
+    oconfig.syslog.socket_path = sink_path
+    oconfig.security.shared_secret = shared_secret
+    oconfig.security.token_type = "hmac-sha256"
+    oconfig.security.require_token = require_token
+    return ocelog.config.publish(oconfig.snapshot())
+
+
+#-----------------------------------------------------------------------------
+# benchmarks - each returns a function that performs one operation
+#-----------------------------------------------------------------------------
+def request(method, path, body="", content_type="application/x-www-form-urlencoded",
+        headers=None, application=None):
+    """ Return a function that sends one request through the application """
+    if application is None:
+        application = ocelog.wsgi.application
+    def run():
+        environ = make_environ(method, path, body, content_type, headers)
+        for chunk in application(environ, start_response):
+            pass
+    return run
+
+def bench_request_log_201(sink):
+    configure(sink.path)
+    return request("POST", "/log", log_body)
+
+def bench_request_log_400(sink):
+    configure(sink.path)
+    return request("POST", "/log", invalid_body)
+
+def bench_request_log_token(sink):
+    configure(sink.path, require_token=True)
+    token = ocelog.auth.generate_hmac_token(log_fields['msg'], shared_secret)
+    return request("POST", "/log", log_body, headers={'HTTP_X_TOKEN': token})
+
+def bench_request_batch_100(sink):
+    configure(sink.path)
+    return request("POST", "/log/batch", batch_body, content_type="text/plain")
+
+def bench_request_root(sink):
+    configure(sink.path)
+    return request("GET", "/")
+
+def bench_lean_log_201(sink):
+    configure(sink.path)
+    return request("POST", "/log", log_body,
+            application=ocelog.lean.application)
+
+def bench_lean_batch_100(sink):
+    configure(sink.path)
+    return request("POST", "/log/batch", batch_body, content_type="text/plain",
+            application=ocelog.lean.application)
+
+def bench_lean_root(sink):
+    configure(sink.path)
+    return request("GET", "/", application=ocelog.lean.application)
+
+def bench_bottle_request_post(sink):
+    configure(sink.path)
+    brequest = ocelog.bottle.Request()
+    def run():
+        brequest.bind(make_environ("POST", "/log", log_body))
+        brequest.POST
+    return run
+
+def route_table(add, routes=500):
+    """ Add routes, half static and half parameterized, over four methods """
+    for i in range(routes // 2):
+        method = ("GET", "POST", "PUT", "DELETE")[i % 4]
+        add("/svc%d/items" % i, lambda **kargs: None, method=method)
+        add("/svc%d/items/:id/:field" % i, lambda **kargs: None, method=method)
+
+def bench_match_url_static_500(sink):
+    bottle = ocelog.bottle.Bottle()
+    route_table(bottle.add_route)
+    def run():
+        bottle.match_url("/svc200/items", "GET")
+    return run
+
+def bench_match_url_param_500(sink):
+    bottle = ocelog.bottle.Bottle()
+    route_table(bottle.add_route)
+    def run():
+        bottle.match_url("/svc248/items/7/name", "GET")
+    return run
+
+def bench_router_static_500(sink):
+    router = ocelog.routing.Router()
+    route_table(router.add)
+    router.compile()
+    def run():
+        router.match("/svc200/items", "GET")
+    return run
+
+def bench_router_param_500(sink):
+    router = ocelog.routing.Router()
+    route_table(router.add)
+    router.compile()
+    def run():
+        router.match("/svc248/items/7/name", "GET")
+    return run
+
+def bench_form_log_request(sink):
+    configure(sink.path)
+    def run():
+        ocelog.form.LogRequest(make_environ("POST", "/log", log_body), 65536)
+    return run
+
+def bench_parse_request(sink):
+    oconfig = configure(sink.path)
+    log_request = ocelog.form.LogRequest(make_environ("POST", "/log", log_body), 65536)
+    def run():
+        ocelog.message.parse_request(log_request, oconfig)
+    return run
+
+def bench_message(sink):
+    oconfig = configure(sink.path)
+    def run():
+        ocelog.message.Message("webhost1", "testapp", log_fields['msg'],
+                "local3", "info", oconfig)
+    return run
+
+def bench_authorize_request(sink):
+    oconfig = configure(sink.path, require_token=True)
+    token = ocelog.auth.generate_hmac_token(log_fields['msg'], shared_secret)
+    environ = make_environ("POST", "/log", log_body, headers={'HTTP_X_TOKEN': token})
+    log_request = ocelog.form.LogRequest(environ, 65536)
+    def run():
+        ocelog.auth.authorize_request(log_request, oconfig)
+    return run
+
+def bench_writer(sink):
+    oconfig = configure(sink.path)
+    owriter = ocelog.writer.SocketSyslogWriter(oconfig)
+    message = ocelog.message.Message("webhost1", "testapp", log_fields['msg'],
+            "local3", "info", oconfig)
+    def run():
+        owriter.write(message)
+    return run
+
+def remote_writer(protocol):
+    """ Return the remote writer pointed at a new null relay """
+    oconfig = ocelog.config.Config()
+    relay = NullRelay()
+    oconfig.remote.protocol = protocol
+    oconfig.remote.relays = [getattr(relay, protocol).getsockname()]
+    owriter = ocelog.remote.RemoteSyslogWriter(oconfig.snapshot())
+    owriter.close()
+    return owriter
+
+def bench_remote_udp(sink):
+    oconfig = configure(sink.path)
+    owriter = remote_writer("udp")
+    message = ocelog.message.Message("webhost1", "testapp", log_fields['msg'],
+            "local3", "info", oconfig)
+    def run():
+        owriter.write(message)
+    return run
+
+def bench_remote_tcp_batch_100(sink):
+    oconfig = configure(sink.path)
+    owriter = remote_writer("tcp")
+    messages = [ocelog.message.Message("webhost1", "testapp", log_fields['msg'],
+            "local3", "info", oconfig)] * 100
+    def run():
+        owriter.write_batch(messages)
+    return run
+
+def bench_file_writer(sink):
+    oconfig = ocelog.config.Config()
+    oconfig.file.path = os.path.join(sink.directory, "ocelog.log")
+    oconfig = configure(sink.path)
+    owriter = ocelog.logfile.FileWriter(oconfig)
+    message = ocelog.message.Message("webhost1", "testapp", log_fields['msg'],
+            "local3", "info", oconfig)
+    def run():
+        owriter.write(message)
+    return run
+
+benchmarks = (
+    ("request_log_201", bench_request_log_201),
+    ("request_log_400", bench_request_log_400),
+    ("request_log_token", bench_request_log_token),
+    ("request_batch_100", bench_request_batch_100),
+    ("request_root", bench_request_root),
+    ("lean_log_201", bench_lean_log_201),
+    ("lean_batch_100", bench_lean_batch_100),
+    ("lean_root", bench_lean_root),
+    ("bottle_request_post", bench_bottle_request_post),
+    ("match_url_static_500", bench_match_url_static_500),
+    ("match_url_param_500", bench_match_url_param_500),
+    ("router_static_500", bench_router_static_500),
+    ("router_param_500", bench_router_param_500),
+    ("form_log_request", bench_form_log_request),
+    ("parse_request", bench_parse_request),
+    ("message", bench_message),
+    ("authorize_request", bench_authorize_request),
+    ("writer", bench_writer),
+    ("remote_udp", bench_remote_udp),
+    ("remote_tcp_batch_100", bench_remote_tcp_batch_100),
+    ("file_writer", bench_file_writer),
+    )
+
+
+#-----------------------------------------------------------------------------
+# running and comparing
+#-----------------------------------------------------------------------------
+def time_operation(run, iterations, repeat):
+    """ Return the best time per operation, in microseconds """
+    for i in range(min(iterations, 100)):
+        run()
+    best = None
+    for r in range(repeat):
+        started = time.time()
+        for i in xrange(iterations):
+            run()
+        elapsed = time.time() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / iterations * 1000000.0
+
+def run_benchmarks(names, iterations, repeat):
+    """ Run the named benchmarks and return the results document """
+    sink = NullSink()
+    try:
+        results = {}
+        for name, setup in benchmarks:
+            if names and name not in names:
+                continue
+            results[name] = {'usec_per_op': time_operation(setup(sink),
+                    iterations, repeat)}
+    finally:
+        sink.close()
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': iterations,
+        'repeat': repeat,
+        'results': results,
+        }
+
+def compare(document, baseline, tolerance):
+    """ Print a comparison with a baseline and return the regressed names """
+    regressions = []
+    print "%-22s %12s %12s %8s" % ("benchmark", "baseline", "current", "change")
+    for name in sorted(document['results']):
+        current = document['results'][name]['usec_per_op']
+        if name not in baseline['results']:
+            print "%-22s %12s %10.2fus %8s" % (name, "-", current, "new")
+            continue
+        previous = baseline['results'][name]['usec_per_op']
+        change = (current - previous) / previous
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print "%-22s %10.2fus %10.2fus %+7.1f%%%s" % (name, previous, current,
+                change * 100, flag)
+    return regressions
+
+
+if __name__=="__main__":
+
+    parser = optparse.OptionParser(usage="%prog [options] [benchmark ...]")
+    parser.add_option("-n", "--iterations", type="int", default=5000,
+            help="operations per timing run (default 5000)")
+    parser.add_option("-r", "--repeat", type="int", default=5,
+            help="timing runs per benchmark, the best is kept (default 5)")
+    parser.add_option("-o", "--output", help="write the results as JSON here")
+    parser.add_option("-b", "--baseline", help="compare against this JSON file")
+    parser.add_option("-t", "--tolerance", type="float", default=0.25,
+            help="allowed slowdown against the baseline (default 0.25)")
+    options, names = parser.parse_args()
+    unknown = set(names) - set(name for name, setup in benchmarks)
+    if unknown:
+        parser.error("unknown benchmark(s): %s" % ", ".join(sorted(unknown)))
+
+    document = run_benchmarks(names, options.iterations, options.repeat)
+
+    print
+    if options.baseline:
+        baseline = json.load(open(options.baseline))
+        regressions = compare(document, baseline, options.tolerance)
+    else:
+        regressions = []
+        for name, setup in benchmarks:
+            if name in document['results']:
+                print "%-22s %10.2fus" % (name,
+                        document['results'][name]['usec_per_op'])
+    print
+
+    if options.output:
+        output = open(options.output, "w")
+        json.dump(document, output, indent=2, sort_keys=True)
+        output.close()
+
+    if regressions:
+        print "FAILED: %d benchmark(s) regressed more than %.0f%%: %s" % (
+                len(regressions), options.tolerance * 100,
+                ", ".join(regressions))
+        sys.exit(1)
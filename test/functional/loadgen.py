@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""loadgen.py - open-loop load generator for the ocelog /log uri
+
+Requests are sent at a fixed target arrival rate, whatever the server's
+response times, using a pool of worker threads that each hold one
+keep-alive connection.  Request i is scheduled for start + i/rate.  Its
+latency is measured from that scheduled time rather than from when it was
+actually sent, so time spent waiting for a busy connection is counted
+(correcting for coordinated omission).  The uncorrected service time is
+reported alongside.
+
+Records come from the exerciser's randomized generate_log_request(), so
+some of them are expected to be rejected with a 400 (bad facility, or a bad
+token when the server requires tokens).
+
+usage:
+    ./loadgen.py [options] <host> <port>
+
+examples:
+    ./loadgen.py localhost 8888
+    ./loadgen.py --rate 2000 --duration 30 --connections 64 localhost 8888
+
+"""
+
+import httplib
+import itertools
+import optparse
+import socket
+import sys
+import threading
+import time
+import urllib
+
+from exerciser import generate_log_request
+
+
+class Worker(threading.Thread):
+    """ Send scheduled requests over one keep-alive connection """
+
+    def __init__(self, host, port, schedule, start, rate, end, timeout):
+        """ Share the schedule counter with the other workers """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.host = host
+        self.port = port
+        self.schedule = schedule
+        self.start_time = start
+        self.rate = rate
+        self.end_time = end
+        self.timeout = timeout
+        self.conn = None
+        self.latencies = []
+        self.service_times = []
+        self.statuses = {}
+        self.errors = 0
+        self.connects = 0
+
+    def _connection(self):
+        """ Return the open connection, connecting if needed """
+        if self.conn is None:
+            self.conn = httplib.HTTPConnection(self.host, self.port,
+                    timeout=self.timeout)
+            self.connects += 1
+        return self.conn
+
+    def _close(self):
+        """ Drop the connection so the next request reconnects """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def run(self):
+        """ Take the next slot from the schedule until the run is over """
+        while True:
+            intended = self.start_time + self.schedule.next() / self.rate
+            if intended >= self.end_time:
+                break
+            delay = intended - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            (params, token) = generate_log_request()
+            body = urllib.urlencode(params)
+            headers = {'Content-Type': "application/x-www-form-urlencoded",
+                       'X-Token': token}
+            sent = time.time()
+            try:
+                conn = self._connection()
+                conn.request("POST", "/log", body, headers)
+                response = conn.getresponse()
+                response.read()
+                if response.will_close:
+                    self._close()
+            except (socket.error, httplib.HTTPException):
+                self.errors += 1
+                self._close()
+                continue
+            done = time.time()
+            self.latencies.append(done - intended)
+            self.service_times.append(done - sent)
+            self.statuses[response.status] = \
+                    self.statuses.get(response.status, 0) + 1
+        self._close()
+
+
+def percentile(sorted_values, q):
+    """ Return the q quantile of an already sorted list """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+def report(workers, elapsed, rate):
+    """ Print throughput and latency percentiles for a finished run """
+    latencies = sorted(itertools.chain(*[w.latencies for w in workers]))
+    service_times = sorted(itertools.chain(*[w.service_times for w in workers]))
+    statuses = {}
+    for worker in workers:
+        for status, count in worker.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    errors = sum(w.errors for w in workers)
+    connects = sum(w.connects for w in workers)
+    completed = len(latencies)
+
+    print
+    print "target rate:     %.0f req/s" % rate
+    print "achieved rate:   %.0f req/s" % (completed / elapsed)
+    print "completed:       %d in %.1fs" % (completed, elapsed)
+    print "errors:          %d" % errors
+    print "connections:     %d" % connects
+    print "status codes:    %s" % ", ".join(["%s=%d" % (s, statuses[s])
+            for s in sorted(statuses)])
+    print
+    print "%-10s %14s %14s" % ("", "latency", "service time")
+    for label, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99),
+            ("p99.9", 0.999), ("max", 1.0)):
+        print "%-10s %12.2fms %12.2fms" % (label,
+                percentile(latencies, q) * 1000,
+                percentile(service_times, q) * 1000)
+    print
+    print "latency is measured from each request's scheduled send time"
+    print
+
+
+if __name__=="__main__":
+
+    parser = optparse.OptionParser(usage="%prog [options] <host> <port>")
+    parser.add_option("-r", "--rate", type="float", default=500,
+            help="target requests per second (default 500)")
+    parser.add_option("-d", "--duration", type="float", default=10,
+            help="seconds to run (default 10)")
+    parser.add_option("-c", "--connections", type="int", default=16,
+            help="worker threads, each with one connection (default 16)")
+    parser.add_option("-t", "--timeout", type="float", default=10,
+            help="socket timeout in seconds (default 10)")
+    options, args = parser.parse_args()
+    if len(args) != 2:
+        print
+        print __doc__
+        sys.exit(1)
+    host, port = args[0], int(args[1])
+
+    print
+    print "generating load on http://%s:%s/log" % (host, port)
+    print "rate: %.0f req/s, duration: %.0fs, connections: %d" % (
+            options.rate, options.duration, options.connections)
+
+    schedule = itertools.count()
+    start = time.time() + 0.1
+    end = start + options.duration
+    workers = [Worker(host, port, schedule, start, options.rate, end,
+            options.timeout) for i in range(options.connections)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    report(workers, max(time.time(), end) - start, options.rate)
@@ -2,6 +2,12 @@
 
 """
 
+import os
+import socket
+import tempfile
+import threading
+import time
+
 
 class MockMessage(object):
     """ A simple mock of ocelog.message.Message """
@@ -28,7 +34,8 @@ class MockBottleRequest(object):
     """ A simple mock of bottle.request """
 
     def __init__(self, hostname=None, appname=None, msg=None, facility=None, 
-            priority=None, token=None):
+            priority=None, token=None, remote_addr="10.1.1.1", body=None,
+            key_id=None):
         """ Return a populated request object """
         self.POST = {}
         self.POST['hostname'] = hostname
@@ -36,9 +43,13 @@ class MockBottleRequest(object):
         self.POST['msg'] = msg
         self.POST['facility'] = facility
         self.POST['priority'] = priority
+        self.body = body
         self.environ = {}
+        self.environ['REMOTE_ADDR'] = remote_addr
         if token is not None:
             self.environ['HTTP_X_TOKEN'] = token
+        if key_id is not None:
+            self.environ['HTTP_X_KEY_ID'] = key_id
 
 class MockSyslogWriter(object):
     """ A simple mock of ocelog.writer.SyslogWriter """
@@ -60,4 +71,162 @@ class MockSyslogWriter(object):
         return self.write_success
 
 
+class MockSyslogSocket(object):
+    """ A local stand-in for the /dev/log datagram socket """
+
+    def __init__(self):
+        """ Bind a datagram socket to a path in a temporary directory """
+        self.directory = tempfile.mkdtemp(prefix="ocelog-test-")
+        self.path = os.path.join(self.directory, "log")
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.settimeout(1.0)
+
+    def recv(self):
+        """ Return the next record received on the socket """
+        return self.sock.recv(65536)
+
+    def close(self):
+        """ Close the socket and remove the temporary directory """
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rmdir(self.directory)
+
+
+class MockRecordingWriter(object):
+    """ A writer that records every message it is given """
+
+    def __init__(self, write_success=True, delay=0):
+        """ Init and determine write() behavior """
+        self.write_success = write_success
+        self.delay = delay
+        self.messages = []
+
+    def write(self, message):
+        """ Record the message and return the configured result """
+        if self.delay:
+            time.sleep(self.delay)
+        self.messages.append(message)
+        return self.write_success
+
+
+class MockBatchWriter(MockRecordingWriter):
+    """ A recording writer that also supports write_batch() """
+
+    def __init__(self, write_success=True, delay=0):
+        """ Init and determine write() behavior """
+        MockRecordingWriter.__init__(self, write_success, delay)
+        self.batches = []
+
+    def write_batch(self, messages):
+        """ Record the batch and return one result per message """
+        self.batches.append(list(messages))
+        return [self.write(message) for message in messages]
+
+
+
+
+class MockUdpListener(object):
+    """ A local stand-in for a remote syslog relay listening on udp """
+
+    def __init__(self):
+        """ Bind a datagram socket to a free port on the loopback address """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(1.0)
+        self.address = self.sock.getsockname()
+
+    def recv(self):
+        """ Return the next record received """
+        return self.sock.recv(65536)
+
+    def close(self):
+        """ Close the socket """
+        self.sock.close()
+
+
+class MockTcpListener(object):
+    """ A local stand-in for a remote syslog relay listening on tcp
+
+    Every connection is read on its own thread and the octet-counted frames
+    are collected, in the order they arrive, in records.
+    """
+
+    def __init__(self):
+        """ Listen on a free port on the loopback address """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.address = self.sock.getsockname()
+        self.records = []
+        self.connections = 0
+        self._conns = []
+        self._lock = threading.Lock()
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        """ Accept connections until the listening socket is closed """
+        while True:
+            try:
+                conn, address = self.sock.accept()
+            except socket.error:
+                return
+            self._lock.acquire()
+            self.connections += 1
+            self._conns.append(conn)
+            self._lock.release()
+            thread = threading.Thread(target=self._read, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _read(self, conn):
+        """ Split the stream from one connection into records """
+        buffered = ""
+        while True:
+            try:
+                data = conn.recv(65536)
+            except socket.error:
+                return
+            if not data:
+                return
+            buffered += data
+            while " " in buffered:
+                length, rest = buffered.split(" ", 1)
+                length = int(length)
+                if len(rest) < length:
+                    break
+                self._lock.acquire()
+                self.records.append(rest[:length])
+                self._lock.release()
+                buffered = rest[length:]
+
+    def wait_for(self, count, timeout=1.0):
+        """ Wait until count records have arrived and return them """
+        deadline = time.time() + timeout
+        while len(self.records) < count and time.time() < deadline:
+            time.sleep(0.005)
+        return list(self.records)
+
+    def disconnect(self):
+        """ Close every accepted connection, as a relay dropping idle ones """
+        self._lock.acquire()
+        conns, self._conns = self._conns, []
+        self._lock.release()
+        for conn in conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            conn.close()
 
+    def close(self):
+        """ Stop listening and close every accepted connection """
+        self.sock.close()
+        self._lock.acquire()
+        for conn in self._conns:
+            conn.close()
+        self._lock.release()
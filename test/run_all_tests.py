@@ -9,15 +9,35 @@ the order of the tests inside each suite is also randomized.
 import unittest
 import random
 
+import test_admission
 import test_auth
 import test_config
+import test_dedup
+import test_eventserver
+import test_form
+import test_handlers
+import test_idempotency
+import test_journald
+import test_lean
+import test_logfile
 import test_message
+import test_metrics
+import test_pipeline
+import test_prefork
+import test_queued
+import test_ratelimit
+import test_remote
 import test_request_parsers
+import test_routing
+import test_spool
 import test_writer
 
 
-test_modules = (test_auth, test_config, test_message,
-        test_request_parsers, test_writer)
+test_modules = (test_admission, test_auth, test_config, test_dedup, 
+        test_eventserver, test_form, test_handlers, test_idempotency, 
+        test_journald, test_lean, test_logfile, test_message, test_metrics, 
+        test_pipeline, test_prefork, test_queued, test_ratelimit, test_remote, 
+        test_request_parsers, test_routing, test_spool, test_writer)
 
 suite_list = []
 for testmod in test_modules:
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import sys
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.admission
+import ocelog.message
+import ocelog.config
+import ocelog.metrics
+import ocelog.queued
+import ocelog_mock
+
+
+class TestAdmissionController(unittest.TestCase):
+    """ Test the ocelog.admission module
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py)
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        self.oconfig = ocelog.config.Config()
+        self.controller = ocelog.admission.AdmissionController()
+        self.controller.in_flight = 0
+        ocelog.metrics.reset()
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        self.controller.in_flight = 0
+        ocelog.queued._default_writer = None
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+
+    def admitted(self, load):
+        """ Return the priorities admitted at load """
+        cutoff = self.controller.shed_below(self.oconfig, load)
+        return [p for p in ocelog.message.Message.valid_priorities
+                if self.controller.admit(p, self.oconfig, cutoff)]
+
+    #--------------------------------------------------------------------------
+    # initialization behavior
+    #--------------------------------------------------------------------------
+    def test_admission_controller_is_singleton(self):
+        """ Confirm singleton behavior is enforced for AdmissionController """
+        self.assertEqual(self.controller, ocelog.admission.AdmissionController())
+
+    #--------------------------------------------------------------------------
+    # load
+    #--------------------------------------------------------------------------
+    def test_load_follows_the_requests_in_flight(self):
+        """ Test enter() and leave() move the load """
+        self.oconfig.admission.max_in_flight = 4
+        self.controller.enter()
+        self.controller.enter()
+        self.assertEqual(self.controller.load(self.oconfig), 0.5)
+        self.controller.leave()
+        self.assertEqual(self.controller.load(self.oconfig), 0.25)
+
+    def test_load_follows_the_queue_depth(self):
+        """ Test a filling async queue raises the load """
+        owriter = ocelog.queued.QueuedWriter(ocelog_mock.MockRecordingWriter(),
+                max_depth=4)
+        ocelog.queued._default_writer = owriter
+        for i in range(3):
+            owriter.write(ocelog_mock.MockMessage())
+        self.assertEqual(self.controller.load(self.oconfig), 0.75)
+
+    #--------------------------------------------------------------------------
+    # shedding
+    #--------------------------------------------------------------------------
+    def test_everything_is_admitted_below_shed_start(self):
+        """ Test no priority is shed until the load reaches shed_start """
+        self.assertEqual(self.admitted(0.49),
+                list(ocelog.message.Message.valid_priorities))
+
+    def test_least_severe_priorities_are_shed_first(self):
+        """ Test debug goes first and more is shed as the load rises """
+        self.assertEqual(self.admitted(0.5)[-1], "info")
+        self.assertEqual(self.admitted(0.75)[-1], "warning")
+        self.assertEqual(self.admitted(0.9)[-1], "err")
+
+    def test_protected_priorities_are_never_shed(self):
+        """ Test priorities at least as severe as protected_priority get in """
+        self.assertEqual(self.admitted(1.0), ["emerg", "alert", "crit"])
+        self.assertEqual(self.admitted(5.0), ["emerg", "alert", "crit"])
+        self.oconfig.admission.protected_priority = "debug"
+        self.assertEqual(self.admitted(5.0),
+                list(ocelog.message.Message.valid_priorities))
+
+    def test_unknown_priorities_are_shed_as_debug(self):
+        """ Test a priority that isn't valid is shed with debug """
+        self.assertFalse(self.controller.admit("loud", self.oconfig, 6))
+        self.assertTrue(self.controller.admit("loud", self.oconfig, 7))
+
+    def test_decisions_are_counted(self):
+        """ Test each decision is counted by priority """
+        self.controller.admit("debug", self.oconfig, 6)
+        self.controller.admit("info", self.oconfig, 6)
+        histograms, counters = ocelog.metrics.collect()
+        self.assertEqual(counters[("ocelog_admission_total",
+                (("priority", "debug"), ("decision", "shed")))], 1)
+        self.assertEqual(counters[("ocelog_admission_total",
+                (("priority", "info"), ("decision", "admitted")))], 1)
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
@@ -66,6 +66,37 @@ class TestAuth(unittest.TestCase):
             generated_token = ocelog.auth.generate_mac_token(msg, secret)
             self.assertEqual(expected_token, generated_token)
 
+    #--------------------------------------------------------------------------
+    # generate_hmac_token / tokens_match
+    #--------------------------------------------------------------------------
+    def test_hmac_token_generator_returns_expected_tokens(self):
+        """ Test the HMAC-SHA256 token generator returns expected tokens """
+        # (message, secret, token)
+        triples = []
+        triples.append(("this is a service message", "blanket", "2419eec5d67191cace6023d69b812bc5301fd19accc540c2686235ac0e7f0ee4"))
+        triples.append(("the coffee pot volume is low", "porchlite", "77edc15de20e64473dc76cdce53cc60526fbf96fa306c8a19b227cdca430d0a1"))
+        # run twice so the second pass uses the cached keyed state
+        for i in range(2):
+            for msg,secret,expected_token in triples:
+                generated_token = ocelog.auth.generate_hmac_token(msg, secret)
+                self.assertEqual(expected_token, generated_token)
+
+    def test_hmac_token_generator_keys_once_per_secret(self):
+        """ Test the keyed HMAC state is kept and reused for each secret """
+        ocelog.auth.generate_hmac_token("first", "porchlite")
+        keyed = ocelog.auth._hmac_states["porchlite"]
+        ocelog.auth.generate_hmac_token("second", "blanket")
+        ocelog.auth.generate_hmac_token("third", "porchlite")
+        self.assertTrue(keyed is ocelog.auth._hmac_states["porchlite"])
+        self.assertFalse(keyed is ocelog.auth._hmac_states["blanket"])
+
+    def test_tokens_match(self):
+        """ Test token comparison """
+        self.assertTrue(ocelog.auth.tokens_match("abc123", "abc123"))
+        self.assertTrue(ocelog.auth.tokens_match(u"abc123", "abc123"))
+        self.assertFalse(ocelog.auth.tokens_match("abc124", "abc123"))
+        self.assertFalse(ocelog.auth.tokens_match("abc12", "abc123"))
+
     #--------------------------------------------------------------------------
     # authorize_request
     #--------------------------------------------------------------------------
@@ -117,6 +148,162 @@ class TestAuth(unittest.TestCase):
         authorized = ocelog.auth.authorize_request(request)
         self.assertTrue(authorized)
 
+    def test_authorize_request_with_hmac_token(self):
+        """ Test request authorization with hmac-sha256 tokens over msg """
+        oconfig = ocelog.config.Config()
+        oconfig.security.shared_secret = "porchlite"
+        oconfig.security.require_token = True
+        oconfig.security.token_type = "hmac-sha256"
+        msg = "the coffee pot volume is low"
+        token = "77edc15de20e64473dc76cdce53cc60526fbf96fa306c8a19b227cdca430d0a1"
+        request = ocelog_mock.MockBottleRequest(msg=msg, token=token)
+        self.assertTrue(ocelog.auth.authorize_request(request))
+        # an md5 token is no longer accepted
+        token = "d1ed63df8f2ce2da3463004cddd761a6"
+        request = ocelog_mock.MockBottleRequest(msg=msg, token=token)
+        self.assertFalse(ocelog.auth.authorize_request(request))
+
+    def test_authorize_request_with_signed_body(self):
+        """ Test request authorization with a token covering the whole body """
+        oconfig = ocelog.config.Config()
+        oconfig.security.shared_secret = "porchlite"
+        oconfig.security.require_token = True
+        oconfig.security.token_type = "hmac-sha256"
+        oconfig.security.sign_body = True
+        msg = "the coffee pot volume is low"
+        body = "appname=testapp&msg=the+coffee+pot+volume+is+low"
+        token = "3ad8f26d8784d07f22299754bc08f6c45c6605384256c7c18c303ebd04796844"
+        request = ocelog_mock.MockBottleRequest(msg=msg, token=token, body=body)
+        self.assertTrue(ocelog.auth.authorize_request(request))
+        # a token over msg alone is not enough
+        token = "77edc15de20e64473dc76cdce53cc60526fbf96fa306c8a19b227cdca430d0a1"
+        request = ocelog_mock.MockBottleRequest(msg=msg, token=token, body=body)
+        self.assertFalse(ocelog.auth.authorize_request(request))
+        # and a request without a body can't be authorized
+        request = ocelog_mock.MockBottleRequest(msg=msg, token=token)
+        self.assertFalse(ocelog.auth.authorize_request(request))
+
+    def test_authorize_request_uses_given_config_snapshot(self):
+        """ Test authorization reads the snapshot rather than Config() """
+        oconfig = ocelog.config.Config()
+        oconfig.security.shared_secret = "porchlite"
+        oconfig.security.require_token = True
+        snapshot = oconfig.snapshot()
+        oconfig.security.require_token = False
+        request = ocelog_mock.MockBottleRequest(msg="some event")
+        self.assertFalse(ocelog.auth.authorize_request(request, snapshot))
+        self.assertTrue(ocelog.auth.authorize_request(request))
+
+    #--------------------------------------------------------------------------
+    # named keys
+    #--------------------------------------------------------------------------
+    def setup_keys(self):
+        """ Configure two named keys, the older one bound to billing """
+        oconfig = ocelog.config.Config()
+        oconfig.security.keys = "k2026=orangejuice, k2025=applejuice"
+        oconfig.security.appname_keys = "billing=k2026 k2025"
+        oconfig.security.require_token = True
+        return oconfig
+
+    def keyed_request(self, secret, appname="webapp", key_id=None):
+        """ Return a request with a token generated with secret """
+        msg = "the coffee pot volume is low"
+        token = ocelog.auth.generate_mac_token(msg, secret)
+        return ocelog_mock.MockBottleRequest(appname=appname, msg=msg,
+                token=token, key_id=key_id)
+
+    def test_authorize_request_with_a_named_key(self):
+        """ Test the x-key-id header selects the key to verify with """
+        self.setup_keys()
+        self.assertTrue(ocelog.auth.authorize_request(
+                self.keyed_request("orangejuice", key_id="k2026")))
+        self.assertFalse(ocelog.auth.authorize_request(
+                self.keyed_request("applejuice", key_id="k2026")))
+        self.assertFalse(ocelog.auth.authorize_request(
+                self.keyed_request("orangejuice", key_id="k1999")))
+
+    def test_authorize_request_without_a_key_id_uses_the_shared_secret(self):
+        """ Test an unbound appname without x-key-id uses shared_secret """
+        oconfig = self.setup_keys()
+        self.assertFalse(ocelog.auth.authorize_request(
+                self.keyed_request("orangejuice")))
+        oconfig.security.shared_secret = "porchlite"
+        self.assertTrue(ocelog.auth.authorize_request(
+                self.keyed_request("porchlite")))
+
+    def test_bound_appname_may_only_use_its_keys(self):
+        """ Test a bound appname verifies with any of its keys and no other """
+        oconfig = self.setup_keys()
+        oconfig.security.keys = "k2026=orangejuice, k2025=applejuice, other=limejuice"
+        for secret in ("orangejuice", "applejuice"):
+            self.assertTrue(ocelog.auth.authorize_request(
+                    self.keyed_request(secret, appname="billing")))
+        self.assertFalse(ocelog.auth.authorize_request(
+                self.keyed_request("limejuice", appname="billing", key_id="other")))
+
+    def test_expired_keys_no_longer_verify(self):
+        """ Test a key stops verifying at its key_expiry time """
+        oconfig = self.setup_keys()
+        oconfig.security.key_expiry = "k2025=2000-01-01"
+        self.assertFalse(ocelog.auth.authorize_request(
+                self.keyed_request("applejuice", key_id="k2025")))
+        self.assertFalse(ocelog.auth.authorize_request(
+                self.keyed_request("applejuice", appname="billing")))
+        oconfig.security.key_expiry = "k2025=2999-01-01T00:00:00"
+        self.assertTrue(ocelog.auth.authorize_request(
+                self.keyed_request("applejuice", key_id="k2025")))
+
+    def test_hmac_states_are_kept_for_every_key(self):
+        """ Test each key is keyed once, whichever is used """
+        oconfig = self.setup_keys()
+        oconfig.security.token_type = "hmac-sha256"
+        for secret, key_id in (("orangejuice", "k2026"), ("applejuice", "k2025")):
+            request = self.keyed_request(secret, key_id=key_id)
+            ocelog.auth.authorize_request(request)
+        self.assertTrue("orangejuice" in ocelog.auth._hmac_states)
+        self.assertTrue("applejuice" in ocelog.auth._hmac_states)
+
+    #--------------------------------------------------------------------------
+    # authorize_batch_request
+    #--------------------------------------------------------------------------
+    def test_authorize_batch_request_is_true_if_require_token_is_disabled(self):
+        """ Test batch authorization succeeds if require_token is disabled """
+        request = ocelog_mock.MockBottleRequest()
+        self.assertTrue(ocelog.auth.authorize_batch_request(request, "appname=a&msg=b"))
+
+    def test_authorize_batch_request_checks_token_against_whole_body(self):
+        """ Test the batch token is generated from the entire body """
+        oconfig = ocelog.config.Config()
+        oconfig.security.shared_secret = "porchlite"
+        oconfig.security.require_token = True
+        body = "appname=a&msg=one\nappname=a&msg=two\n"
+        token = ocelog.auth.generate_mac_token(body, "porchlite")
+        request = ocelog_mock.MockBottleRequest(token=token)
+        self.assertTrue(ocelog.auth.authorize_batch_request(request, body))
+        self.assertFalse(ocelog.auth.authorize_batch_request(request, body + "appname=a&msg=three"))
+        request = ocelog_mock.MockBottleRequest()
+        self.assertFalse(ocelog.auth.authorize_batch_request(request, body))
+
+    def test_authorize_batch_request_with_a_named_key(self):
+        """ Test a batch is verified with the key named by x-key-id """
+        self.setup_keys()
+        body = "appname=billing&msg=one\nappname=webapp&msg=two\n"
+        token = ocelog.auth.generate_mac_token(body, "orangejuice")
+        request = ocelog_mock.MockBottleRequest(token=token, key_id="k2026")
+        self.assertTrue(ocelog.auth.authorize_batch_request(request, body))
+        request = ocelog_mock.MockBottleRequest(token=token, key_id="k2025")
+        self.assertFalse(ocelog.auth.authorize_batch_request(request, body))
+
+    def test_authorize_batch_record_checks_appname_bindings(self):
+        """ Test a record for a bound appname needs one of its keys """
+        self.setup_keys()
+        billing = ocelog_mock.MockMessage(appname="billing")
+        webapp = ocelog_mock.MockMessage(appname="webapp")
+        request = ocelog_mock.MockBottleRequest(key_id="k2025")
+        self.assertTrue(ocelog.auth.authorize_batch_record(request, billing))
+        self.assertTrue(ocelog.auth.authorize_batch_record(request, webapp))
+        request = ocelog_mock.MockBottleRequest()
+        self.assertFalse(ocelog.auth.authorize_batch_record(request, billing))
 
 
 
@@ -1,8 +1,12 @@
 #!/usr/bin/env python
 
 import unittest
+import multiprocessing
+import os
 import os.path
+import shutil
 import sys
+import tempfile
 
 test_file_path = os.path.dirname(os.path.abspath(__file__))
 ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
@@ -66,6 +70,24 @@ class TestConfig(unittest.TestCase):
         oconfig = ocelog.config.Config(config_file)
         self.assertEqual(oconfig.server.port, 7777)          # override of "8888"
         self.assertEqual(oconfig.server.host, "127.0.0.1")   # override of "localhost"
+        self.assertEqual(oconfig.server.watch_interval, 2.5) # override of 0
+        self.assertEqual(oconfig.server.workers, 4)          # override of the cpu count
+        self.assertEqual(oconfig.server.reuse_port, False)   # override of True
+        self.assertEqual(oconfig.server.threads, 0)          # override of 8
+        self.assertEqual(oconfig.server.max_connections, 50000) # override of 10000
+        self.assertEqual(oconfig.server.max_buffered, 1048576) # override of 268435456
+        self.assertEqual(oconfig.server.application, "lean") # override of "bottle"
+
+    def test_invalid_server_options_raise_exception(self):
+        """ Test the server setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("workers", "-1"), ("workers", "many"),
+                ("reuse_port", "maybe"), ("threads", "-1"), ("threads", "x"),
+                ("max_connections", "0"), ("max_connections", "lots"),
+                ("max_buffered", "0"), ("max_buffered", "lots"),
+                ("application", "flask")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.server, option, value)
 
     def test_override_of_subset_of_server_options(self):
         """ Test an override of a subset of the server option defaults """
@@ -80,6 +102,8 @@ class TestConfig(unittest.TestCase):
         oconfig = ocelog.config.Config(config_file)
         self.assertEqual(oconfig.message.default_facility, "local1")     # override of "user"
         self.assertEqual(oconfig.message.default_priority, "warning")    # override of "notice"
+        self.assertEqual(oconfig.message.max_request_size, 2048)         # override of 65536
+        self.assertEqual(oconfig.message.max_batch_size, 1048576)        # override of 4194304
 
     def test_override_of_subset_of_message_options(self):
         """ Test an override of a subset of the message option defaults """
@@ -93,6 +117,7 @@ class TestConfig(unittest.TestCase):
         config_file = "%s/config_syslog_overrides_all.conf" % self.test_data_path
         oconfig = ocelog.config.Config(config_file)
         self.assertEqual(oconfig.syslog.enabled, True) # override of "False" 
+        self.assertEqual(oconfig.syslog.socket_path, "/var/run/syslog") # override of "/dev/log"
 
     def test_override_of_subset_of_syslog_options(self):
         """ Test an override of a subset of the syslog option defaults """
@@ -100,18 +125,237 @@ class TestConfig(unittest.TestCase):
         oconfig = ocelog.config.Config(config_file)
         self.assertEqual(oconfig.syslog.enabled, True)    # override of "False" 
 
+    def test_override_of_all_the_queue_options(self):
+        """ Test an override of all of the queue option defaults """
+        config_file = "%s/config_queue_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.queue.enabled, True)           # override of False
+        self.assertEqual(oconfig.queue.max_depth, 500)          # override of 10000
+        self.assertEqual(oconfig.queue.batch_size, 20)          # override of 100
+        self.assertEqual(oconfig.queue.flush_interval, 0.2)     # override of 0.05
+        self.assertEqual(oconfig.queue.workers, 4)              # override of 1
+
+    def test_invalid_queue_options_raise_exception(self):
+        """ Test the queue setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("max_depth", "0"), ("batch_size", "many"),
+                ("flush_interval", "-1"), ("workers", "0"), ("enabled", "yes")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.queue, option, value)
+
+    def test_override_of_all_the_spool_options(self):
+        """ Test an override of all of the spool option defaults """
+        config_file = "%s/config_spool_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.spool.enabled, True)                   # override of False
+        self.assertEqual(oconfig.spool.directory, "/tmp/ocelog-spool")  # override of "/var/spool/ocelog"
+        self.assertEqual(oconfig.spool.segment_size, 65536)             # override of 4194304
+        self.assertEqual(oconfig.spool.max_segments, 4)                 # override of 16
+        self.assertEqual(oconfig.spool.fsync, "always")                 # override of "interval"
+        self.assertEqual(oconfig.spool.fsync_interval, 0.5)             # override of 1.0
+        self.assertEqual(oconfig.spool.retry_interval, 2.0)             # override of 1.0
+
+    def test_invalid_spool_options_raise_exception(self):
+        """ Test the spool setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("directory", "spool"), ("segment_size", "4096"),
+                ("max_segments", "0"), ("fsync", "sometimes"),
+                ("fsync_interval", "0"), ("retry_interval", "soon"),
+                ("enabled", "yes")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.spool, option, value)
+
+    def test_override_of_all_the_remote_options(self):
+        """ Test an override of all of the remote option defaults """
+        config_file = "%s/config_remote_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.remote.relays, (("10.0.0.1", 514),
+                ("logs.example.com", 6514)))                   # override of ()
+        self.assertEqual(oconfig.remote.protocol, "tcp")       # override of "udp"
+        self.assertEqual(oconfig.remote.format, "rfc3164")     # override of "rfc5424"
+        self.assertEqual(oconfig.remote.pool_size, 4)          # override of 2
+        self.assertEqual(oconfig.remote.timeout, 1.5)          # override of 5.0
+        self.assertEqual(oconfig.remote.retry_interval, 10.0)  # override of 30.0
+
+    def test_invalid_remote_options_raise_exception(self):
+        """ Test the remote setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("relays", "logs.example.com"), 
+                ("relays", "logs.example.com:syslog"), ("relays", ":514"),
+                ("relays", "logs.example.com:70000"), ("protocol", "sctp"),
+                ("format", "json"), ("pool_size", "0"), ("timeout", "0"),
+                ("retry_interval", "-1")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.remote, option, value)
+
+    def test_override_of_all_the_journald_options(self):
+        """ Test an override of all of the journald option defaults """
+        config_file = "%s/config_journald_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.journald.socket_path, "/var/run/journal.sock")
+
+    def test_override_of_all_the_file_options(self):
+        """ Test an override of all of the file option defaults """
+        config_file = "%s/config_file_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.file.path, "/tmp/ocelog/messages.log")  # override of "/var/log/ocelog/ocelog.log"
+        self.assertEqual(oconfig.file.buffer_size, 65536)       # override of 1048576
+        self.assertEqual(oconfig.file.rotate_size, 0)           # override of 104857600
+        self.assertEqual(oconfig.file.rotate_interval, 86400)   # override of 0
+        self.assertEqual(oconfig.file.fsync, "records")         # override of "interval"
+        self.assertEqual(oconfig.file.fsync_records, 50)        # override of 1000
+        self.assertEqual(oconfig.file.fsync_interval, 0.25)     # override of 1.0
+
+    def test_invalid_file_options_raise_exception(self):
+        """ Test the file setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("path", "ocelog.log"), ("path", "/var/log/"),
+                ("buffer_size", "1024"), ("rotate_size", "-1"),
+                ("rotate_interval", "daily"), ("fsync", "always"),
+                ("fsync_records", "0"), ("fsync_interval", "0")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.file, option, value)
+
+    def test_override_of_all_the_writers_options(self):
+        """ Test an override of all of the writers option defaults """
+        config_file = "%s/config_writers_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.writers.enabled, ("syslog",))   # default
+        self.assertEqual(oconfig.writers.required, ())           # override of ("syslog",)
+        self.assertEqual(oconfig.writers.timeout, 0.5)           # override of 5.0
+        self.assertEqual(oconfig.writers.max_depth, 50)          # override of 10000
+        self.assertEqual(oconfig.writers.batch_size, 10)         # override of 100
+
+    def test_writers_lists_are_split_on_commas(self):
+        """ Test writer names are read from a comma separated list """
+        oconfig = ocelog.config.Config()
+        oconfig.writers.enabled = " syslog, "
+        self.assertEqual(oconfig.writers.enabled, ("syslog",))
+
+    def test_invalid_writers_options_raise_exception(self):
+        """ Test the writers setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("enabled", ""), ("enabled", "syslog,carrier-pigeon"),
+                ("required", "carrier-pigeon"), ("timeout", "0"), 
+                ("max_depth", "deep"), ("batch_size", "0")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.writers, option, value)
+
+    def test_override_of_all_the_admission_options(self):
+        """ Test an override of all of the admission option defaults """
+        config_file = "%s/config_admission_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.admission.enabled, True)            # override of False
+        self.assertEqual(oconfig.admission.max_in_flight, 32)        # override of 256
+        self.assertEqual(oconfig.admission.shed_start, 0.25)         # override of 0.5
+        self.assertEqual(oconfig.admission.protected_priority, "err") # override of "crit"
+        self.assertEqual(oconfig.admission.retry_after, 5)           # override of 1
+
+    def test_invalid_admission_options_raise_exception(self):
+        """ Test the admission setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("enabled", "sometimes"), ("max_in_flight", "0"),
+                ("shed_start", "1"), ("shed_start", "-0.5"), 
+                ("protected_priority", "loud"), ("retry_after", "0")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.admission, option, value)
+
+    def test_override_of_all_the_ratelimit_options(self):
+        """ Test an override of all of the ratelimit option defaults """
+        config_file = "%s/config_ratelimit_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.ratelimit.enabled, True)       # override of False
+        self.assertEqual(oconfig.ratelimit.key, "both")         # override of "appname"
+        self.assertEqual(oconfig.ratelimit.rate, 10.0)          # override of 100.0
+        self.assertEqual(oconfig.ratelimit.burst, 20.0)         # override of 200.0
+        self.assertEqual(oconfig.ratelimit.appname_limits,      # override of {}
+                {"noisyapp": (1.0, 5.0), "quietapp": (50.0, 50.0)})
+        self.assertEqual(oconfig.ratelimit.client_limits,       # override of {}
+                {"10.0.0.1": (2.5, 10.0)})
+        self.assertEqual(oconfig.ratelimit.table_size, 1024)    # override of 65536
+
+    def test_invalid_ratelimit_options_raise_exception(self):
+        """ Test the ratelimit setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("enabled", "yes"), ("key", "hostname"),
+                ("rate", "0"), ("rate", "fast"), ("burst", "0.5"),
+                ("appname_limits", "app1"), ("appname_limits", "app1=0/5"),
+                ("client_limits", "=5"), ("client_limits", "10.0.0.1=5/x"),
+                ("table_size", "8")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.ratelimit, option, value)
+
+    def test_override_of_all_the_dedup_options(self):
+        """ Test an override of all of the dedup option defaults """
+        config_file = "%s/config_dedup_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.dedup.enabled, True)       # override of False
+        self.assertEqual(oconfig.dedup.window, 30.0)        # override of 5.0
+        self.assertEqual(oconfig.dedup.table_size, 128)     # override of 4096
+
+    def test_invalid_dedup_options_raise_exception(self):
+        """ Test the dedup setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("enabled", "on"), ("window", "0"),
+                ("window", "long"), ("table_size", "0")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.dedup, option, value)
+
+    def test_override_of_all_the_idempotency_options(self):
+        """ Test an override of all of the idempotency option defaults """
+        config_file = "%s/config_idempotency_overrides_all.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        self.assertEqual(oconfig.idempotency.enabled, True)     # override of False
+        self.assertEqual(oconfig.idempotency.ttl, 60.0)         # override of 300.0
+        self.assertEqual(oconfig.idempotency.max_entries, 500)  # override of 100000
+
+    def test_invalid_idempotency_options_raise_exception(self):
+        """ Test the idempotency setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("enabled", "1"), ("ttl", "0"), ("ttl", "forever"),
+                ("max_entries", "-1")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.idempotency, option, value)
+
     def test_override_of_all_the_security_options(self):
         """ Test an override of all of the security option defaults """
         config_file = "%s/config_security_overrides_all.conf" % self.test_data_path
         oconfig = ocelog.config.Config(config_file)
         self.assertEqual(oconfig.security.require_token, True)          # override of False
         self.assertEqual(oconfig.security.shared_secret, "grapejuice")  # override of None
+        self.assertEqual(oconfig.security.keys,                         # override of {}
+                {"k2026": "orangejuice", "k2025": "applejuice"})
+        self.assertEqual(oconfig.security.key_expiry, {"k2025": 1793491200.0}) # override of {}
+        self.assertEqual(oconfig.security.appname_keys,                 # override of {}
+                {"billing": ("k2026", "k2025")})
+        self.assertEqual(oconfig.security.token_type, "hmac-sha256")   # override of "md5"
+        self.assertEqual(oconfig.security.sign_body, True)              # override of False
 
     def test_override_of_subset_of_security_options_is_not_allowed(self):
         """ Test that shared_secret must be set if require_token is overriden to true """
         config_file = "%s/config_security_overrides_partial.conf" % self.test_data_path
         self.assertRaises(ocelog.config.ConfigException, ocelog.config.Config, config_file)
 
+    def test_named_keys_allow_require_token_without_a_shared_secret(self):
+        """ Test require_token can be enabled with only named keys """
+        oconfig = ocelog.config.Config()
+        oconfig.security.keys = "k1=orangejuice"
+        oconfig.security.require_token = True
+        self.assertEqual(oconfig.security.require_token, True)
+
+    def test_invalid_security_key_options_raise_exception(self):
+        """ Test the key setters reject invalid values """
+        oconfig = ocelog.config.Config()
+        for option, value in (("keys", "k1"), ("keys", "k1=short"),
+                ("key_expiry", "k1=2026-11-01"), ("appname_keys", "app1=k1")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.security, option, value)
+        oconfig.security.keys = "k1=orangejuice"
+        for option, value in (("key_expiry", "k1=next tuesday"), 
+                ("appname_keys", "app1=k1 k2"), ("appname_keys", "app1=")):
+            self.assertRaises(ocelog.config.ConfigException, setattr, 
+                    oconfig.security, option, value)
+
     def test_manual_override_of_boolean_options(self):
         """ Test the boolean validators accept true booleans and not just strings """
         config_file = "%s/config_defaults.conf" % self.test_data_path
@@ -153,14 +397,88 @@ class TestConfig(unittest.TestCase):
         # assert that the Server defaults are correct
         self.assertEqual(oconfig.server.port, 8888)
         self.assertEqual(oconfig.server.host, "localhost")
+        self.assertEqual(oconfig.server.watch_interval, 0)
+        self.assertEqual(oconfig.server.workers, multiprocessing.cpu_count())
+        self.assertEqual(oconfig.server.reuse_port, True)
+        self.assertEqual(oconfig.server.threads, 8)
+        self.assertEqual(oconfig.server.max_connections, 10000)
+        self.assertEqual(oconfig.server.max_buffered, 268435456)
+        self.assertEqual(oconfig.server.application, "bottle")
         # assert that the Message defaults are correct
         self.assertEqual(oconfig.message.default_facility, "user")
         self.assertEqual(oconfig.message.default_priority, "notice")
+        self.assertEqual(oconfig.message.max_request_size, 65536)
+        self.assertEqual(oconfig.message.max_batch_size, 4194304)
         # assert that the SyslogWriter defaults are correct
         self.assertEqual(oconfig.syslog.enabled, False)
+        self.assertEqual(oconfig.syslog.socket_path, "/dev/log")
+        # assert that the queue defaults are correct
+        self.assertEqual(oconfig.queue.enabled, False)
+        self.assertEqual(oconfig.queue.max_depth, 10000)
+        self.assertEqual(oconfig.queue.batch_size, 100)
+        self.assertEqual(oconfig.queue.flush_interval, 0.05)
+        self.assertEqual(oconfig.queue.workers, 1)
+        # assert that the spool defaults are correct
+        self.assertEqual(oconfig.spool.enabled, False)
+        self.assertEqual(oconfig.spool.directory, "/var/spool/ocelog")
+        self.assertEqual(oconfig.spool.segment_size, 4194304)
+        self.assertEqual(oconfig.spool.max_segments, 16)
+        self.assertEqual(oconfig.spool.fsync, "interval")
+        self.assertEqual(oconfig.spool.fsync_interval, 1.0)
+        self.assertEqual(oconfig.spool.retry_interval, 1.0)
+        # assert that the remote defaults are correct
+        self.assertEqual(oconfig.remote.relays, ())
+        self.assertEqual(oconfig.remote.protocol, "udp")
+        self.assertEqual(oconfig.remote.format, "rfc5424")
+        self.assertEqual(oconfig.remote.pool_size, 2)
+        self.assertEqual(oconfig.remote.timeout, 5.0)
+        self.assertEqual(oconfig.remote.retry_interval, 30.0)
+        # assert that the journald defaults are correct
+        self.assertEqual(oconfig.journald.socket_path, "/run/systemd/journal/socket")
+        # assert that the file defaults are correct
+        self.assertEqual(oconfig.file.path, "/var/log/ocelog/ocelog.log")
+        self.assertEqual(oconfig.file.buffer_size, 1048576)
+        self.assertEqual(oconfig.file.rotate_size, 104857600)
+        self.assertEqual(oconfig.file.rotate_interval, 0)
+        self.assertEqual(oconfig.file.fsync, "interval")
+        self.assertEqual(oconfig.file.fsync_records, 1000)
+        self.assertEqual(oconfig.file.fsync_interval, 1.0)
+        # assert that the writers defaults are correct
+        self.assertEqual(oconfig.writers.enabled, ("syslog",))
+        self.assertEqual(oconfig.writers.required, ("syslog",))
+        self.assertEqual(oconfig.writers.timeout, 5.0)
+        self.assertEqual(oconfig.writers.max_depth, 10000)
+        self.assertEqual(oconfig.writers.batch_size, 100)
+        # assert that the admission defaults are correct
+        self.assertEqual(oconfig.admission.enabled, False)
+        self.assertEqual(oconfig.admission.max_in_flight, 256)
+        self.assertEqual(oconfig.admission.shed_start, 0.5)
+        self.assertEqual(oconfig.admission.protected_priority, "crit")
+        self.assertEqual(oconfig.admission.retry_after, 1)
+        # assert that the ratelimit defaults are correct
+        self.assertEqual(oconfig.ratelimit.enabled, False)
+        self.assertEqual(oconfig.ratelimit.key, "appname")
+        self.assertEqual(oconfig.ratelimit.rate, 100.0)
+        self.assertEqual(oconfig.ratelimit.burst, 200.0)
+        self.assertEqual(oconfig.ratelimit.appname_limits, {})
+        self.assertEqual(oconfig.ratelimit.client_limits, {})
+        self.assertEqual(oconfig.ratelimit.table_size, 65536)
+        # assert that the dedup defaults are correct
+        self.assertEqual(oconfig.dedup.enabled, False)
+        self.assertEqual(oconfig.dedup.window, 5.0)
+        self.assertEqual(oconfig.dedup.table_size, 4096)
+        # assert that the idempotency defaults are correct
+        self.assertEqual(oconfig.idempotency.enabled, False)
+        self.assertEqual(oconfig.idempotency.ttl, 300.0)
+        self.assertEqual(oconfig.idempotency.max_entries, 100000)
         # assert that the security defaults are correct
         self.assertEqual(oconfig.security.require_token, False)
         self.assertEqual(oconfig.security.shared_secret, None)
+        self.assertEqual(oconfig.security.keys, {})
+        self.assertEqual(oconfig.security.key_expiry, {})
+        self.assertEqual(oconfig.security.appname_keys, {})
+        self.assertEqual(oconfig.security.token_type, "md5")
+        self.assertEqual(oconfig.security.sign_body, False)
 
     def test_config_class_is_singleton(self):
         """ Test that the singleton trait is enforced with the Config class """
@@ -187,6 +505,125 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(oconfig.security.require_token, False)
         self.assertEqual(oconfig.security.shared_secret, None)
 
+    #--------------------------------------------------------------------------
+    # snapshots
+    #--------------------------------------------------------------------------
+    def test_snapshot_copies_every_option(self):
+        """ Test a snapshot holds the same values as the Config sections """
+        config_file = "%s/config_mixed_overrides_1.conf" % self.test_data_path
+        oconfig = ocelog.config.Config(config_file)
+        snapshot = oconfig.snapshot()
+        for section, options in ocelog.config.Config.sections:
+            for option in options:
+                self.assertEqual(getattr(getattr(snapshot, section), option),
+                        getattr(getattr(oconfig, section), option))
+
+    def test_snapshot_is_read_only(self):
+        """ Test snapshot sections and options can't be changed """
+        snapshot = ocelog.config.Config().snapshot()
+        self.assertRaises(ocelog.config.ConfigException, setattr, 
+                snapshot.syslog, "enabled", True)
+        self.assertRaises(ocelog.config.ConfigException, setattr, 
+                snapshot.syslog, "colour", "red")
+        self.assertRaises(ocelog.config.ConfigException, setattr, 
+                snapshot, "syslog", None)
+        self.assertRaises(ocelog.config.ConfigException, delattr, 
+                snapshot.server, "port")
+
+    def test_snapshot_is_not_affected_by_later_config_changes(self):
+        """ Test a snapshot keeps the values it was built with """
+        oconfig = ocelog.config.Config()
+        snapshot = oconfig.snapshot()
+        oconfig.message.default_facility = "local4"
+        self.assertEqual(snapshot.message.default_facility, "user")
+        self.assertEqual(oconfig.snapshot().message.default_facility, "local4")
+
+    def test_publish_replaces_the_current_snapshot(self):
+        """ Test current() returns the most recently published snapshot """
+        previous = ocelog.config._current
+        try:
+            snapshot = ocelog.config.Config().snapshot()
+            self.assertTrue(ocelog.config.publish(snapshot) is snapshot)
+            self.assertTrue(ocelog.config.current() is snapshot)
+            # with nothing published, one is built from Config()
+            ocelog.config._current = None
+            self.assertEqual(ocelog.config.current().server.port, 8888)
+        finally:
+            ocelog.config._current = previous
+
+    #--------------------------------------------------------------------------
+    # reloading
+    #--------------------------------------------------------------------------
+    def write_config_file(self, path, text):
+        """ Write a config file and push its mtime forward """
+        config_file = open(path, "w")
+        config_file.write(text)
+        config_file.close()
+        mtime = os.stat(path).st_mtime + 1
+        os.utime(path, (mtime, mtime))
+
+    def test_reload_applies_the_config_file_and_publishes(self):
+        """ Test reload() replaces the sections and publishes a snapshot """
+        previous = ocelog.config._current
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            config_file = os.path.join(tmp_dir, "ocelog.conf")
+            self.write_config_file(config_file, "[message]\ndefault_facility: local1\n")
+            oconfig = ocelog.config.Config(config_file)
+            old_snapshot = ocelog.config.publish(oconfig.snapshot())
+            self.write_config_file(config_file, "[message]\ndefault_facility: local6\n")
+            new_snapshot = oconfig.reload()
+            self.assertEqual(oconfig.message.default_facility, "local6")
+            self.assertTrue(ocelog.config.current() is new_snapshot)
+            self.assertEqual(new_snapshot.message.default_facility, "local6")
+            # a request holding the old snapshot still sees the old values
+            self.assertEqual(old_snapshot.message.default_facility, "local1")
+        finally:
+            ocelog.config._current = previous
+            shutil.rmtree(tmp_dir)
+
+    def test_reload_with_invalid_file_leaves_config_untouched(self):
+        """ Test a reload that fails validation changes nothing """
+        previous = ocelog.config._current
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            config_file = os.path.join(tmp_dir, "ocelog.conf")
+            self.write_config_file(config_file, "[message]\ndefault_facility: local1\n")
+            oconfig = ocelog.config.Config(config_file)
+            snapshot = ocelog.config.publish(oconfig.snapshot())
+            self.write_config_file(config_file, 
+                    "[message]\ndefault_facility: local6\ndefault_priority: loud\n")
+            self.assertRaises(ocelog.config.ConfigException, oconfig.reload)
+            self.assertEqual(oconfig.message.default_facility, "local1")
+            self.assertTrue(ocelog.config.current() is snapshot)
+        finally:
+            ocelog.config._current = previous
+            shutil.rmtree(tmp_dir)
+
+    def test_reload_without_a_config_file_raises_exception(self):
+        """ Test reload() needs a config file to read """
+        oconfig = ocelog.config.Config()
+        self.assertRaises(ocelog.config.ConfigException, oconfig.reload)
+
+    def test_watcher_reloads_when_mtime_changes(self):
+        """ Test ConfigWatcher.check() only reloads after the file changes """
+        previous = ocelog.config._current
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            config_file = os.path.join(tmp_dir, "ocelog.conf")
+            self.write_config_file(config_file, "[syslog]\nenabled: False\n")
+            oconfig = ocelog.config.Config(config_file)
+            watcher = ocelog.config.ConfigWatcher(config_file, 1)
+            self.assertFalse(watcher.check())
+            self.write_config_file(config_file, "[syslog]\nenabled: True\n")
+            self.assertTrue(watcher.check())
+            self.assertEqual(oconfig.syslog.enabled, True)
+            self.assertEqual(ocelog.config.current().syslog.enabled, True)
+            self.assertFalse(watcher.check())
+        finally:
+            ocelog.config._current = previous
+            shutil.rmtree(tmp_dir)
+
 
 if __name__=="__main__":
 
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import sys
+import time
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+import ocelog.dedup
+import ocelog.metrics
+import ocelog_mock
+
+
+class TestDedupWriter(unittest.TestCase):
+    """ Test the ocelog.dedup module
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py)
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        self.writer = ocelog_mock.MockBatchWriter()
+        self.owriter = ocelog.dedup.DedupWriter(self.writer, window=60)
+        ocelog.metrics.reset()
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        self.owriter._closed = True
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+
+    def expire_windows(self):
+        """ Move every open window back past its end """
+        for window in self.owriter._windows.values():
+            window.started -= self.owriter.window
+
+    def written(self):
+        """ Return the msg of each message the wrapped writer was given """
+        return [message.msg for message in self.writer.messages]
+
+    #--------------------------------------------------------------------------
+    # write
+    #--------------------------------------------------------------------------
+    def test_duplicates_within_the_window_are_suppressed(self):
+        """ Test only the first of several identical messages is written """
+        for i in range(5):
+            self.assertTrue(self.owriter.write(ocelog_mock.MockMessage()))
+        self.assertEqual(self.written(), ["big event 43"])
+
+    def test_messages_differing_in_any_field_are_written(self):
+        """ Test the whole message tuple is compared """
+        self.owriter.write(ocelog_mock.MockMessage())
+        self.owriter.write(ocelog_mock.MockMessage(priority="err"))
+        self.owriter.write(ocelog_mock.MockMessage(hostname="5.6.7.8"))
+        self.owriter.write(ocelog_mock.MockMessage(msg="big event 44"))
+        self.assertEqual(len(self.writer.messages), 4)
+
+    def test_summary_is_written_when_a_duplicate_follows_the_window(self):
+        """ Test a duplicate after the window closes it, then opens another """
+        for i in range(4):
+            self.owriter.write(ocelog_mock.MockMessage(priority="err"))
+        self.expire_windows()
+        self.owriter.write(ocelog_mock.MockMessage(priority="err"))
+        self.assertEqual(self.written(), ["big event 43",
+                "message repeated 3 times: [big event 43]", "big event 43"])
+        summary = self.writer.messages[1]
+        self.assertEqual((summary.hostname, summary.appname, summary.facility,
+                summary.priority), ("1.2.3.4", "mockapp", "user", "err"))
+
+    def test_flush_writes_summaries_of_expired_windows(self):
+        """ Test flush() closes expired windows but not open ones """
+        self.owriter.write(ocelog_mock.MockMessage(msg="first"))
+        self.owriter.write(ocelog_mock.MockMessage(msg="first"))
+        self.expire_windows()
+        self.owriter.write(ocelog_mock.MockMessage(msg="second"))
+        self.owriter.write(ocelog_mock.MockMessage(msg="second"))
+        self.owriter.flush()
+        self.assertEqual(self.written()[-1], "message repeated 1 times: [first]")
+        self.owriter.close()
+        self.assertEqual(self.written()[-1], "message repeated 1 times: [second]")
+
+    def test_windows_without_repeats_close_quietly(self):
+        """ Test no summary is written for a message that wasn't repeated """
+        self.owriter.write(ocelog_mock.MockMessage())
+        self.owriter.close()
+        self.assertEqual(self.written(), ["big event 43"])
+
+    def test_full_table_closes_the_oldest_window(self):
+        """ Test the table stays within table_size """
+        self.owriter.table_size = 2
+        for msg in ("one", "one", "two", "three"):
+            self.owriter.write(ocelog_mock.MockMessage(msg=msg))
+        self.assertEqual(len(self.owriter._windows), 2)
+        # "three" is written before its window pushes out the oldest
+        self.assertEqual(self.written(), ["one", "two", "three",
+                "message repeated 1 times: [one]"])
+
+    def test_sweep_closes_idle_windows(self):
+        """ Test the background sweep writes a summary without more traffic """
+        self.owriter.window = 0.05
+        self.owriter.write(ocelog_mock.MockMessage())
+        self.owriter.write(ocelog_mock.MockMessage())
+        deadline = time.time() + 2
+        while len(self.writer.messages) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.written()[-1], "message repeated 1 times: [big event 43]")
+
+    def test_write_batch_returns_a_result_per_message(self):
+        """ Test each message takes the result of the write that opened its window """
+        self.owriter.write(ocelog_mock.MockMessage(msg="earlier"))
+        self.writer.write_success = False
+        results = self.owriter.write_batch([ocelog_mock.MockMessage(),
+                ocelog_mock.MockMessage(), ocelog_mock.MockMessage(msg="other"),
+                ocelog_mock.MockMessage(msg="earlier")])
+        self.assertEqual(results, [False, False, False, True])
+        self.assertEqual(len(self.writer.batches), 2)
+
+    def test_a_failed_write_opens_no_window(self):
+        """ Test a retry after a failed write is written, not suppressed """
+        self.writer.write_success = False
+        self.assertFalse(self.owriter.write(ocelog_mock.MockMessage()))
+        self.assertEqual(len(self.owriter._windows), 0)
+        self.writer.write_success = True
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage()))
+        self.assertEqual(len(self.writer.messages), 2)
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage()))
+        self.assertEqual(len(self.writer.messages), 2)
+        histograms, counters = ocelog.metrics.collect()
+        self.assertEqual(counters[("ocelog_dedup_suppressed_total", ())], 1)
+
+    def test_suppressed_messages_are_counted(self):
+        """ Test each suppressed message is counted """
+        for i in range(3):
+            self.owriter.write(ocelog_mock.MockMessage())
+        histograms, counters = ocelog.metrics.collect()
+        self.assertEqual(counters[("ocelog_dedup_suppressed_total", ())], 2)
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+
+import unittest
+import httplib
+import os
+import os.path
+import socket
+import sys
+import threading
+import time
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.eventserver
+
+
+def echo_app(environ, start_response):
+    """ A wsgi application answering with the method, path and body """
+    body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+    if environ['PATH_INFO'] == "/fail":
+        raise ValueError("failing as asked")
+    if environ['PATH_INFO'].startswith("/sleep/"):
+        time.sleep(float(environ['PATH_INFO'][7:]))
+    start_response("200 OK", [("Content-Type", "text/plain"),
+            ("Connection", "keep-alive")])
+    return ["%s %s %s" % (environ['REQUEST_METHOD'], environ['PATH_INFO'],
+            body)]
+
+
+class TestEventServer(unittest.TestCase):
+    """ Test the ocelog.eventserver module against a server on a thread
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        self.server = None
+        self.thread = None
+        self.sockets = []
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        for sock in self.sockets:
+            sock.close()
+        if self.server is not None:
+            self.server.shutdown()
+            self.thread.join(5)
+
+    def start(self, **kargs):
+        """ Serve echo_app from a thread """
+        self.server = ocelog.eventserver.EventServer(echo_app, "127.0.0.1", 0,
+                **kargs)
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def connect(self):
+        """ Return a raw socket connected to the server """
+        sock = socket.create_connection(("127.0.0.1", self.server.port), 5)
+        self.sockets.append(sock)
+        return sock
+
+    def receive(self, sock, until_closed=False, responses=1):
+        """ Read responses (or everything until the server closes) """
+        data = ""
+        while True:
+            if not until_closed and data.count("HTTP/1.1 ") >= responses and \
+                    self.complete(data, responses):
+                return data
+            chunk = sock.recv(65536)
+            if not chunk:
+                return data
+            data += chunk
+
+    def complete(self, data, responses):
+        """ Return True if data holds that many whole responses """
+        for i in range(responses):
+            end = data.find("\r\n\r\n")
+            if end < 0:
+                return False
+            head = data[:end].lower()
+            length = 0
+            if "content-length: " in head:
+                length = int(head.split("content-length: ")[1].split("\r\n")[0])
+            if len(data) < end + 4 + length:
+                return False
+            data = data[end + 4 + length:]
+        return True
+
+    #--------------------------------------------------------------------------
+    # connections
+    #--------------------------------------------------------------------------
+    def test_keep_alive_serves_many_requests_on_one_connection(self):
+        """ Test http/1.1 connections stay open between requests """
+        self.start()
+        connection = httplib.HTTPConnection("127.0.0.1", self.server.port,
+                timeout=5)
+        for i in range(3):
+            connection.request("POST", "/log", "msg=%d" % i)
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.read(), "POST /log msg=%d" % i)
+            self.assertEqual(response.getheader("connection"), None)
+        self.assertEqual(len(self.server.connections), 1)
+        connection.close()
+
+    def test_pipelined_requests_are_answered_in_order(self):
+        """ Test requests sent together get their responses in order """
+        for epoll in (True, False):
+            self.start(epoll=epoll)
+            sock = self.connect()
+            sock.sendall("".join("POST /%d HTTP/1.1\r\nContent-Length: 1\r\n"
+                    "\r\n%d" % (i, i) for i in range(5)))
+            data = self.receive(sock, responses=5)
+            bodies = [part.split("\r\n\r\n")[1]
+                    for part in data.split("HTTP/1.1 200 OK\r\n")[1:]]
+            self.assertEqual(bodies, ["POST /%d %d" % (i, i) for i in range(5)])
+            self.tearDown()
+            self.setUp()
+
+    def test_a_body_sent_in_pieces_is_reassembled(self):
+        """ Test the application only sees a request once its body is in """
+        self.start()
+        sock = self.connect()
+        sock.sendall("POST /log HTTP/1.1\r\nContent-Le")
+        time.sleep(0.05)
+        sock.sendall("ngth: 10\r\n\r\nmsg=")
+        time.sleep(0.05)
+        sock.sendall("abcdef")
+        self.assertTrue(self.receive(sock).endswith("POST /log msg=abcdef"))
+
+    def test_http_1_0_and_connection_close_are_closed(self):
+        """ Test connections are closed unless the client keeps them alive """
+        self.start()
+        for request in ("GET / HTTP/1.0\r\n\r\n",
+                "GET / HTTP/1.1\r\nConnection: close\r\n\r\n"):
+            sock = self.connect()
+            sock.sendall(request)
+            data = self.receive(sock, until_closed=True)
+            self.assertTrue("\r\nConnection: close\r\n" in data)
+            self.assertTrue(data.endswith("GET / "))
+        sock = self.connect()
+        sock.sendall("GET / HTTP/1.0\r\nConnection: keep-alive\r\n\r\n")
+        self.assertTrue("\r\nConnection: keep-alive\r\n" in self.receive(sock))
+
+    def test_idle_connections_are_closed(self):
+        """ Test a connection idle past keepalive_timeout is closed """
+        self.start(keepalive_timeout=0.1)
+        sock = self.connect()
+        sock.sendall("GET / HTTP/1.1\r\n\r\n")
+        self.receive(sock)
+        started = time.time()
+        self.assertEqual(self.receive(sock, until_closed=True), "")
+        self.assertTrue(time.time() - started < 3)
+
+    def test_shutdown_answers_requests_in_hand(self):
+        """ Test shutdown() lets the server finish and exit """
+        self.start()
+        sock = self.connect()
+        sock.sendall("GET / HTTP/1.1\r\nContent-Length: 4\r\n\r\nab")
+        time.sleep(0.05)
+        self.server.shutdown()
+        time.sleep(0.05)
+        sock.sendall("cd")
+        data = self.receive(sock, until_closed=True)
+        self.assertTrue(data.endswith("GET / abcd"))
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.server = None
+
+    #--------------------------------------------------------------------------
+    # handler threads
+    #--------------------------------------------------------------------------
+    def test_threads_keep_pipelined_responses_in_order(self):
+        """ Test responses from the executor are sent in request order """
+        self.start(threads=4)
+        sock = self.connect()
+        sock.sendall("GET /sleep/0.1 HTTP/1.1\r\n\r\n"
+                "GET /sleep/0 HTTP/1.1\r\n\r\n")
+        data = self.receive(sock, responses=2)
+        self.assertTrue(data.index("GET /sleep/0.1 ") < data.index("GET /sleep/0 "))
+
+    def test_threads_serve_other_connections_during_a_slow_request(self):
+        """ Test a slow request doesn't hold up the loop """
+        self.start(threads=2)
+        slow = self.connect()
+        slow.sendall("GET /sleep/0.5 HTTP/1.1\r\n\r\n")
+        time.sleep(0.05)
+        started = time.time()
+        fast = self.connect()
+        fast.sendall("GET /fast HTTP/1.1\r\n\r\n")
+        self.assertTrue(self.receive(fast).endswith("GET /fast "))
+        self.assertTrue(time.time() - started < 0.4)
+        self.assertTrue(self.receive(slow).endswith("GET /sleep/0.5 "))
+
+    def test_shutdown_waits_for_running_requests(self):
+        """ Test shutdown() sends the response of a request on a thread """
+        self.start(threads=1)
+        sock = self.connect()
+        sock.sendall("GET /sleep/0.2 HTTP/1.1\r\n\r\n")
+        time.sleep(0.05)
+        self.server.shutdown()
+        data = self.receive(sock, until_closed=True)
+        self.assertTrue(data.endswith("GET /sleep/0.2 "))
+        self.assertTrue("\r\nConnection: close\r\n" in data)
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        # the handler threads are joined before serve_forever returns
+        self.assertFalse([thread for thread in threading.enumerate()
+                if thread.name.startswith("ocelog-event-handler-")])
+        self.server = None
+
+    #--------------------------------------------------------------------------
+    # requests and responses
+    #--------------------------------------------------------------------------
+    def test_expect_continue_gets_an_interim_response(self):
+        """ Test a client waiting on 100-continue is told to go ahead """
+        self.start()
+        sock = self.connect()
+        sock.sendall("POST / HTTP/1.1\r\nExpect: 100-continue\r\n"
+                "Content-Length: 3\r\n\r\n")
+        self.assertEqual(sock.recv(65536), "HTTP/1.1 100 Continue\r\n\r\n")
+        sock.sendall("abc")
+        self.assertTrue(self.receive(sock).endswith("POST / abc"))
+
+    def test_large_bodies_are_not_read(self):
+        """ Test a body over max_body reaches the application unread """
+        self.start(max_body=4)
+        sock = self.connect()
+        sock.sendall("POST / HTTP/1.1\r\nContent-Length: 5\r\n\r\n12345")
+        data = self.receive(sock, until_closed=True)
+        self.assertTrue("\r\nConnection: close\r\n" in data)
+        self.assertTrue(data.endswith("POST / "))
+
+    def test_bodies_wait_for_room_under_max_buffered(self):
+        """ Test a body isn't read while others hold the buffered bytes """
+        self.start(max_buffered=10)
+        first = self.connect()
+        first.sendall("POST /1 HTTP/1.1\r\nContent-Length: 8\r\n\r\nabc")
+        time.sleep(0.05)
+        second = self.connect()
+        second.sendall("POST /2 HTTP/1.1\r\nExpect: 100-continue\r\n"
+                "Content-Length: 8\r\n\r\n")
+        second.settimeout(0.2)
+        self.assertRaises(socket.timeout, second.recv, 65536)
+        first.sendall("defgh")
+        self.assertTrue(self.receive(first).endswith("POST /1 abcdefgh"))
+        second.settimeout(5)
+        self.assertEqual(second.recv(65536), "HTTP/1.1 100 Continue\r\n\r\n")
+        second.sendall("12345678")
+        self.assertTrue(self.receive(second).endswith("POST /2 12345678"))
+        self.assertEqual((self.server._reserved, len(self.server._waiting)),
+                (0, 0))
+
+    def test_a_body_over_max_buffered_is_read_alone(self):
+        """ Test a body larger than max_buffered is still read """
+        self.start(max_buffered=4)
+        sock = self.connect()
+        sock.sendall("POST / HTTP/1.1\r\nContent-Length: 8\r\n\r\nabcd")
+        time.sleep(0.05)
+        sock.sendall("efgh")
+        self.assertTrue(self.receive(sock).endswith("POST / abcdefgh"))
+
+    def test_malformed_requests_are_refused(self):
+        """ Test the server answers requests it can't parse itself """
+        self.start(max_header=64)
+        for request, status in (("NONSENSE\r\n\r\n", "400 Bad Request"),
+                ("GET / HTTP/2.0\r\n\r\n", "505 HTTP Version Not Supported"),
+                ("GET / HTTP/1.1\r\n folded: header\r\n\r\n", "400 Bad Request"),
+                ("POST / HTTP/1.1\r\nContent-Length: x\r\n\r\n",
+                    "400 Bad Request"),
+                ("POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n",
+                    "411 Length Required"),
+                ("GET / HTTP/1.1\r\nX-Pad: %s\r\n\r\n" % ("x" * 64),
+                    "431 Request Header Fields Too Large")):
+            sock = self.connect()
+            sock.sendall(request)
+            data = self.receive(sock, until_closed=True)
+            self.assertTrue(data.startswith("HTTP/1.1 %s\r\n" % status), data)
+
+    def test_application_errors_are_500s(self):
+        """ Test an exception in the application is answered with a 500 """
+        stderr = sys.stderr
+        sys.stderr = open(os.devnull, "w")
+        try:
+            self.start()
+            sock = self.connect()
+            sock.sendall("GET /fail HTTP/1.1\r\n\r\n")
+            data = self.receive(sock, until_closed=True)
+        finally:
+            sys.stderr = stderr
+        self.assertTrue(data.startswith("HTTP/1.1 500 Internal Server Error\r\n"))
+
+    def test_environ_follows_wsgiref(self):
+        """ Test the environ holds what the wsgiref server would provide """
+        environs = []
+        def app(environ, start_response):
+            environs.append(environ)
+            start_response("204 No Content", [])
+            return []
+        self.start()
+        self.server.app = app
+        sock = self.connect()
+        sock.sendall("GET /a%20b?x=1 HTTP/1.1\r\nX-Token: t1\r\nX-Token: t2\r\n"
+                "\r\n")
+        data = self.receive(sock)
+        self.assertFalse("Content-Length" in data)
+        environ = environs[0]
+        self.assertEqual(environ['PATH_INFO'], "/a b")
+        self.assertEqual(environ['QUERY_STRING'], "x=1")
+        self.assertEqual(environ['CONTENT_TYPE'], "text/plain")
+        self.assertEqual(environ['HTTP_X_TOKEN'], "t1,t2")
+        self.assertEqual(environ['REMOTE_ADDR'], "127.0.0.1")
+        self.assertEqual(environ['SERVER_PROTOCOL'], "HTTP/1.1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import StringIO
+import sys
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.form
+
+
+class TestForm(unittest.TestCase):
+    """ Test the ocelog.form module
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+
+    def make_environ(self, body, content_length=None):
+        """ Return a minimal WSGI environ holding the given body """
+        if content_length is None:
+            content_length = str(len(body))
+        environ = {}
+        environ['CONTENT_LENGTH'] = content_length
+        environ['REMOTE_ADDR'] = "10.1.1.1"
+        environ['wsgi.input'] = StringIO.StringIO(body)
+        return environ
+
+    #--------------------------------------------------------------------------
+    # parse_fields
+    #--------------------------------------------------------------------------
+    def test_parse_fields_returns_all_known_fields(self):
+        """ Test every known field is extracted """
+        data = "hostname=web1&appname=app1&msg=event&facility=local0&priority=err"
+        fields = ocelog.form.parse_fields(data)
+        self.assertEqual(fields, {"hostname": "web1", "appname": "app1",
+            "msg": "event", "facility": "local0", "priority": "err"})
+
+    def test_parse_fields_decodes_escaped_values(self):
+        """ Test percent escapes and plus signs are decoded """
+        fields = ocelog.form.parse_fields("msg=disk+is%2090%25+full&app%6Eame=a")
+        self.assertEqual(fields["msg"], "disk is 90% full")
+        self.assertEqual(fields["appname"], "a")
+
+    def test_parse_fields_keeps_blank_values(self):
+        """ Test blank values are kept so validation can reject them """
+        fields = ocelog.form.parse_fields("appname=&msg")
+        self.assertEqual(fields, {"appname": "", "msg": ""})
+
+    def test_parse_fields_rejects_unknown_fields(self):
+        """ Test an unknown field raises a FormException with a 400 """
+        try:
+            ocelog.form.parse_fields("appname=a&msg=b&colour=red")
+            self.fail("unknown field was accepted")
+        except ocelog.form.FormException, e:
+            self.assertEqual(e.status, 400)
+            self.assertEqual(e.error_msg, "Request included an unknown field")
+
+    def test_parse_fields_rejects_duplicate_fields(self):
+        """ Test a repeated field raises a FormException """
+        self.assertRaises(ocelog.form.FormException, ocelog.form.parse_fields,
+                "appname=a&msg=b&msg=c")
+
+    #--------------------------------------------------------------------------
+    # read_body / LogRequest
+    #--------------------------------------------------------------------------
+    def test_read_body_reads_only_content_length_bytes(self):
+        """ Test the body is not read past Content-Length """
+        environ = self.make_environ("appname=a&msg=b&trailing", "15")
+        self.assertEqual(ocelog.form.read_body(environ, 1024), "appname=a&msg=b")
+
+    def test_read_body_rejects_oversized_bodies_before_reading(self):
+        """ Test a body over max_length raises a 413 without being read """
+        environ = self.make_environ("appname=a&msg=" + "x" * 100)
+        try:
+            ocelog.form.read_body(environ, 64)
+            self.fail("oversized body was accepted")
+        except ocelog.form.FormException, e:
+            self.assertEqual(e.status, 413)
+        self.assertEqual(environ['wsgi.input'].tell(), 0)
+
+    def test_read_body_rejects_invalid_content_length(self):
+        """ Test a non-numeric Content-Length raises a FormException """
+        environ = self.make_environ("appname=a", "lots")
+        self.assertRaises(ocelog.form.FormException, ocelog.form.read_body,
+                environ, 1024)
+
+    def test_log_request_offers_environ_body_and_post(self):
+        """ Test LogRequest exposes the attributes used by auth and message """
+        environ = self.make_environ("appname=a&msg=b")
+        log_request = ocelog.form.LogRequest(environ, 1024)
+        self.assertTrue(log_request.environ is environ)
+        self.assertEqual(log_request.body, "appname=a&msg=b")
+        self.assertEqual(log_request.POST.get("msg"), "b")
+        self.assertEqual(log_request.POST.get("hostname"), None)
+
+
+if __name__=="__main__":
+
+    unittest.main()
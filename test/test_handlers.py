@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import StringIO
+import sys
+import threading
+import urllib
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.admission
+import ocelog.auth
+import ocelog.config
+import ocelog.handlers
+import ocelog.idempotency
+import ocelog.metrics
+import ocelog.ratelimit
+import ocelog_mock
+
+
+log_fields = {'facility': "local3", 'priority': "info", 'hostname': "webhost1",
+    'appname': "testapp", 'msg': "the coffee pot volume is low"}
+log_body = urllib.urlencode(log_fields)
+invalid_body = urllib.urlencode(dict(log_fields, facility="bad-facility"))
+
+
+def make_environ(body, content_type="application/x-www-form-urlencoded",
+        headers=None):
+    """ Return a WSGI environ for a POST """
+    environ = {
+        'REQUEST_METHOD': "POST",
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'REMOTE_ADDR': "10.1.1.1",
+        'wsgi.input': StringIO.StringIO(body),
+        }
+    if headers:
+        environ.update(headers)
+    return environ
+
+
+class TestHandlers(unittest.TestCase):
+    """ Test the ocelog.handlers module
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py)
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        self.oconfig = ocelog.config.Config()
+        ocelog.idempotency._default_cache = None
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        ocelog.idempotency._default_cache = None
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        ocelog.config.publish(ocelog.config.Config().snapshot())
+
+    def call(self, handler, environ):
+        """ Run a handler under the current configuration """
+        ocelog.config.publish(self.oconfig.snapshot())
+        return handler(environ, ocelog.metrics.RequestTimer("/test"))
+
+    #--------------------------------------------------------------------------
+    # log
+    #--------------------------------------------------------------------------
+    def test_log_accepts_a_valid_message(self):
+        """ Test a valid message is answered with an empty 201 """
+        reply = self.call(ocelog.handlers.log, make_environ(log_body))
+        self.assertEqual((reply.status, reply.headers, reply.body),
+                (201, [], ""))
+
+    def test_log_errors_are_set_as_headers(self):
+        """ Test refused requests carry their reason in x-ocelog-error """
+        reply = self.call(ocelog.handlers.log, make_environ(log_body,
+                content_type="text/plain"))
+        self.assertEqual((reply.status, reply.headers), (415,
+                [("x-ocelog-error", "Data must be x-www-form-urlencoded")]))
+        reply = self.call(ocelog.handlers.log, make_environ(invalid_body))
+        self.assertEqual((reply.status, reply.headers), (400,
+                [("x-ocelog-error", "Message included invalid facility")]))
+
+    def test_log_rate_limits_with_retry_after(self):
+        """ Test a limited request gets a 429 with Retry-After """
+        self.oconfig.ratelimit.enabled = True
+        self.oconfig.ratelimit.key = "client"
+        self.oconfig.ratelimit.client_limits = "10.1.1.2=0.5/1"
+        environ = make_environ(log_body)
+        environ['REMOTE_ADDR'] = "10.1.1.2"
+        self.assertEqual(self.call(ocelog.handlers.log, environ).status, 201)
+        environ['wsgi.input'].seek(0)
+        reply = self.call(ocelog.handlers.log, environ)
+        self.assertEqual(reply.status, 429)
+        self.assertEqual(reply.headers[0], ("Retry-After", "2"))
+
+    def test_log_charges_the_appname_only_once_authorized(self):
+        """ Test unsigned requests can't drain an appname's bucket """
+        ocelog.ratelimit._default_limiter = None
+        self.oconfig.ratelimit.enabled = True
+        self.oconfig.ratelimit.key = "appname"
+        self.oconfig.ratelimit.appname_limits = "testapp=0.5/1"
+        self.oconfig.security.shared_secret = "beanbags"
+        self.oconfig.security.require_token = True
+        for i in range(3):
+            reply = self.call(ocelog.handlers.log, make_environ(log_body))
+            self.assertEqual(reply.status, 400)
+        token = ocelog.auth.generate_token(log_fields['msg'],
+                self.oconfig.security, "beanbags")
+        signed = {'HTTP_X_TOKEN': token}
+        reply = self.call(ocelog.handlers.log, make_environ(log_body,
+                headers=signed))
+        self.assertEqual(reply.status, 201)
+        reply = self.call(ocelog.handlers.log, make_environ(log_body,
+                headers=signed))
+        self.assertEqual(reply.status, 429)
+
+    def test_log_refuses_an_invalid_priority_under_load(self):
+        """ Test a bad priority gets a 400, not a 503 to retry """
+        self.oconfig.admission.enabled = True
+        self.oconfig.admission.max_in_flight = 1
+        self.oconfig.message.default_priority = "crit"
+        controller = ocelog.admission.AdmissionController()
+        controller.in_flight = 5
+        try:
+            body = urllib.urlencode(dict(log_fields, priority="loud"))
+            reply = self.call(ocelog.handlers.log, make_environ(body))
+            self.assertEqual((reply.status, reply.headers), (400,
+                    [("x-ocelog-error", "Message included invalid priority")]))
+            reply = self.call(ocelog.handlers.log, make_environ(log_body))
+            self.assertEqual(reply.status, 503)
+        finally:
+            controller.in_flight = 0
+
+    def test_log_replays_idempotent_retries(self):
+        """ Test a retried key gets the first result and a replay header """
+        self.oconfig.idempotency.enabled = True
+        headers = {'HTTP_X_IDEMPOTENCY_KEY': "key1"}
+        reply = self.call(ocelog.handlers.log, make_environ(invalid_body,
+                headers=headers))
+        self.assertEqual(reply.status, 400)
+        reply = self.call(ocelog.handlers.log, make_environ(invalid_body,
+                headers=headers))
+        self.assertEqual((reply.status, reply.headers), (400,
+                [("x-ocelog-error", "Message included invalid facility"),
+                 ("x-ocelog-idempotent-replay", "true")]))
+
+    def test_log_retries_a_failed_write_with_the_same_key(self):
+        """ Test a failed write isn't replayed, so the retry is written """
+        self.oconfig.idempotency.enabled = True
+        headers = {'HTTP_X_IDEMPOTENCY_KEY': "key1"}
+        writer = ocelog_mock.MockRecordingWriter(write_success=False)
+        default_writer = ocelog.handlers.default_writer
+        ocelog.handlers.default_writer = lambda oconfig: writer
+        try:
+            reply = self.call(ocelog.handlers.log, make_environ(log_body,
+                    headers=headers))
+            self.assertEqual(reply.status, 400)
+            writer.write_success = True
+            reply = self.call(ocelog.handlers.log, make_environ(log_body,
+                    headers=headers))
+            self.assertEqual((reply.status, reply.headers), (201, []))
+            reply = self.call(ocelog.handlers.log, make_environ(log_body,
+                    headers=headers))
+            self.assertEqual((reply.status, reply.headers), (201,
+                    [("x-ocelog-idempotent-replay", "true")]))
+        finally:
+            ocelog.handlers.default_writer = default_writer
+        self.assertEqual(len(writer.messages), 2)
+
+    def test_log_refuses_a_key_reused_for_another_body(self):
+        """ Test a known key with a different body gets a 422 """
+        self.oconfig.idempotency.enabled = True
+        headers = {'HTTP_X_IDEMPOTENCY_KEY': "key1"}
+        reply = self.call(ocelog.handlers.log, make_environ(invalid_body,
+                headers=headers))
+        self.assertEqual(reply.status, 400)
+        reply = self.call(ocelog.handlers.log, make_environ(log_body,
+                headers=headers))
+        self.assertEqual((reply.status, reply.headers), (422,
+                [("x-ocelog-error",
+                  "Idempotency key was used for a different request")]))
+
+    def test_log_idempotency_keys_are_scoped_to_the_client(self):
+        """ Test the same key from another key id or appname isn't replayed """
+        self.oconfig.idempotency.enabled = True
+        for key_id, appname in (("ka", "tenantA"), ("kb", "tenantB"),
+                ("ka", "tenantB")):
+            body = urllib.urlencode(dict(log_fields, appname=appname,
+                    msg="from %s" % key_id))
+            reply = self.call(ocelog.handlers.log, make_environ(body,
+                    headers={'HTTP_X_IDEMPOTENCY_KEY': "1",
+                             'HTTP_X_KEY_ID': key_id}))
+            self.assertEqual((reply.status, reply.headers), (201, []))
+
+    def test_log_runs_on_any_thread(self):
+        """ Test concurrent calls each get their own reply """
+        replies = {}
+        def run(name, body):
+            replies[name] = self.call(ocelog.handlers.log, make_environ(body))
+        threads = [threading.Thread(target=run, args=(i, (log_body,
+                invalid_body)[i % 2])) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([replies[i].status for i in range(8)], [201, 400] * 4)
+
+    #--------------------------------------------------------------------------
+    # log_batch
+    #--------------------------------------------------------------------------
+    def test_log_batch_answers_each_record(self):
+        """ Test a batch gets one status line per record as text/plain """
+        body = "%s\n%s\n" % (log_body, invalid_body)
+        reply = self.call(ocelog.handlers.log_batch, make_environ(body,
+                content_type="text/plain"))
+        self.assertEqual(reply.status, 200)
+        self.assertEqual(reply.headers, [("Content-Type", "text/plain")])
+        self.assertEqual(reply.body,
+                "201\n400 Message included invalid facility\n")
+
+    def test_log_batch_without_records_is_refused(self):
+        """ Test an empty batch is answered with a 400 """
+        reply = self.call(ocelog.handlers.log_batch, make_environ("\n",
+                content_type="text/plain"))
+        self.assertEqual((reply.status, reply.headers), (400,
+                [("x-ocelog-error", "Batch included no records")]))
+
+
+if __name__ == "__main__":
+    unittest.main()
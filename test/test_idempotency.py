@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import sys
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.idempotency
+
+
+class TestIdempotencyCache(unittest.TestCase):
+    """ Test the ocelog.idempotency module
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        self.cache = ocelog.idempotency.IdempotencyCache(ttl=100, max_entries=5)
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+
+    #--------------------------------------------------------------------------
+    # begin / finish
+    #--------------------------------------------------------------------------
+    def test_first_request_goes_ahead(self):
+        """ Test begin() returns None for an unseen key """
+        self.assertEqual(self.cache.begin("key1", now=1000.0), None)
+
+    def test_retry_during_the_first_request_is_in_progress(self):
+        """ Test a claimed key without a result returns IN_PROGRESS """
+        self.cache.begin("key1", now=1000.0)
+        self.assertTrue(self.cache.begin("key1", now=1001.0) is 
+                ocelog.idempotency.IN_PROGRESS)
+
+    def test_retry_gets_the_stored_result(self):
+        """ Test a finished key returns its result """
+        self.cache.begin("key1", now=1000.0)
+        self.cache.finish("key1", (201, []), now=1000.5)
+        self.assertEqual(self.cache.begin("key1", now=1050.0), (201, []))
+
+    def test_retry_with_another_fingerprint_is_a_mismatch(self):
+        """ Test a key claimed with one fingerprint refuses another """
+        self.cache.begin("key1", "digest1", now=1000.0)
+        self.assertTrue(self.cache.begin("key1", "digest2", now=1000.5) is
+                ocelog.idempotency.MISMATCH)
+        self.cache.finish("key1", (201, []), now=1001.0)
+        self.assertTrue(self.cache.begin("key1", "digest2", now=1002.0) is
+                ocelog.idempotency.MISMATCH)
+        self.assertEqual(self.cache.begin("key1", "digest1", now=1003.0),
+                (201, []))
+
+    def test_scoped_key_includes_the_client_and_appname(self):
+        """ Test scoped keys differ by key id, client address and appname """
+        environ = {'REMOTE_ADDR': "10.1.1.1"}
+        self.assertEqual(ocelog.idempotency.scoped_key("1", "app", environ),
+                ("10.1.1.1", "app", "1"))
+        environ['HTTP_X_KEY_ID'] = "ka"
+        self.assertEqual(ocelog.idempotency.scoped_key("1", "app", environ),
+                ("ka", "app", "1"))
+
+    def test_released_key_can_be_claimed_again(self):
+        """ Test finish() with no result lets a retry go ahead """
+        self.cache.begin("key1", now=1000.0)
+        self.cache.finish("key1", None, now=1000.5)
+        self.assertEqual(self.cache.begin("key1", now=1001.0), None)
+
+    #--------------------------------------------------------------------------
+    # expiry and bounds
+    #--------------------------------------------------------------------------
+    def test_keys_expire_after_the_ttl(self):
+        """ Test a key is forgotten within one bucket after the ttl """
+        self.cache.begin("key1", now=1000.0)
+        self.cache.finish("key1", (201, []), now=1000.0)
+        self.assertEqual(self.cache.begin("key1", now=1099.0), (201, []))
+        self.assertEqual(self.cache.begin("key1", now=1111.0), None)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_ttl_runs_from_the_first_request(self):
+        """ Test finishing late doesn't extend the key's life """
+        self.cache.begin("key1", now=1000.0)
+        self.cache.finish("key1", (201, []), now=1090.0)
+        self.assertEqual(self.cache.begin("key1", now=1111.0), None)
+
+    def test_oldest_keys_are_dropped_beyond_max_entries(self):
+        """ Test the cache never files more than max_entries keys """
+        for i in range(8):
+            self.cache.begin("key%d" % i, now=1000.0 + i * 5)
+            self.cache.finish("key%d" % i, (201, []), now=1000.0 + i * 5)
+        self.assertEqual(len(self.cache), 5)
+        self.assertEqual(self.cache.begin("key0", now=1040.0), None)
+        self.assertEqual(self.cache.begin("key7", now=1040.0), (201, []))
+
+    def test_released_keys_count_against_max_entries(self):
+        """ Test keys released but not yet expired stay within the bound """
+        for i in range(20):
+            self.cache.begin("key%d" % i, now=1000.0)
+            self.cache.finish("key%d" % i, None, now=1000.0)
+        self.assertEqual(sum(len(keys) for bucket, keys in self.cache._buckets), 5)
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
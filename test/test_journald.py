@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+import unittest
+import errno
+import os.path
+import socket
+import struct
+import sys
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+import ocelog.journald
+import ocelog_mock
+
+
+def parse_entry(entry):
+    """ Decode a native journal entry into a dict of fields """
+    fields = {}
+    while entry:
+        line, rest = entry.split("\n", 1)
+        if "=" in line:
+            name, value = line.split("=", 1)
+            entry = rest
+        else:
+            name = line
+            length = struct.unpack("<Q", rest[:8])[0]
+            value = rest[8:8 + length]
+            entry = rest[8 + length + 1:]
+        fields[name] = value
+    return fields
+
+
+class TestJournaldWriter(unittest.TestCase):
+    """ Test the JournaldWriter against a local stand-in journal socket
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py) and the writer socket
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        self.listener = ocelog_mock.MockSyslogSocket()
+        self.owriter = ocelog.journald.JournaldWriter()
+        self.owriter.reload(ocelog.config.Config())
+        self.owriter.close()
+        self.owriter.config.journald.socket_path = self.listener.path
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        self.owriter.close()
+        self.listener.close()
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+
+    def recv_entry(self):
+        """ Return the fields of the next entry received """
+        return parse_entry(self.listener.sock.recv(1 << 20))
+
+    #--------------------------------------------------------------------------
+    # initialization behavior
+    #--------------------------------------------------------------------------
+    def test_journald_writer_is_singleton(self):
+        """ Confirm singleton behavior is enforced for JournaldWriter """
+        self.assertEqual(self.owriter, ocelog.journald.JournaldWriter())
+
+    #--------------------------------------------------------------------------
+    # format
+    #--------------------------------------------------------------------------
+    def test_format_returns_native_fields(self):
+        """ Test the entry holds the message fields as KEY=VALUE lines """
+        message = ocelog_mock.MockMessage(hostname="webhost1", appname="app1",
+                msg="the cache was flushed", facility="local3", priority="err")
+        self.assertEqual(self.owriter.format(message),
+                "MESSAGE=the cache was flushed\nPRIORITY=3\nSYSLOG_FACILITY=19\n"
+                "SYSLOG_IDENTIFIER=app1\nOCELOG_SOURCE_HOST=webhost1\n")
+
+    def test_format_encodes_multiline_values_with_a_length(self):
+        """ Test a value with a newline uses the binary length encoding """
+        message = ocelog_mock.MockMessage(msg="line one\nline two")
+        entry = self.owriter.format(message)
+        self.assertTrue(entry.startswith("MESSAGE\n%sline one\nline two\n" %
+                struct.pack("<Q", 17)))
+        self.assertEqual(parse_entry(entry)["MESSAGE"], "line one\nline two")
+
+    #--------------------------------------------------------------------------
+    # write
+    #--------------------------------------------------------------------------
+    def test_write_sends_one_entry_per_message(self):
+        """ Test a write delivers one datagram holding the entry """
+        message = ocelog_mock.MockMessage(msg="the client has disconnected",
+                facility="authpriv", priority="info")
+        self.assertTrue(self.owriter.write(message))
+        fields = self.recv_entry()
+        self.assertEqual(fields["MESSAGE"], "the client has disconnected")
+        self.assertEqual(fields["PRIORITY"], "6")
+        self.assertEqual(fields["SYSLOG_FACILITY"], "10")
+        self.assertEqual(fields["SYSLOG_IDENTIFIER"], "mockapp")
+        self.assertEqual(fields["OCELOG_SOURCE_HOST"], "1.2.3.4")
+
+    def test_write_reuses_the_connection(self):
+        """ Test consecutive writes share a single socket """
+        self.owriter.write(ocelog_mock.MockMessage(msg="first"))
+        sock = self.owriter._sock
+        self.owriter.write(ocelog_mock.MockMessage(msg="second"))
+        self.assertTrue(sock is self.owriter._sock)
+
+    def test_write_truncates_oversized_entries(self):
+        """ Test an entry too large for a datagram is truncated and marked """
+        message = ocelog_mock.MockMessage(msg="x" * 4000000)
+        self.assertTrue(self.owriter.write(message))
+        fields = self.recv_entry()
+        self.assertEqual(fields["OCELOG_TRUNCATED"], "1")
+        self.assertTrue(0 < len(fields["MESSAGE"]) < 4000000)
+
+    def test_write_retries_when_buffers_are_short(self):
+        """ Test ENOBUFS is retried and never truncates the message """
+        sent = []
+        class ShortSocket(object):
+            def __init__(self, shortages):
+                self.shortages = shortages
+            def send(self, entry):
+                if self.shortages:
+                    self.shortages -= 1
+                    raise socket.error(errno.ENOBUFS, "No buffer space available")
+                sent.append(entry)
+            def close(self):
+                pass
+        self.owriter._sock_path = self.owriter.config.journald.socket_path
+        self.owriter._sock = ShortSocket(2)
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="x" * 2000)))
+        self.assertFalse("OCELOG_TRUNCATED" in sent[0])
+        self.owriter._sock = ShortSocket(100)
+        self.assertFalse(self.owriter.write(ocelog_mock.MockMessage(msg="x" * 2000)))
+        self.assertEqual(len(sent), 1)
+
+    def test_write_fails_for_invalid_messages(self):
+        """ Test a message with an unknown priority is not sent """
+        message = ocelog_mock.MockMessage(priority="invalid")
+        self.assertFalse(self.owriter.write(message))
+
+    def test_write_fails_when_socket_is_unavailable(self):
+        """ Test a write returns False when there is no journal socket """
+        self.owriter.config.journald.socket_path = "/nonexistent/ocelog/journal"
+        self.assertFalse(self.owriter.write(ocelog_mock.MockMessage()))
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import StringIO
+import sys
+import urllib
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+import ocelog.handlers
+import ocelog.lean
+import ocelog.metrics
+import ocelog.wsgi
+
+
+log_fields = {'facility': "local3", 'priority': "info", 'hostname': "webhost1",
+    'appname': "testapp", 'msg': "the coffee pot volume is low"}
+log_body = urllib.urlencode(log_fields)
+invalid_body = urllib.urlencode(dict(log_fields, facility="bad-facility"))
+
+form_type = "application/x-www-form-urlencoded"
+
+
+def make_environ(method, path, body="", content_type=form_type, headers=None):
+    """ Return a WSGI environ for a request """
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'REMOTE_ADDR': "10.1.1.1",
+        'wsgi.input': StringIO.StringIO(body),
+        'wsgi.errors': StringIO.StringIO(),
+        }
+    if headers:
+        environ.update(headers)
+    return environ
+
+
+class TestLean(unittest.TestCase):
+    """ Test ocelog.lean.application answers as ocelog.wsgi.application does
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py)
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        ocelog.config.publish(ocelog.config.Config().snapshot())
+        ocelog.metrics.reset()
+        self.log_handler = ocelog.handlers.log
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        ocelog.handlers.log = self.log_handler
+        ocelog.metrics.reset()
+
+    def call(self, application, *args, **kargs):
+        """ Send a request and return the status, headers and body """
+        environ = make_environ(*args, **kargs)
+        started = []
+        def start_response(status, headers, exc_info=None):
+            started.append((status, headers))
+        body = "".join(application(environ, start_response))
+        status, headers = started[0]
+        return status, headers, body, environ['wsgi.errors'].getvalue()
+
+    def assertSameResponse(self, *args, **kargs):
+        """ Assert both applications give the same response to a request """
+        self.assertEqual(self.call(ocelog.lean.application, *args, **kargs),
+                self.call(ocelog.wsgi.application, *args, **kargs), args)
+
+    #--------------------------------------------------------------------------
+    # routes
+    #--------------------------------------------------------------------------
+    def test_every_route_answers_as_bottle_does(self):
+        """ Test each method and path, including the 404s, match bottle """
+        for path in ("/", "/log", "/log/batch", "/metrics/", "/nope", "log",
+                " /log ", "//log", ""):
+            for method in ("GET", "HEAD", "POST", "PUT", "DELETE", "PATCH",
+                    "get"):
+                self.assertSameResponse(method, path, log_body)
+
+    def test_log_replies_match_bottle(self):
+        """ Test accepted and refused messages get bottle's responses """
+        self.assertSameResponse("POST", "/log", log_body)
+        self.assertSameResponse("POST", "/log", invalid_body)
+        self.assertSameResponse("POST", "/log", log_body,
+                content_type="text/plain")
+        self.assertSameResponse("POST", "/log/batch",
+                "%s\n%s\n" % (log_body, invalid_body),
+                content_type="text/plain")
+        self.assertSameResponse("POST", "/log/batch", "\n",
+                content_type="text/plain")
+
+    def test_log_status_lines_and_headers(self):
+        """ Test the precomputed status lines and title cased headers """
+        status, headers, body, errors = self.call(ocelog.lean.application,
+                "POST", "/log", log_body)
+        self.assertEqual((status, headers, body), ("201 CREATED",
+                [("Content-Type", "text/html"), ("Content-Length", "0")], ""))
+        status, headers, body, errors = self.call(ocelog.lean.application,
+                "POST", "/log", invalid_body)
+        self.assertEqual(status, "400 BAD REQUEST")
+        self.assertTrue(("X-Ocelog-Error", "Message included invalid facility")
+                in headers)
+
+    def test_other_methods_get_405_with_allow(self):
+        """ Test a known path with another method gets a 405 and Allow """
+        status, headers, body, errors = self.call(ocelog.lean.application,
+                "PATCH", "/log", log_body)
+        self.assertEqual((status, headers), ("405 METHOD NOT ALLOWED",
+                [("Content-Type", "text/html"), ("Allow", "GET, HEAD, POST"),
+                 ("Content-Length", "0")]))
+
+    def test_help_doc_if_modified_since(self):
+        """ Test a fresh If-Modified-Since gets bottle's 304 """
+        for ims in ("Fri, 01 Jan 1971 00:00:00 GMT",
+                "Fri, 01 Jan 2100 00:00:00 GMT; length=146", "garbage"):
+            headers = {'HTTP_IF_MODIFIED_SINCE': ims}
+            self.assertSameResponse("GET", "/", headers=headers)
+            self.assertSameResponse("HEAD", "/log", headers=headers)
+
+    def test_help_doc_is_reread_when_changed(self):
+        """ Test the cached file is replaced when its mtime changes """
+        application = ocelog.lean.LeanApplication()
+        help_doc = application.help_doc
+        status, headers, body, errors = self.call(application, "GET", "/")
+        stamp, mtime, cached_headers, content = help_doc._cached
+        help_doc._cached = ((0, 0), 0, cached_headers, "stale")
+        status, headers, body, errors = self.call(application, "GET", "/")
+        self.assertEqual(body, content)
+
+    def test_unhandled_exceptions_match_bottle(self):
+        """ Test an exception in a handler gets bottle's 500 page """
+        def fail(environ, timer):
+            raise ValueError("failing as asked")
+        ocelog.handlers.log = fail
+        self.assertSameResponse("POST", "/log", log_body)
+        status, headers, body, errors = self.call(ocelog.lean.application,
+                "POST", "/log", log_body)
+        self.assertEqual(status, "500 INTERNAL SERVER ERROR")
+        self.assertEqual(errors,
+                "Unhandled Exception: ValueError('failing as asked',)\n")
+
+    #--------------------------------------------------------------------------
+    # metrics
+    #--------------------------------------------------------------------------
+    def test_requests_are_counted_as_bottle_counts_them(self):
+        """ Test the same routes and codes are recorded by both """
+        def counted(application):
+            ocelog.metrics.reset()
+            self.call(application, "POST", "/log", log_body)
+            self.call(application, "POST", "//log", invalid_body)
+            self.call(application, "PUT", "/log/batch")
+            self.call(application, "GET", "/")
+            self.call(application, "GET", "/metrics")
+            return ocelog.metrics.collect()[1]
+        counters = counted(ocelog.lean.application)
+        self.assertEqual(counters, counted(ocelog.wsgi.application))
+        self.assertEqual(len(counters), 3)
+        status, headers, body, errors = self.call(ocelog.lean.application,
+                "GET", "/metrics")
+        self.assertEqual(headers[0],
+                ("Content-Type", "text/plain; version=0.0.4"))
+        self.assertTrue('route="/log/batch",code="405"' in body)
+
+
+if __name__ == "__main__":
+    unittest.main()
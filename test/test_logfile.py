@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import os.path
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+import ocelog.logfile
+import ocelog_mock
+
+
+class TestFileWriter(unittest.TestCase):
+    """ Test the FileWriter against a temporary directory
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py) and the writer file
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        self.directory = tempfile.mkdtemp(prefix="ocelog-test-")
+        self.path = os.path.join(self.directory, "logs", "ocelog.log")
+        self.owriter = ocelog.logfile.FileWriter()
+        self.owriter.reload(ocelog.config.Config())
+        self.owriter.close()
+        self.owriter.config.file.path = self.path
+        self.owriter.config.file.fsync = "shutdown"
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        self.owriter.close()
+        shutil.rmtree(self.directory)
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+
+    def read_lines(self, path=None):
+        """ Return the lines of the log file """
+        return open(path or self.path).read().splitlines()
+
+    #--------------------------------------------------------------------------
+    # initialization behavior
+    #--------------------------------------------------------------------------
+    def test_file_writer_is_singleton(self):
+        """ Confirm singleton behavior is enforced for FileWriter """
+        self.assertEqual(self.owriter, ocelog.logfile.FileWriter())
+
+    #--------------------------------------------------------------------------
+    # format
+    #--------------------------------------------------------------------------
+    def test_format_returns_one_line(self):
+        """ Test the line holds a utc timestamp and the message fields """
+        message = ocelog_mock.MockMessage(hostname="webhost1", appname="app1",
+                msg="the cache was flushed", facility="local3", priority="err")
+        self.assertEqual(self.owriter.format(message, 1287426896.25),
+                "2010-10-18T18:34:56.250000Z webhost1 app1 local3.err: "
+                "the cache was flushed\n")
+
+    def test_format_escapes_newlines(self):
+        """ Test a multi-line message is still written as one line """
+        message = ocelog_mock.MockMessage(msg="line one\nline two")
+        self.assertTrue(self.owriter.format(message).endswith(": line one\\nline two\n"))
+
+    #--------------------------------------------------------------------------
+    # write
+    #--------------------------------------------------------------------------
+    def test_writes_are_buffered_until_synced(self):
+        """ Test lines reach the file on close() with the shutdown policy """
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="first")))
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.owriter.close()
+        self.assertTrue(self.read_lines()[0].endswith("first"))
+
+    def test_write_batch_appends_every_message(self):
+        """ Test write_batch() writes the lines in order and reports bad ones """
+        messages = [ocelog_mock.MockMessage(msg="event %d" % i) for i in range(3)]
+        messages.append(ocelog_mock.MockMessage(msg=None))
+        self.assertEqual(self.owriter.write_batch(messages), [True] * 3 + [False])
+        self.owriter.close()
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].endswith("event 2"))
+
+    def test_records_policy_syncs_every_n_records(self):
+        """ Test the records policy flushes after fsync_records lines """
+        self.owriter.config.file.fsync = "records"
+        self.owriter.config.file.fsync_records = 2
+        self.owriter.write(ocelog_mock.MockMessage(msg="first"))
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.owriter.write(ocelog_mock.MockMessage(msg="second"))
+        self.assertEqual(len(self.read_lines()), 2)
+
+    def test_interval_policy_syncs_in_the_background(self):
+        """ Test the interval policy flushes without further writes """
+        self.owriter.config.file.fsync = "interval"
+        self.owriter.config.file.fsync_interval = 0.05
+        self.owriter.write(ocelog_mock.MockMessage(msg="first"))
+        deadline = time.time() + 2
+        while os.path.getsize(self.path) == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.read_lines()), 1)
+
+    def test_write_fails_when_the_file_cannot_be_opened(self):
+        """ Test a write returns False when the path isn't writable """
+        open(os.path.join(self.directory, "blocker"), "w").close()
+        self.owriter.config.file.path = os.path.join(self.directory, "blocker", "log")
+        self.assertFalse(self.owriter.write(ocelog_mock.MockMessage()))
+
+    #--------------------------------------------------------------------------
+    # rotation
+    #--------------------------------------------------------------------------
+    def test_file_is_rotated_by_size(self):
+        """ Test a write that would pass rotate_size starts a new file """
+        line_length = len(self.owriter.format(ocelog_mock.MockMessage()))
+        self.owriter.config.file.rotate_size = line_length * 2
+        for i in range(3):
+            self.owriter.write(ocelog_mock.MockMessage())
+        self.owriter.close()
+        names = sorted(os.listdir(os.path.dirname(self.path)))
+        self.assertEqual(len(names), 2)
+        self.assertEqual(names[0], "ocelog.log")
+        self.assertTrue(re.match(r"^ocelog\.log\.\d{8}-\d{6}$", names[1]))
+        rotated = os.path.join(os.path.dirname(self.path), names[1])
+        self.assertEqual(len(self.read_lines(rotated)), 2)
+        self.assertEqual(len(self.read_lines()), 1)
+
+    def test_file_is_rotated_by_time(self):
+        """ Test a write after a rotate_interval boundary starts a new file """
+        self.owriter.config.file.rotate_interval = 3600
+        self.owriter.write(ocelog_mock.MockMessage(msg="before"))
+        self.owriter._rotate_at = time.time()
+        self.owriter.write(ocelog_mock.MockMessage(msg="after"))
+        self.owriter.close()
+        self.assertEqual(len(os.listdir(os.path.dirname(self.path))), 2)
+        self.assertEqual(len(self.read_lines()), 1)
+        self.assertTrue(self.read_lines()[0].endswith("after"))
+
+    def test_rotation_never_overwrites_a_rotated_file(self):
+        """ Test two rotations in the same second keep both files """
+        line_length = len(self.owriter.format(ocelog_mock.MockMessage()))
+        self.owriter.config.file.rotate_size = line_length
+        for i in range(3):
+            self.owriter.write(ocelog_mock.MockMessage())
+        self.owriter.close()
+        self.assertEqual(len(os.listdir(os.path.dirname(self.path))), 3)
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
@@ -143,6 +143,17 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(self.omessage.status, None)
         self.assertEqual(self.omessage.error_msg, None)
 
+    def test_message_initialization_with_config_snapshot(self):
+        """ Test message defaults are taken from a given config snapshot """
+        oconfig = ocelog.config.Config()
+        oconfig.message.default_priority = "info"
+        snapshot = oconfig.snapshot()
+        oconfig.message.default_priority = "notice"
+        self.omessage = ocelog.message.Message("host1", "app1", "event", 
+                config=snapshot)
+        self.assertEqual(self.omessage.priority, "info")
+        self.assertTrue(self.omessage.config is snapshot)
+
     #--------------------------------------------------------------------------
     # validation (via initialization)
     #--------------------------------------------------------------------------
@@ -268,6 +279,24 @@ class TestMessage(unittest.TestCase):
         self.assertTrue(len(self.omessage.error_msg) > 1)
         self.assertTrue(self.omessage.error_msg.count("Failure writing message to syslog"), 1)
 
+    def test_write_batch_sets_status_for_each_message(self):
+        """ Test write_batch hands over the list and sets each status """
+        writer = ocelog_mock.MockBatchWriter()
+        messages = [ocelog.message.Message("host1", "app1", "event %d" % i) 
+                for i in range(3)]
+        ocelog.message.write_batch(messages, writer)
+        self.assertEqual(len(writer.batches), 1)
+        self.assertEqual([m.status for m in messages], ["success"] * 3)
+
+    def test_write_batch_falls_back_to_single_writes(self):
+        """ Test write_batch works with writers lacking write_batch() """
+        writer = ocelog_mock.MockSyslogWriter(write_success=False)
+        messages = [ocelog.message.Message("host1", "app1", "event %d" % i) 
+                for i in range(2)]
+        ocelog.message.write_batch(messages, writer)
+        self.assertEqual([m.status for m in messages], ["write-failure"] * 2)
+        self.assertEqual(messages[0].error_msg, "Failure writing message to syslog")
+
     #--------------------------------------------------------------------------
     # message printing (for status)
     #--------------------------------------------------------------------------
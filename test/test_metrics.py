@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import sys
+import threading
+import time
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """ Test the ocelog.metrics module
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        ocelog.metrics.reset()
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        ocelog.metrics.reset()
+
+    #--------------------------------------------------------------------------
+    # Histogram
+    #--------------------------------------------------------------------------
+    def test_histogram_quantiles_are_within_bucket_precision(self):
+        """ Test quantiles are no more than 25% above the true latency """
+        histogram = ocelog.metrics.Histogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1000000.0)         # 1us .. 1000us
+        for q, expected in ((0.5, 0.000500), (0.99, 0.000990), (0.999, 0.000999)):
+            value = histogram.quantile(q)
+            self.assertTrue(expected <= value <= expected * 1.25, (q, value))
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.total, 0.5005)
+
+    def test_histogram_handles_tiny_and_huge_latencies(self):
+        """ Test latencies outside the bucket range are clamped """
+        histogram = ocelog.metrics.Histogram()
+        histogram.record(0.0)
+        histogram.record(10.0 ** 9)
+        self.assertEqual(histogram.quantile(0.5), 0.000001)
+        self.assertTrue(histogram.quantile(1.0) > 10.0 ** 5)
+
+    def test_empty_histogram_quantile_is_zero(self):
+        """ Test an empty histogram reports zero """
+        self.assertEqual(ocelog.metrics.Histogram().quantile(0.99), 0.0)
+
+    def test_histogram_merge_adds_counts(self):
+        """ Test merging histograms adds their buckets and totals """
+        first = ocelog.metrics.Histogram()
+        second = ocelog.metrics.Histogram()
+        first.record(0.001)
+        second.record(0.001)
+        second.record(0.1)
+        first.merge(second)
+        self.assertEqual(first.count, 3)
+        self.assertTrue(0.1 <= first.quantile(1.0) <= 0.125)
+
+    #--------------------------------------------------------------------------
+    # per-thread recording
+    #--------------------------------------------------------------------------
+    def test_collect_merges_every_thread(self):
+        """ Test counters and histograms from many threads are merged """
+        labels = (("stage", "write"),)
+        def work():
+            for i in range(100):
+                ocelog.metrics.record("latency", labels, 0.001)
+                ocelog.metrics.count("requests", labels)
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        histograms, counters = ocelog.metrics.collect()
+        self.assertEqual(histograms[("latency", labels)].count, 400)
+        self.assertEqual(counters[("requests", labels)], 400)
+
+    def test_exited_threads_are_retired(self):
+        """ Test a thread's stats are folded away once it exits """
+        labels = (("stage", "write"),)
+        ocelog.metrics.count("requests", labels)
+        thread_stats = []
+        def work():
+            ocelog.metrics.record("latency", labels, 0.001)
+            ocelog.metrics.count("requests", labels)
+            thread_stats.append(ocelog.metrics._thread_stats())
+        for i in range(50):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        # a thread's local storage is dropped just after join() returns
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            live = ocelog.metrics._all_stats.values()
+            if not [stats for stats in thread_stats if stats in live]:
+                break
+            time.sleep(0.01)
+        self.assertFalse([stats for stats in thread_stats if stats in live])
+        histograms, counters = ocelog.metrics.collect()
+        self.assertEqual(histograms[("latency", labels)].count, 50)
+        self.assertEqual(counters[("requests", labels)], 51)
+        ocelog.metrics.reset()
+        self.assertEqual(ocelog.metrics.collect(), ({}, {}))
+
+    def test_request_timer_records_stages_and_status(self):
+        """ Test RequestTimer records each stage and the final status """
+        timer = ocelog.metrics.RequestTimer("/log")
+        timer.stage("parse")
+        timer.stage("write")
+        timer.finish(201)
+        histograms, counters = ocelog.metrics.collect()
+        for stage in ("parse", "write"):
+            key = ("ocelog_stage_latency_seconds", (("route", "/log"), ("stage", stage)))
+            self.assertEqual(histograms[key].count, 1)
+        key = ("ocelog_responses_total", (("route", "/log"), ("code", "201")))
+        self.assertEqual(counters[key], 1)
+
+    #--------------------------------------------------------------------------
+    # render_prometheus
+    #--------------------------------------------------------------------------
+    def test_render_prometheus_exposes_quantiles_and_counters(self):
+        """ Test the text format holds p50/p99/p999, sums, counts, counters """
+        timer = ocelog.metrics.RequestTimer("/log")
+        timer.stage("write")
+        timer.finish(400)
+        text = ocelog.metrics.render_prometheus()
+        self.assertTrue("# TYPE ocelog_stage_latency_seconds summary\n" in text)
+        for q in ("0.5", "0.99", "0.999"):
+            self.assertTrue('ocelog_stage_latency_seconds{route="/log",stage="write",quantile="%s"} ' % q in text)
+        self.assertTrue('ocelog_stage_latency_seconds_count{route="/log",stage="write"} 1\n' in text)
+        self.assertTrue('ocelog_request_latency_seconds_count{route="/log",code="400"} 1\n' in text)
+        self.assertTrue("# TYPE ocelog_responses_total counter\n" in text)
+        self.assertTrue('ocelog_responses_total{route="/log",code="400"} 1\n' in text)
+
+
+if __name__=="__main__":
+
+    unittest.main()
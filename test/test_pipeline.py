@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import sys
+import time
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+import ocelog.pipeline
+import ocelog.writer
+import ocelog_mock
+
+
+class TestPipeline(unittest.TestCase):
+    """ Test the ocelog.pipeline module
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        self.pipelines = []
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        for opipeline in self.pipelines:
+            opipeline.close()
+
+    def make_pipeline(self, writers, timeout=1.0, max_depth=100):
+        """ Start a pipeline over (name, writer, required) tuples """
+        lanes = [ocelog.pipeline._Lane(name, writer, required, max_depth=max_depth)
+                for name, writer, required in writers]
+        opipeline = ocelog.pipeline.Pipeline(lanes, timeout=timeout)
+        opipeline.start()
+        self.pipelines.append(opipeline)
+        return opipeline
+
+    #--------------------------------------------------------------------------
+    # Ticket
+    #--------------------------------------------------------------------------
+    def test_ticket_succeeds_once_every_required_writer_succeeds(self):
+        """ Test a ticket waits for a result from each required writer """
+        ticket = ocelog.pipeline.Ticket(2)
+        ticket.result(True)
+        self.assertFalse(ticket.wait(0))
+        ticket.result(True)
+        self.assertTrue(ticket.wait(0))
+
+    def test_ticket_fails_on_the_first_failure(self):
+        """ Test one failed required writer settles the ticket """
+        ticket = ocelog.pipeline.Ticket(2)
+        ticket.result(False)
+        self.assertFalse(ticket.wait(1.0))
+
+    def test_ticket_without_required_writers_succeeds_immediately(self):
+        """ Test a ticket for best-effort writers only is already settled """
+        self.assertTrue(ocelog.pipeline.Ticket(0).wait(0))
+
+    #--------------------------------------------------------------------------
+    # write
+    #--------------------------------------------------------------------------
+    def test_write_delivers_to_every_writer(self):
+        """ Test each writer receives the message """
+        first = ocelog_mock.MockRecordingWriter()
+        second = ocelog_mock.MockBatchWriter()
+        opipeline = self.make_pipeline((("first", first, True),
+                ("second", second, True)))
+        message = ocelog_mock.MockMessage()
+        self.assertTrue(opipeline.write(message))
+        self.assertEqual(first.messages, [message])
+        self.assertEqual(second.messages, [message])
+
+    def test_write_fails_when_a_required_writer_fails(self):
+        """ Test a required failure fails the write """
+        opipeline = self.make_pipeline((
+                ("good", ocelog_mock.MockRecordingWriter(), True),
+                ("bad", ocelog_mock.MockRecordingWriter(write_success=False), True)))
+        self.assertFalse(opipeline.write(ocelog_mock.MockMessage()))
+
+    def test_write_ignores_best_effort_failures(self):
+        """ Test a failing best-effort writer doesn't fail the write """
+        opipeline = self.make_pipeline((
+                ("good", ocelog_mock.MockRecordingWriter(), True),
+                ("bad", ocelog_mock.MockRecordingWriter(write_success=False), False)))
+        self.assertTrue(opipeline.write(ocelog_mock.MockMessage()))
+
+    def test_slow_best_effort_writer_does_not_delay_the_write(self):
+        """ Test the result doesn't wait for a slow best-effort writer """
+        slow = ocelog_mock.MockRecordingWriter(delay=0.5)
+        opipeline = self.make_pipeline((
+                ("fast", ocelog_mock.MockRecordingWriter(), True),
+                ("slow", slow, False)))
+        started = time.time()
+        self.assertTrue(opipeline.write(ocelog_mock.MockMessage()))
+        self.assertTrue(time.time() - started < 0.25)
+        opipeline.close()
+        self.assertEqual(len(slow.messages), 1)
+
+    def test_slow_required_writer_fails_after_timeout(self):
+        """ Test a required writer that misses the timeout fails the write """
+        opipeline = self.make_pipeline((
+                ("slow", ocelog_mock.MockRecordingWriter(delay=0.5), True),),
+                timeout=0.05)
+        self.assertFalse(opipeline.write(ocelog_mock.MockMessage()))
+
+    def test_full_required_queue_fails_the_write(self):
+        """ Test a message refused by a required lane fails at once """
+        lane = ocelog.pipeline._Lane("unstarted", ocelog_mock.MockRecordingWriter(),
+                True, max_depth=1)
+        opipeline = ocelog.pipeline.Pipeline([lane], timeout=0.05)
+        opipeline.dispatch(ocelog_mock.MockMessage())
+        self.assertFalse(opipeline.dispatch(ocelog_mock.MockMessage()).wait(0))
+
+    def test_write_batch_returns_a_result_per_message(self):
+        """ Test write_batch() combines the results of each message """
+        writer = ocelog_mock.MockBatchWriter()
+        opipeline = self.make_pipeline((("batch", writer, True),))
+        messages = [ocelog_mock.MockMessage(msg="event %d" % i) for i in range(5)]
+        self.assertEqual(opipeline.write_batch(messages), [True] * 5)
+        self.assertEqual(writer.messages, messages)
+
+    def test_registered_writers_can_be_enabled(self):
+        """ Test a writer added with register() is accepted and built """
+        writer = ocelog_mock.MockRecordingWriter()
+        valid_writers = ocelog.config._WritersConfig.valid_writers
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        oconfig = ocelog.config.Config()
+        self.assertRaises(ocelog.config.ConfigException, setattr,
+                oconfig.writers, "enabled", "syslog,recording")
+        ocelog.pipeline.register("recording", lambda config: writer)
+        try:
+            oconfig.writers.enabled = "syslog,recording"
+            oconfig.writers.required = "recording"
+            owriter = ocelog.pipeline.default_writer(oconfig.snapshot())
+            self.pipelines.append(owriter)
+            self.assertTrue(owriter.write(ocelog_mock.MockMessage()))
+            self.assertEqual(len(writer.messages), 1)
+        finally:
+            del ocelog.pipeline.writer_factories["recording"]
+            ocelog.config._WritersConfig.valid_writers = valid_writers
+            ocelog.pipeline._default_pipeline = None
+            oc._initialized = False
+
+    #--------------------------------------------------------------------------
+    # default_writer
+    #--------------------------------------------------------------------------
+    def test_default_writer_is_the_syslog_writer_by_default(self):
+        """ Test the default configuration skips the pipeline """
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        oconfig = ocelog.config.Config().snapshot()
+        owriter = ocelog.pipeline.default_writer(oconfig)
+        self.assertTrue(owriter is ocelog.writer.SocketSyslogWriter())
+        oc._initialized = False
+
+    def test_default_writer_builds_a_pipeline_for_best_effort_syslog(self):
+        """ Test a best-effort syslog writer is written through a pipeline """
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        oconfig = ocelog.config.Config()
+        oconfig.writers.required = ""
+        try:
+            owriter = ocelog.pipeline.default_writer(oconfig.snapshot())
+            self.pipelines.append(owriter)
+            self.assertTrue(isinstance(owriter, ocelog.pipeline.Pipeline))
+            self.assertEqual([lane.name for lane in owriter.lanes], ["syslog"])
+            self.assertEqual(owriter.required, 0)
+            self.assertTrue(owriter.write(ocelog_mock.MockMessage()))
+        finally:
+            ocelog.pipeline._default_pipeline = None
+            oc._initialized = False
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
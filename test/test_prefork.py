@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+import unittest
+import errno
+import httplib
+import os
+import os.path
+import signal
+import socket
+import sys
+import time
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+import ocelog.prefork
+
+
+def pid_app(environ, start_response):
+    """ A wsgi application answering with the pid of the worker """
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [str(os.getpid())]
+
+def free_port():
+    """ Return a port nothing is listening on """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestPreforkServer(unittest.TestCase):
+    """ Test the ocelog.prefork module against a real supervisor process
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        self.port = free_port()
+        self.supervisor = None
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        if self.supervisor is not None:
+            try:
+                # a graceful stop takes the workers down with the supervisor
+                os.kill(self.supervisor, signal.SIGTERM)
+                os.waitpid(self.supervisor, 0)
+            except OSError:
+                pass
+
+    def start(self, workers=2, reuse_port=True):
+        """ Fork a supervisor running a PreforkServer and wait for it """
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server = ocelog.prefork.PreforkServer(pid_app, "127.0.0.1",
+                        self.port, workers, reuse_port=reuse_port)
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        self.supervisor = pid
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            try:
+                return self.get()
+            except socket.error:
+                time.sleep(0.02)
+        self.fail("the prefork server didn't start")
+
+    def get(self):
+        """ Return the pid of the worker that answered a request """
+        connection = httplib.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        try:
+            connection.request("GET", "/")
+            return int(connection.getresponse().read())
+        finally:
+            connection.close()
+
+    def worker_pids(self, requests=200):
+        """ Return the set of workers that answered requests """
+        return set(self.get() for i in range(requests))
+
+    #--------------------------------------------------------------------------
+    # serving
+    #--------------------------------------------------------------------------
+    def test_shared_files_names_the_spool_and_file_writer(self):
+        """ Test the settings that workers can't share are reported """
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        oconfig = ocelog.config.Config()
+        self.assertEqual(ocelog.prefork.shared_files(oconfig), [])
+        oconfig.spool.enabled = True
+        oconfig.writers.enabled = "syslog,file"
+        self.assertEqual(ocelog.prefork.shared_files(oconfig),
+                ["spool.enabled", "the file writer"])
+        oconfig.writers.enabled = "remote"
+        self.assertEqual(ocelog.prefork.shared_files(oconfig), [])
+        oconfig._initialized = False
+
+    def test_requests_are_spread_over_the_workers(self):
+        """ Test every worker of a shared socket answers requests """
+        self.start(workers=3, reuse_port=False)
+        self.assertEqual(len(self.worker_pids()), 3)
+
+    def test_workers_bind_their_own_sockets_with_reuse_port(self):
+        """ Test the workers serve with SO_REUSEPORT when it's available """
+        if not ocelog.prefork.reuse_port_supported():
+            return
+        self.start(workers=2, reuse_port=True)
+        self.assertTrue(len(self.worker_pids()) >= 1)
+
+    #--------------------------------------------------------------------------
+    # supervision
+    #--------------------------------------------------------------------------
+    def test_dead_workers_are_respawned(self):
+        """ Test a killed worker is replaced """
+        worker = self.start(workers=1, reuse_port=False)
+        os.kill(worker, signal.SIGKILL)
+        deadline = time.time() + 5
+        replacement = worker
+        while replacement == worker and time.time() < deadline:
+            try:
+                replacement = self.get()
+            except socket.error:
+                time.sleep(0.02)
+        self.assertNotEqual(replacement, worker)
+
+    def test_sigterm_stops_the_supervisor_and_workers(self):
+        """ Test SIGTERM shuts everything down and frees the port """
+        worker = self.start(workers=2, reuse_port=False)
+        os.kill(self.supervisor, signal.SIGTERM)
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            pid, status = os.waitpid(self.supervisor, os.WNOHANG)
+            if pid:
+                break
+            time.sleep(0.02)
+        self.assertEqual(pid, self.supervisor)
+        self.supervisor = None
+        self.assertRaises(OSError, os.kill, worker, 0)
+        self.assertRaises(socket.error, self.get)
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
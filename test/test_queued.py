@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import sys
+import threading
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.queued
+import ocelog_mock
+
+
+class TestQueuedWriter(unittest.TestCase):
+    """ Test the ocelog.queued module
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+
+    #--------------------------------------------------------------------------
+    # write
+    #--------------------------------------------------------------------------
+    def test_write_accepts_messages_without_waiting_for_the_writer(self):
+        """ Test write() returns before the wrapped writer is called """
+        writer = ocelog_mock.MockRecordingWriter()
+        owriter = ocelog.queued.QueuedWriter(writer)
+        self.assertTrue(owriter.write(ocelog_mock.MockMessage()))
+        self.assertEqual(owriter.depth(), 1)
+        self.assertEqual(len(writer.messages), 0)
+
+    def test_write_refuses_messages_when_queue_is_full(self):
+        """ Test write() returns False once max_depth is reached """
+        writer = ocelog_mock.MockRecordingWriter()
+        owriter = ocelog.queued.QueuedWriter(writer, max_depth=2)
+        self.assertTrue(owriter.write(ocelog_mock.MockMessage()))
+        self.assertTrue(owriter.write(ocelog_mock.MockMessage()))
+        self.assertFalse(owriter.write(ocelog_mock.MockMessage()))
+
+    def test_write_refuses_messages_after_close(self):
+        """ Test write() returns False once the writer is closed """
+        owriter = ocelog.queued.QueuedWriter(ocelog_mock.MockRecordingWriter())
+        owriter.start()
+        owriter.close()
+        self.assertFalse(owriter.write(ocelog_mock.MockMessage()))
+
+    def test_write_batch_returns_a_result_per_message(self):
+        """ Test write_batch() queues each message until the queue is full """
+        owriter = ocelog.queued.QueuedWriter(ocelog_mock.MockRecordingWriter(), 
+                max_depth=2)
+        messages = [ocelog_mock.MockMessage() for i in range(3)]
+        self.assertEqual(owriter.write_batch(messages), [True, True, False])
+
+    #--------------------------------------------------------------------------
+    # draining
+    #--------------------------------------------------------------------------
+    def test_workers_write_queued_messages_in_order(self):
+        """ Test a single worker writes every message in arrival order """
+        writer = ocelog_mock.MockRecordingWriter()
+        owriter = ocelog.queued.QueuedWriter(writer, flush_interval=0)
+        owriter.start()
+        for i in range(50):
+            owriter.write(ocelog_mock.MockMessage(msg="event %d" % i))
+        owriter.flush()
+        self.assertEqual([m.msg for m in writer.messages], 
+                ["event %d" % i for i in range(50)])
+        self.assertEqual(owriter.written, 50)
+        owriter.close()
+
+    def test_workers_use_write_batch_when_available(self):
+        """ Test queued messages are handed over in batches of batch_size """
+        writer = ocelog_mock.MockBatchWriter()
+        owriter = ocelog.queued.QueuedWriter(writer, batch_size=10)
+        for i in range(25):
+            owriter.write(ocelog_mock.MockMessage())
+        owriter.start()
+        owriter.flush()
+        self.assertEqual([len(b) for b in writer.batches], [10, 10, 5])
+        owriter.close()
+
+    def test_failed_writes_are_counted(self):
+        """ Test writes refused by the wrapped writer are counted as failed """
+        writer = ocelog_mock.MockRecordingWriter(write_success=False)
+        owriter = ocelog.queued.QueuedWriter(writer, flush_interval=0)
+        owriter.start()
+        owriter.write(ocelog_mock.MockMessage())
+        owriter.flush()
+        self.assertEqual(owriter.written, 0)
+        self.assertEqual(owriter.failed, 1)
+        owriter.close()
+
+    def test_close_writes_the_backlog(self):
+        """ Test close() writes everything queued before stopping """
+        writer = ocelog_mock.MockRecordingWriter(delay=0.001)
+        owriter = ocelog.queued.QueuedWriter(writer, workers=3)
+        owriter.start()
+        for i in range(30):
+            owriter.write(ocelog_mock.MockMessage())
+        owriter.close()
+        self.assertEqual(len(writer.messages), 30)
+        self.assertEqual(owriter.depth(), 0)
+
+    def test_messages_accepted_while_closing_are_written(self):
+        """ Test no write racing close() is accepted and then dropped """
+        for attempt in range(20):
+            writer = ocelog_mock.MockRecordingWriter()
+            owriter = ocelog.queued.QueuedWriter(writer, workers=2)
+            owriter.start()
+            accepted = []
+            def produce():
+                while owriter.write(ocelog_mock.MockMessage()):
+                    accepted.append(True)
+            threads = [threading.Thread(target=produce) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            owriter.close()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(writer.messages), len(accepted))
+
+
+if __name__=="__main__":
+
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import sys
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+import ocelog.metrics
+import ocelog.ratelimit
+
+
+class TestRateLimiter(unittest.TestCase):
+    """ Test the ocelog.ratelimit token bucket table
+
+    """
+
+    #--------------------------------------------------------------------------
+    # take
+    #--------------------------------------------------------------------------
+    def test_burst_is_allowed_then_limited(self):
+        """ Test a new key may take burst tokens and is then refused """
+        limiter = ocelog.ratelimit.RateLimiter()
+        for i in range(3):
+            self.assertEqual(limiter.take("app1", 1.0, 3, now=100.0), 0)
+        self.assertEqual(limiter.take("app1", 1.0, 3, now=100.0), 1.0)
+
+    def test_tokens_refill_at_rate(self):
+        """ Test the wait shrinks and tokens return as time passes """
+        limiter = ocelog.ratelimit.RateLimiter()
+        limiter.take("app1", 2.0, 1, now=100.0)
+        self.assertEqual(limiter.take("app1", 2.0, 1, now=100.25), 0.25)
+        self.assertEqual(limiter.take("app1", 2.0, 1, now=100.5), 0)
+
+    def test_refill_is_capped_at_burst(self):
+        """ Test an idle key doesn't save up more than burst tokens """
+        limiter = ocelog.ratelimit.RateLimiter()
+        limiter.take("app1", 1.0, 2, now=100.0)
+        for i in range(2):
+            self.assertEqual(limiter.take("app1", 1.0, 2, now=1000.0), 0)
+        self.assertTrue(limiter.take("app1", 1.0, 2, now=1000.0) > 0)
+
+    def test_keys_are_limited_independently(self):
+        """ Test one key running out doesn't affect another """
+        limiter = ocelog.ratelimit.RateLimiter()
+        limiter.take("app1", 1.0, 1, now=100.0)
+        self.assertTrue(limiter.take("app1", 1.0, 1, now=100.0) > 0)
+        self.assertEqual(limiter.take("app2", 1.0, 1, now=100.0), 0)
+
+    def test_table_evicts_the_least_recently_used_keys(self):
+        """ Test the table stays within table_size and keeps the busy keys """
+        limiter = ocelog.ratelimit.RateLimiter(table_size=4, stripes=1)
+        limiter.take("app0", 1.0, 1, now=100.0)
+        for i in range(1, 6):
+            limiter.take("app0", 1.0, 1, now=100.0)
+            limiter.take("app%d" % i, 1.0, 1, now=100.0)
+        self.assertEqual(len(limiter), 4)
+        # app0 was used throughout, so it is still limited
+        self.assertTrue(limiter.take("app0", 1.0, 1, now=100.0) > 0)
+        # app1 was evicted and starts again with a full bucket
+        self.assertEqual(limiter.take("app1", 1.0, 1, now=100.0), 0)
+
+
+class TestCheck(unittest.TestCase):
+    """ Test ocelog.ratelimit.check() against the configured limits
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py) and the limiter
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        self.oconfig = ocelog.config.Config()
+        self.oconfig.ratelimit.rate = 1
+        self.oconfig.ratelimit.burst = 2
+        ocelog.ratelimit._default_limiter = None
+        ocelog.metrics.reset()
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        ocelog.ratelimit._default_limiter = None
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+
+    def allowed(self, kind, key, attempts=10):
+        """ Return how many of attempts back to back checks were allowed """
+        return [ocelog.ratelimit.check(kind, key, self.oconfig)
+                for i in range(attempts)].count(0)
+
+    #--------------------------------------------------------------------------
+    # check
+    #--------------------------------------------------------------------------
+    def test_default_limit_applies_to_unlisted_keys(self):
+        """ Test ratelimit.burst messages get through for any key """
+        self.assertEqual(self.allowed("appname", "app1"), 2)
+        self.assertEqual(self.allowed("client", "10.0.0.1"), 2)
+
+    def test_per_key_limits_override_the_default(self):
+        """ Test a listed appname or client gets its own limit """
+        self.oconfig.ratelimit.appname_limits = "app1=1/5"
+        self.oconfig.ratelimit.client_limits = "10.0.0.1=1/1"
+        self.assertEqual(self.allowed("appname", "app1"), 5)
+        self.assertEqual(self.allowed("client", "10.0.0.1"), 1)
+        self.assertEqual(self.allowed("appname", "10.0.0.1"), 2)
+
+    def test_limited_checks_are_counted(self):
+        """ Test each refusal is counted by key type """
+        self.allowed("appname", "app1", 5)
+        histograms, counters = ocelog.metrics.collect()
+        self.assertEqual(counters[("ocelog_ratelimited_total",
+                (("key", "appname"),))], 3)
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
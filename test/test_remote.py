@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import re
+import socket
+import sys
+import time
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+import ocelog.remote
+import ocelog_mock
+
+
+def unused_address():
+    """ Return a loopback address with nothing listening on it """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    address = sock.getsockname()
+    sock.close()
+    return address
+
+
+class TestRemoteSyslogWriter(unittest.TestCase):
+    """ Test the RemoteSyslogWriter against local stand-in relays
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py) and the writer pools
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        self.listeners = []
+        self.owriter = ocelog.remote.RemoteSyslogWriter()
+        self.owriter.reload(ocelog.config.Config())
+        self.owriter.close()
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        self.owriter.close()
+        for listener in self.listeners:
+            listener.close()
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+
+    def listen(self, protocol):
+        """ Start a stand-in relay, closed again at teardown """
+        if protocol == "tcp":
+            listener = ocelog_mock.MockTcpListener()
+        else:
+            listener = ocelog_mock.MockUdpListener()
+        self.listeners.append(listener)
+        return listener
+
+    def configure(self, protocol, relays, format="rfc5424"):
+        """ Point the writer at relays """
+        self.owriter.config.remote.protocol = protocol
+        self.owriter.config.remote.format = format
+        self.owriter.config.remote.relays = relays
+
+    #--------------------------------------------------------------------------
+    # initialization behavior
+    #--------------------------------------------------------------------------
+    def test_remote_syslog_writer_is_singleton(self):
+        """ Confirm singleton behavior is enforced for RemoteSyslogWriter """
+        self.assertEqual(self.owriter, ocelog.remote.RemoteSyslogWriter())
+
+    #--------------------------------------------------------------------------
+    # format
+    #--------------------------------------------------------------------------
+    def test_format_returns_rfc5424_record(self):
+        """ Test the default record has a version, utc timestamp and nil fields """
+        message = ocelog_mock.MockMessage(hostname="webhost1", appname="app1",
+                msg="the cache was flushed", facility="local3", priority="err")
+        record = self.owriter.format(message, 1287426896.25)
+        self.assertEqual(record, "<155>1 2010-10-18T18:34:56.250000Z webhost1 "
+                "app1 - - - the cache was flushed")
+
+    def test_format_rfc5424_header_fields_are_printable(self):
+        """ Test spaces are replaced and the appname is truncated to 48 """
+        message = ocelog_mock.MockMessage(hostname="web host", appname="a" * 60)
+        fields = self.owriter.format(message).split(" ")
+        self.assertEqual(fields[2], "web_host")
+        self.assertEqual(fields[3], "a" * 48)
+
+    def test_format_returns_rfc3164_record(self):
+        """ Test the rfc3164 format matches the local syslog record """
+        self.owriter.config.remote.format = "rfc3164"
+        message = ocelog_mock.MockMessage(hostname="webhost1", appname="app1",
+                msg="the cache was flushed", facility="local3", priority="err")
+        record = self.owriter.format(message)
+        self.assertTrue(re.match(r"^<155>[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2} "
+                "webhost1 app1: the cache was flushed$", record))
+
+    #--------------------------------------------------------------------------
+    # write
+    #--------------------------------------------------------------------------
+    def test_write_sends_one_datagram_per_record_over_udp(self):
+        """ Test udp records are sent unframed """
+        listener = self.listen("udp")
+        self.configure("udp", [listener.address])
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="over udp")))
+        self.assertTrue(listener.recv().endswith(" - - - over udp"))
+
+    def test_write_batch_frames_records_over_one_tcp_connection(self):
+        """ Test tcp records are octet counted and share a connection """
+        listener = self.listen("tcp")
+        self.configure("tcp", [listener.address])
+        messages = [ocelog_mock.MockMessage(msg="event %d" % i) for i in range(3)]
+        self.assertEqual(self.owriter.write_batch(messages), [True] * 3)
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="event 3")))
+        records = listener.wait_for(4)
+        self.assertEqual([record.split(" - - - ")[1] for record in records],
+                ["event %d" % i for i in range(4)])
+        self.assertEqual(listener.connections, 1)
+
+    def test_write_batch_reports_unformattable_messages(self):
+        """ Test a bad message fails alone without failing the batch """
+        listener = self.listen("udp")
+        self.configure("udp", [listener.address])
+        messages = [ocelog_mock.MockMessage(), ocelog_mock.MockMessage(facility="invalid")]
+        self.assertEqual(self.owriter.write_batch(messages), [True, False])
+
+    def test_write_fails_without_relays(self):
+        """ Test a write returns False when no relay is configured """
+        self.assertFalse(self.owriter.write(ocelog_mock.MockMessage()))
+
+    #--------------------------------------------------------------------------
+    # failover
+    #--------------------------------------------------------------------------
+    def test_write_fails_over_to_the_next_relay(self):
+        """ Test an unreachable relay is skipped for the next one """
+        listener = self.listen("tcp")
+        self.configure("tcp", [unused_address(), listener.address])
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="failed over")))
+        self.assertTrue(listener.wait_for(1)[0].endswith("failed over"))
+
+    def test_failed_relay_is_skipped_until_retry_interval(self):
+        """ Test a relay marked down isn't tried again right away """
+        down = unused_address()
+        listener = self.listen("tcp")
+        self.configure("tcp", [down, listener.address])
+        self.owriter.write(ocelog_mock.MockMessage())
+        self.assertTrue(down in self.owriter._down_until)
+        self.owriter.config.remote.retry_interval = 0
+        self.owriter.write(ocelog_mock.MockMessage())
+        self.assertEqual(len(listener.wait_for(2)), 2)
+
+    def test_write_reconnects_when_a_pooled_connection_was_closed(self):
+        """ Test a relay restart doesn't mark the relay down """
+        listener = self.listen("tcp")
+        self.configure("tcp", [listener.address])
+        self.owriter.write(ocelog_mock.MockMessage(msg="first"))
+        listener.wait_for(1)
+        for idle in self.owriter._pools.values():
+            for sock in idle:
+                sock.shutdown(socket.SHUT_RDWR)
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="second")))
+        self.assertTrue(listener.wait_for(2)[-1].endswith("second"))
+        self.assertEqual(self.owriter._down_until, {})
+
+    def test_write_drops_a_pooled_connection_the_relay_closed(self):
+        """ Test a record isn't lost on a connection the relay closed """
+        listener = self.listen("tcp")
+        self.configure("tcp", [listener.address])
+        self.owriter.write(ocelog_mock.MockMessage(msg="first"))
+        listener.wait_for(1)
+        listener.disconnect()
+        time.sleep(0.05)
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="second")))
+        self.assertTrue(listener.wait_for(2)[-1].endswith("second"))
+        self.assertEqual(listener.connections, 2)
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
@@ -85,6 +85,47 @@ class TestRequestParsers(unittest.TestCase):
         self.assertEqual(self.omessage.msg, msg)
 
 
+    #--------------------------------------------------------------------------
+    # parse_batch_request
+    #--------------------------------------------------------------------------
+    def test_batch_parser_returns_one_message_per_line(self):
+        """ Test the batch parser returns a Message for each record in order """
+        body = "appname=app1&msg=first+event\nappname=app2&msg=second%20event&facility=local1\n"
+        request = ocelog_mock.MockBottleRequest()
+        messages = ocelog.message.parse_batch_request(request, body)
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(messages[0].appname, "app1")
+        self.assertEqual(messages[0].msg, "first event")
+        self.assertEqual(messages[0].facility, "user")
+        self.assertEqual(messages[1].appname, "app2")
+        self.assertEqual(messages[1].msg, "second event")
+        self.assertEqual(messages[1].facility, "local1")
+
+    def test_batch_parser_uses_client_address_as_default_hostname(self):
+        """ Test records without a hostname get the client address """
+        body = "appname=app1&msg=event\nhostname=web4&appname=app1&msg=event"
+        request = ocelog_mock.MockBottleRequest(remote_addr="10.9.8.7")
+        messages = ocelog.message.parse_batch_request(request, body)
+        self.assertEqual(messages[0].hostname, "10.9.8.7")
+        self.assertEqual(messages[1].hostname, "web4")
+
+    def test_batch_parser_skips_blank_lines(self):
+        """ Test blank lines in the body do not become records """
+        body = "\nappname=app1&msg=event\r\n\n   \n"
+        request = ocelog_mock.MockBottleRequest()
+        messages = ocelog.message.parse_batch_request(request, body)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].valid, True)
+
+    def test_batch_parser_validates_each_record(self):
+        """ Test an invalid record does not affect the others """
+        body = "appname=app1&msg=event&priority=loud\nappname=app1&msg=event"
+        request = ocelog_mock.MockBottleRequest()
+        messages = ocelog.message.parse_batch_request(request, body)
+        self.assertEqual(messages[0].valid, False)
+        self.assertEqual(messages[0].error_msg, "Message included invalid priority")
+        self.assertEqual(messages[1].valid, True)
+
 
 
 
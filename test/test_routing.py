@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import StringIO
+import sys
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.bottle
+import ocelog.routing
+
+
+def handler(name):
+    """ Return a handler answering with its name and arguments """
+    def answer(**kargs):
+        return "%s %s" % (name, sorted(kargs.items()))
+    answer.__name__ = name
+    return answer
+
+
+class TestRouting(unittest.TestCase):
+    """ Test the ocelog.routing module
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        self.routes = (
+            ("/", "GET"), ("/log", "GET"), ("/log", "POST"),
+            ("/log/batch", "POST"), ("/item/:id", "GET"),
+            ("/item/:id", "DELETE"), ("/item/:id#[0-9]+#/raw", "GET"),
+            ("/item/new", "GET"), ("/user/:name/item/:id", "PUT"),
+            ("/any/:rest#.*#", "GET"), ("/any/:first", "GET"),
+            )
+        self.router = ocelog.routing.Router()
+        self.bottle = ocelog.bottle.Bottle()
+        for route, method in self.routes:
+            name = "%s %s" % (method, route)
+            self.router.add(route, handler(name), method=method)
+            self.bottle.add_route(route, handler(name), method=method)
+
+    def name(self, found):
+        """ Return the name of a matched handler and its arguments """
+        handler, args = found
+        if handler is None:
+            return None
+        return handler(**args)
+
+    #--------------------------------------------------------------------------
+    # Router
+    #--------------------------------------------------------------------------
+    def test_router_matches_as_bottle_does(self):
+        """ Test static, parameterized, HEAD and missing routes match bottle """
+        for url in ("/", "", "/log", " /log ", "//log", "/log/batch",
+                "/item/7", "/item/new", "/item/7/raw", "/item/x/raw",
+                "/user/bob/item/3", "/any/a/b/c", "/any/a", "/nope",
+                "/item/"):
+            for method in ("GET", "HEAD", "POST", "PUT", "DELETE"):
+                self.assertEqual(self.name(self.router.match(url, method)),
+                        self.name(self.bottle.match_url(url, method)),
+                        (method, url))
+
+    def test_router_passes_parameters(self):
+        """ Test parameters are passed by their route names """
+        handler, args = self.router.match("/user/bob/item/3", "PUT")
+        self.assertEqual(args, {'name': "bob", 'id': "3"})
+        handler, args = self.router.match("/any/a/b", "GET")
+        self.assertEqual(args, {'rest': "a/b"})
+
+    def test_router_combines_hundreds_of_routes(self):
+        """ Test routes past the 99 group limit are split across expressions """
+        router = ocelog.routing.Router()
+        for i in range(300):
+            router.add("/r%d/:a/:b" % i, handler("r%d" % i))
+        static, combined = router.compile()
+        self.assertTrue(len(combined['GET']) > 3)
+        for i in (0, 32, 33, 150, 299):
+            handler_, args = router.match("/r%d/x/y" % i)
+            self.assertEqual(handler_.__name__, "r%d" % i)
+            self.assertEqual(args, {'a': "x", 'b': "y"})
+        self.assertEqual(router.match("/r300/x/y"), (None, None))
+
+    def test_routes_added_later_are_compiled(self):
+        """ Test adding a route after matching recompiles the router """
+        self.assertEqual(self.router.match("/later"), (None, None))
+        self.router.add("/later", handler("later"))
+        self.assertEqual(self.name(self.router.match("/later")), "later []")
+
+    def test_allowed_lists_the_methods_of_a_path(self):
+        """ Test allowed() lists every method with a route for the path """
+        self.assertEqual(self.router.allowed("/log"), ["GET", "HEAD", "POST"])
+        self.assertEqual(self.router.allowed("/log/batch"), ["POST"])
+        self.assertEqual(self.router.allowed("/item/7"),
+                ["DELETE", "GET", "HEAD"])
+        self.assertEqual(self.router.allowed("/user/bob/item/3"), ["PUT"])
+        self.assertEqual(self.router.allowed("/nope"), [])
+
+    #--------------------------------------------------------------------------
+    # RoutedBottle
+    #--------------------------------------------------------------------------
+    def call(self, application, method, path):
+        """ Send a request and return the status, headers and body """
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': path,
+                'wsgi.errors': StringIO.StringIO()}
+        started = []
+        def start_response(status, headers, exc_info=None):
+            started.append((status, headers))
+        body = "".join(application(environ, start_response))
+        return started[0][0], dict(started[0][1]), body
+
+    def test_routed_bottle_answers_405_with_allow(self):
+        """ Test a known path with another method gets a 405 """
+        application = ocelog.routing.RoutedBottle()
+        for route, method in self.routes:
+            application.add_route(route, handler(route), method=method)
+        status, headers, body = self.call(application, "GET", "/item/7")
+        self.assertEqual((status, body), ("200 OK", "/item/:id [('id', '7')]"))
+        status, headers, body = self.call(application, "PATCH", "/item/7")
+        self.assertEqual(status, "405 METHOD NOT ALLOWED")
+        self.assertEqual(headers['Allow'], "DELETE, GET, HEAD")
+        status, headers, body = self.call(application, "GET", "/nope")
+        self.assertEqual(status, "404 NOT FOUND")
+
+    def test_routed_bottle_not_allowed_handler(self):
+        """ Test the 405 handler can be replaced """
+        application = ocelog.routing.RoutedBottle()
+        application.add_route("/log", handler("log"), method="POST")
+        @application.not_allowed()
+        def refuse(allowed):
+            ocelog.bottle.response.status = 405
+            return "use %s" % " or ".join(allowed)
+        status, headers, body = self.call(application, "GET", "/log")
+        self.assertEqual((status, body), ("405 METHOD NOT ALLOWED", "use POST"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+test_file_path = os.path.dirname(os.path.abspath(__file__))
+ocelog_path = os.path.normpath(os.path.join(test_file_path, "../"))
+sys.path.append(ocelog_path)
+
+import ocelog.config
+import ocelog.spool
+import ocelog.writer
+import ocelog_mock
+
+
+class TestSpool(unittest.TestCase):
+    """ Test the ocelog.spool.Spool segment files
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        self.directory = tempfile.mkdtemp(prefix="ocelog-test-")
+        self.spools = []
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        for ospool in self.spools:
+            ospool.close()
+        shutil.rmtree(self.directory)
+
+    def open_spool(self, **kwds):
+        """ Open a spool in the test directory, closed again at teardown """
+        ospool = ocelog.spool.Spool(self.directory, **kwds)
+        self.spools.append(ospool)
+        return ospool
+
+    def drain(self, ospool):
+        """ Consume and return every pending record """
+        records = []
+        while True:
+            record = ospool.peek()
+            if record is None:
+                return records
+            ospool.consume()
+            records.append(record)
+
+    def segment_files(self):
+        """ Return the names of the segment files in the test directory """
+        return sorted(name for name in os.listdir(self.directory)
+                if name.endswith(".seg"))
+
+    #--------------------------------------------------------------------------
+    # append / peek / consume
+    #--------------------------------------------------------------------------
+    def test_records_are_read_in_append_order(self):
+        """ Test records come back oldest first, once each """
+        ospool = self.open_spool()
+        self.assertFalse(ospool.pending())
+        for i in range(5):
+            self.assertTrue(ospool.append("record %d" % i))
+        self.assertTrue(ospool.pending())
+        self.assertEqual(ospool.peek(), "record 0")
+        self.assertEqual(ospool.peek(), "record 0")
+        self.assertEqual(self.drain(ospool), ["record %d" % i for i in range(5)])
+        self.assertFalse(ospool.pending())
+
+    def test_segments_roll_over_and_are_removed_when_consumed(self):
+        """ Test a full segment starts another and is deleted once read """
+        ospool = self.open_spool(segment_size=65536)
+        record = "x" * 1000
+        for i in range(100):
+            self.assertTrue(ospool.append(record))
+        self.assertEqual(len(self.segment_files()), 2)
+        self.assertEqual(self.drain(ospool), [record] * 100)
+        self.assertEqual(len(self.segment_files()), 1)
+
+    def test_append_refuses_records_when_spool_is_full(self):
+        """ Test append() returns False once max_segments are full """
+        ospool = self.open_spool(segment_size=65536, max_segments=2)
+        record = "x" * 1000
+        results = [ospool.append(record) for i in range(200)]
+        self.assertTrue(results[0])
+        self.assertFalse(results[-1])
+        self.assertEqual(len(self.segment_files()), 2)
+
+    def test_append_refuses_records_larger_than_a_segment(self):
+        """ Test a record that can't fit in one segment is refused """
+        ospool = self.open_spool(segment_size=65536)
+        self.assertFalse(ospool.append("x" * 65536))
+
+    def test_unknown_fsync_policy_raises_exception(self):
+        """ Test the fsync policy is validated """
+        self.assertRaises(ocelog.spool.SpoolException, ocelog.spool.Spool,
+                self.directory, fsync="sometimes")
+
+    #--------------------------------------------------------------------------
+    # recovery
+    #--------------------------------------------------------------------------
+    def test_unconsumed_records_survive_reopening(self):
+        """ Test a reopened spool resumes after the last consumed record """
+        ospool = ocelog.spool.Spool(self.directory, fsync="always")
+        for i in range(4):
+            ospool.append("record %d" % i)
+        ospool.peek()
+        ospool.consume()
+        ospool.close()
+        ospool = self.open_spool()
+        self.assertEqual(self.drain(ospool), ["record 1", "record 2", "record 3"])
+        self.assertTrue(ospool.append("record 4"))
+        self.assertEqual(self.drain(ospool), ["record 4"])
+
+    def test_torn_record_is_dropped_on_recovery(self):
+        """ Test a record with a bad checksum marks the end of the data """
+        ospool = ocelog.spool.Spool(self.directory, fsync="always")
+        ospool.append("complete")
+        ospool.append("torn")
+        ospool.close()
+        path = os.path.join(self.directory, self.segment_files()[0])
+        segment = open(path, "r+b")
+        segment.seek(len("complete") + 8 * 2)
+        segment.write("X")
+        segment.close()
+        ospool = self.open_spool()
+        self.assertEqual(self.drain(ospool), ["complete"])
+        ospool.append("after")
+        self.assertEqual(self.drain(ospool), ["after"])
+
+
+class TestSpoolingWriter(unittest.TestCase):
+    """ Test the ocelog.spool.SpoolingWriter against a local syslog socket
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py) and the writer socket
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        self.directory = tempfile.mkdtemp(prefix="ocelog-test-")
+        self.listener = ocelog_mock.MockSyslogSocket()
+        self.sink = ocelog.writer.SocketSyslogWriter()
+        self.sink.reload(ocelog.config.Config())
+        self.sink.close()
+        self.sink.config.syslog.enabled = True
+        self.sink.config.syslog.socket_path = self.listener.path
+        self.ospool = ocelog.spool.Spool(self.directory)
+        self.owriter = ocelog.spool.SpoolingWriter(self.sink, self.ospool,
+                retry_interval=0.05)
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        self.owriter.close()
+        self.sink.close()
+        self.listener.close()
+        shutil.rmtree(self.directory)
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+
+    def wait_for_replay(self, timeout=2.0):
+        """ Wait until the replay thread has emptied the spool """
+        deadline = time.time() + timeout
+        while self.ospool.pending() and time.time() < deadline:
+            time.sleep(0.01)
+
+    #--------------------------------------------------------------------------
+    # write
+    #--------------------------------------------------------------------------
+    def test_write_sends_directly_when_syslog_is_available(self):
+        """ Test nothing is spooled while syslog accepts records """
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="direct")))
+        self.assertFalse(self.ospool.pending())
+        self.assertTrue(self.listener.recv().endswith("direct"))
+
+    def test_write_spools_when_syslog_is_unavailable(self):
+        """ Test a failed send is spooled and still reported as written """
+        self.sink.config.syslog.socket_path = "/nonexistent/ocelog/log"
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="spooled")))
+        self.assertTrue(self.ospool.pending())
+        self.assertTrue(self.ospool.peek().endswith("spooled"))
+
+    def test_write_spools_behind_pending_records(self):
+        """ Test new records queue behind spooled ones to keep their order """
+        self.ospool.append("<14>older record")
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="newer")))
+        self.assertEqual(self.ospool.peek(), "<14>older record")
+
+    def test_write_batch_returns_a_result_per_message(self):
+        """ Test write_batch() spools each record and reports bad messages """
+        self.sink.config.syslog.socket_path = "/nonexistent/ocelog/log"
+        messages = [ocelog_mock.MockMessage(), ocelog_mock.MockMessage(facility="invalid")]
+        self.assertEqual(self.owriter.write_batch(messages), [True, False])
+
+    def test_write_succeeds_without_spooling_when_disabled(self):
+        """ Test a disabled syslog writer still succeeds without a spool """
+        self.sink.config.syslog.enabled = False
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage()))
+        self.assertFalse(self.ospool.pending())
+
+    #--------------------------------------------------------------------------
+    # replay
+    #--------------------------------------------------------------------------
+    def test_spooled_records_are_replayed_in_order_after_recovery(self):
+        """ Test the replay thread delivers the backlog once syslog is back """
+        self.sink.config.syslog.socket_path = "/nonexistent/ocelog/log"
+        for i in range(3):
+            self.owriter.write(ocelog_mock.MockMessage(msg="event %d" % i))
+        self.owriter.start()
+        self.sink.config.syslog.socket_path = self.listener.path
+        self.wait_for_replay()
+        self.assertFalse(self.ospool.pending())
+        for i in range(3):
+            self.assertTrue(self.listener.recv().endswith("event %d" % i))
+
+
+
+if __name__=="__main__":
+
+    unittest.main()
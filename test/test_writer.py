@@ -2,6 +2,7 @@
 
 import unittest
 import os.path
+import re
 import sys
 
 test_file_path = os.path.dirname(os.path.abspath(__file__))
@@ -58,6 +59,132 @@ class TestWriter(unittest.TestCase):
     # Should it be mocked and that part better tested?
 
 
+class TestSocketSyslogWriter(unittest.TestCase):
+    """ Test the SocketSyslogWriter against a local stand-in socket
+
+    """
+
+    #--------------------------------------------------------------------------
+    # setup / teardown / utilities
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        """ Perform common setup actions """
+        unittest.TestCase.setUp(self)
+        # reset the config singleton (see test_config.py) and the writer socket
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+        self.listener = ocelog_mock.MockSyslogSocket()
+        self.owriter = ocelog.writer.SocketSyslogWriter()
+        self.owriter.reload(ocelog.config.Config())
+        self.owriter.close()
+        self.owriter.config.syslog.enabled = True
+        self.owriter.config.syslog.socket_path = self.listener.path
+
+    def tearDown(self):
+        """ Perform common teardown actions """
+        unittest.TestCase.tearDown(self)
+        self.owriter.close()
+        self.listener.close()
+        oc = ocelog.config.Config()
+        oc._initialized = False
+        del oc
+
+    #--------------------------------------------------------------------------
+    # initialization behavior
+    #--------------------------------------------------------------------------
+    def test_socket_syslog_writer_is_singleton(self):
+        """ Confirm singleton behavior is enforced for SocketSyslogWriter """
+        owriter2 = ocelog.writer.SocketSyslogWriter()
+        self.assertEqual(self.owriter, owriter2)
+
+    def test_config_is_bound_once(self):
+        """ Test constructing the writer again doesn't swap its config """
+        config = self.owriter.config
+        ocelog.writer.SocketSyslogWriter(ocelog.config.Config().snapshot())
+        self.assertTrue(self.owriter.config is config)
+        previous = ocelog.config.current()
+        try:
+            snapshot = ocelog.config.publish(ocelog.config.Config().snapshot())
+            self.owriter.reload()
+            self.assertTrue(self.owriter.config is snapshot)
+        finally:
+            ocelog.config.publish(previous)
+
+    #--------------------------------------------------------------------------
+    # format
+    #--------------------------------------------------------------------------
+    def test_format_returns_rfc3164_record(self):
+        """ Test the record has a PRI, timestamp, and hostname appname ident """
+        message = ocelog_mock.MockMessage(hostname="webhost1", appname="app1",
+                msg="the cache was flushed", facility="local3", priority="err")
+        record = self.owriter.format(message)
+        # local3 (19) * 8 + err (3) = 155
+        self.assertTrue(record.startswith("<155>"))
+        self.assertTrue(record.endswith(" webhost1 app1: the cache was flushed"))
+        timestamp = record[len("<155>"):len("<155>") + 15]
+        self.assertTrue(re.match(r"^[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2}$", timestamp))
+
+    def test_format_covers_facilities_missing_from_syslog_module(self):
+        """ Test authpriv and ftp are formatted even if syslog lacks them """
+        message = ocelog_mock.MockMessage(facility="authpriv", priority="info")
+        self.assertTrue(self.owriter.format(message).startswith("<86>"))
+        message = ocelog_mock.MockMessage(facility="ftp", priority="debug")
+        self.assertTrue(self.owriter.format(message).startswith("<95>"))
+
+    #--------------------------------------------------------------------------
+    # write
+    #--------------------------------------------------------------------------
+    def test_socket_syslog_writer_will_return_success_when_disabled(self):
+        """ Test that a disabled writer succeeds without sending anything """
+        self.owriter.config.syslog.enabled = False
+        message = ocelog_mock.MockMessage()
+        self.assertTrue(self.owriter.write(message))
+        self.assertEqual(self.owriter._sock, None)
+
+    def test_write_sends_record_to_socket(self):
+        """ Test a write delivers one datagram to the syslog socket """
+        message = ocelog_mock.MockMessage(msg="the client has disconnected")
+        self.assertTrue(self.owriter.write(message))
+        record = self.listener.recv()
+        self.assertTrue(record.endswith("1.2.3.4 mockapp: the client has disconnected"))
+
+    def test_write_reuses_the_connection(self):
+        """ Test consecutive writes share a single socket """
+        self.owriter.write(ocelog_mock.MockMessage(msg="first"))
+        sock = self.owriter._sock
+        self.owriter.write(ocelog_mock.MockMessage(msg="second"))
+        self.assertTrue(sock is self.owriter._sock)
+        self.assertTrue(self.listener.recv().endswith("first"))
+        self.assertTrue(self.listener.recv().endswith("second"))
+
+    def test_write_reconnects_after_syslog_restarts(self):
+        """ Test the writer reconnects when the syslog socket is recreated """
+        self.owriter.write(ocelog_mock.MockMessage(msg="before"))
+        self.listener.close()
+        self.listener = ocelog_mock.MockSyslogSocket()
+        self.owriter.config.syslog.socket_path = self.listener.path
+        self.assertTrue(self.owriter.write(ocelog_mock.MockMessage(msg="after")))
+        self.assertTrue(self.listener.recv().endswith("after"))
+
+    def test_write_batch_sends_one_record_per_message(self):
+        """ Test write_batch delivers each message and returns each result """
+        messages = [ocelog_mock.MockMessage(msg="event %d" % i) for i in range(3)]
+        self.assertEqual(self.owriter.write_batch(messages), [True] * 3)
+        for i in range(3):
+            self.assertTrue(self.listener.recv().endswith("event %d" % i))
+
+    def test_write_batch_reports_unformattable_messages(self):
+        """ Test a bad message fails alone without failing the batch """
+        messages = [ocelog_mock.MockMessage(), ocelog_mock.MockMessage(facility="invalid")]
+        self.assertEqual(self.owriter.write_batch(messages), [True, False])
+
+    def test_write_fails_when_socket_is_unavailable(self):
+        """ Test a write returns False when there is no syslog socket """
+        self.owriter.config.syslog.socket_path = "/nonexistent/ocelog/log"
+        self.assertFalse(self.owriter.write(ocelog_mock.MockMessage()))
+
+
 
 if __name__=="__main__":
 
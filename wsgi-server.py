@@ -23,6 +23,7 @@ limitations under the License.
 
 import sys
 import os.path
+import signal
 
 import ocelog.wsgi
 
@@ -30,7 +31,7 @@ import ocelog.wsgi
 if __name__=="__main__":
 
     # simple arg handling
-    valid_servers = ("dev", "eventlet", "cherrypy")
+    valid_servers = ("dev", "eventlet", "cherrypy", "prefork", "event")
     server_type = "dev"
     if len(sys.argv) == 2:
         if sys.argv[1] in valid_servers:
@@ -41,29 +42,93 @@ if __name__=="__main__":
     oconfig = ocelog.config.Config(config_file="doc/config_defaults.conf")
     #oconfig = ocelog.config.Config()
 
+    # exit normally on SIGTERM so atexit handlers (queue flush) get to run
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # reload the config file on SIGHUP, and on changes if watch_interval is set
+    def start_reloading(reread=False):
+        # the watcher's baseline mtime is taken before the file is re-read,
+        # so an edit made in between is still picked up
+        watcher = ocelog.config.ConfigWatcher("doc/config_defaults.conf", 
+                oconfig.server.watch_interval)
+        if reread:
+            try:
+                oconfig.reload()
+            except ocelog.config.ConfigException, e:
+                sys.stderr.write("ocelog: configuration reload failed: %s\n" % e)
+        ocelog.config.install_reload_handler()
+        if oconfig.server.watch_interval > 0:
+            watcher.interval = oconfig.server.watch_interval
+            watcher.start()
+
+    # prefork workers each start their own watcher after the fork.  The
+    # supervisor never reloads, so a worker re-reads the file as it starts:
+    # one respawned after a reload would otherwise run the stale settings
+    # it inherited
+    if server_type != "prefork":
+        start_reloading()
+
+    # the bottle application, or the same routes served without bottle
+    if oconfig.server.application == "lean":
+        import ocelog.lean
+        ocelog_app = ocelog.lean.application
+    else:
+        ocelog_app = ocelog.wsgi.application
+
 
     if server_type == "eventlet":
         import eventlet
         from eventlet import wsgi
-        ocelog_app = ocelog.wsgi.application
         wsgi.server(eventlet.listen(
             (oconfig.server.host, oconfig.server.port)), 
             ocelog_app)
 
     elif server_type == "cherrypy":
         from ocelog import bottle
-        ocelog_app = ocelog.wsgi.application
         bottle.run(reloader=False, server=bottle.CherryPyServer,
                 host=oconfig.server.host, port=oconfig.server.port,
                 app=ocelog_app)
 
     elif server_type == "gevent":
         import gevent.wsgi
-        ocelog_app = ocelog.wsgi.application
         gapp = gevent.wsgi.WSGIServer((oconfig.server.host, 
-            oconfig.server.port), ocelog.wsgi.application)
+            oconfig.server.port), ocelog_app)
         gapp.serve_forever()
 
+    elif server_type == "prefork":
+        #-------------------------------------------------------------------------
+        # server.workers processes, each bound to the port with SO_REUSEPORT
+        # (or sharing one socket if server.reuse_port is off or unsupported)
+        #-------------------------------------------------------------------------
+        import ocelog.prefork
+        shared = ocelog.prefork.shared_files(oconfig)
+        if shared and oconfig.server.workers > 1:
+            sys.exit("ocelog: %s can't be used with more than one prefork "
+                    "worker" % " or ".join(shared))
+        ocelog.config.publish(oconfig.snapshot())
+        server = ocelog.prefork.PreforkServer(ocelog_app,
+                oconfig.server.host, oconfig.server.port,
+                oconfig.server.workers, reuse_port=oconfig.server.reuse_port,
+                post_fork=lambda: start_reloading(reread=True))
+        server.serve_forever()
+
+    elif server_type == "event":
+        #-------------------------------------------------------------------------
+        # an event loop http/1.1 keep-alive server without dependencies, 
+        # running the handlers on server.threads threads
+        #-------------------------------------------------------------------------
+        import ocelog.eventserver
+        ocelog.config.publish(oconfig.snapshot())
+        server = ocelog.eventserver.EventServer(ocelog_app,
+                oconfig.server.host, oconfig.server.port,
+                max_body=max(oconfig.message.max_request_size,
+                        oconfig.message.max_batch_size),
+                max_connections=oconfig.server.max_connections,
+                max_buffered=oconfig.server.max_buffered,
+                threads=oconfig.server.threads)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+        server.serve_forever()
+
     elif server_type == "dev":
         #-------------------------------------------------------------------------
         # simple server good for development and running the functional tests
@@ -75,10 +140,11 @@ if __name__=="__main__":
         # enable these items to run test/functional/test_log_token.py
         # oconfig.security.shared_secret = "beanbags"
         # oconfig.security.require_token = True
+        # publish the configuration snapshot used by the request handlers
+        ocelog.config.publish(oconfig.snapshot())
 
         from ocelog import bottle
-        ocelog_app = ocelog.wsgi.application
         bottle.run(reloader=False, 
                 host=oconfig.server.host, port=oconfig.server.port,
-                app=ocelog.wsgi.application)
+                app=ocelog_app)
 